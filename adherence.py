@@ -0,0 +1,237 @@
+"""Medication adherence: prescribed doses against the doses logged in MedicationLog.
+
+Each prescription line becomes a course. Its doses per day come from the
+frequency ("1-0-1", "BD", "twice daily", "every 8 hours") and it runs from the
+consultation day for its duration ("5 days", "2 weeks"). A line without a
+duration runs until the patient's next prescription, which is what the
+dashboard shows as the current prescription. Prescribing a medicine again ends
+its earlier course. Lines taken as needed (SOS, PRN) or less often than daily
+have no daily schedule; only the doses taken are reported for them.
+
+Courses and logged doses are laid out on a (medicine, day) grid with NumPy:
+one comparison against the day range marks every course's active days,
+np.add.at sums them per medicine and np.bincount counts the logged doses. A
+day's doses count up to that day's expected doses, so extra doses on one day
+do not make up for a missed day. Each (patient, medicine) pair is one row of
+the grid, so any number of patients is computed in the same few array
+operations; record_adherence.py does this nightly for every patient.
+
+Logged names are matched to prescribed ones ignoring case and punctuation,
+then by first word ("Amoxicillin 500mg" matches "amoxicillin"). Logged
+medicines that match no course are listed as unscheduled.
+"""
+import re
+import json
+import functools
+import datetime
+
+import numpy as np
+
+ADHERENCE_WINDOW_DAYS = 30
+ADHERENCE_LOOKBACK_DAYS = 90 # Courses prescribed up to this long before the window may still be running
+
+_AS_NEEDED_RE = re.compile(r"\b(sos|prn|as needed|as required|when required|if needed|if required)\b")
+_NOT_DAILY_RE = re.compile(r"\b(weekly|monthly|alternate|every other|(?:a|per|every) (?:week|month))\b")
+_DOSE_PATTERN_RE = re.compile(r"(?<![\w./])(?:\d+(?:\.\d+)?|½|1/2)(?:\s*-\s*(?:\d+(?:\.\d+)?|½|1/2)){1,5}(?![\w./])")
+_TIMES_RE = re.compile(r"\b(one|two|three|four|five|six|\d)\s*(?:times|x)\b")
+_EVERY_HOURS_RE = re.compile(r"\b(?:every|q)\s*(\d+)\s*(?:hours?|hrs?|h)\b")
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_KEYWORD_RATES = ( # Checked in order; the first match wins
+    (re.compile(r"\b(qid|qds|four times)\b"), 4),
+    (re.compile(r"\b(tds|tid|thrice|three times)\b"), 3),
+    (re.compile(r"\b(bd|bid|twice)\b"), 2),
+)
+_TIME_OF_DAY_RE = re.compile(r"\b(morning|noon|afternoon|evening|night|bedtime)\b")
+_ONCE_RE = re.compile(r"\b(od|qd|once|daily|hs)\b")
+_DURATION_RE = re.compile(r"(\d+)\s*(days?|d|weeks?|wks?|w|months?|mo?)?\b")
+_DURATION_UNIT_DAYS = {"d": 1, "w": 7, "m": 30}
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def doses_per_day(frequency):
+    """Scheduled doses per day for a frequency text, or None for as-needed, less than daily or unreadable."""
+    text = str(frequency or "").casefold()
+    if not text.strip() or _AS_NEEDED_RE.search(text) or _NOT_DAILY_RE.search(text):
+        return None
+    pattern = _DOSE_PATTERN_RE.search(text)
+    if pattern: # Morning-noon-night notation: each non-zero slot is one dose
+        return sum(1 for part in pattern.group(0).split("-") if part.strip() not in ("0", "0.0")) or None
+    times = _TIMES_RE.search(text)
+    if times:
+        return _NUMBER_WORDS.get(times.group(1)) or int(times.group(1))
+    every = _EVERY_HOURS_RE.search(text)
+    if every:
+        hours = int(every.group(1))
+        return 24 // hours if hours and 24 % hours == 0 else None
+    for pattern, rate in _KEYWORD_RATES:
+        if pattern.search(text):
+            return rate
+    slots = {"night" if slot == "bedtime" else slot for slot in _TIME_OF_DAY_RE.findall(text)}
+    if slots: # "morning and night"
+        return len(slots)
+    return 1 if _ONCE_RE.search(text) else None
+
+
+def course_days(duration):
+    """Length of a course in days for a duration text ("5 days", "2 weeks", "1 month"), or None if open-ended."""
+    match = _DURATION_RE.search(str(duration or "").casefold())
+    if not match or int(match.group(1)) == 0:
+        return None
+    unit = (match.group(2) or "d")[0]
+    return int(match.group(1)) * _DURATION_UNIT_DAYS[unit]
+
+
+@functools.lru_cache(maxsize=4096)
+def medicine_key(name):
+    """Medicine name folded for matching: lower case, words only."""
+    return " ".join(_WORD_RE.findall(str(name or "").casefold()))
+
+
+def lookback_start(today, days=ADHERENCE_WINDOW_DAYS):
+    """Earliest consultation date whose prescriptions can still be running in the window ending today."""
+    return datetime.datetime.combine(today - datetime.timedelta(days=days + ADHERENCE_LOOKBACK_DAYS), datetime.time())
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def prescription_courses(consultations):
+    """Courses (medicine name, start date, end date or None, doses per day or None) for one patient.
+
+    consultations: rows with consultation_date and prescription_details (JSON
+    text), in any order. end is exclusive; None means still running.
+    """
+    prescribed = []
+    for row in consultations:
+        try:
+            lines = json.loads(row["prescription_details"] or "[]")
+        except (TypeError, ValueError):
+            continue
+        if isinstance(lines, list) and lines:
+            prescribed.append((_as_date(row["consultation_date"]), lines))
+    prescribed.sort(key=lambda item: item[0])
+    courses = []
+    for index, (start, lines) in enumerate(prescribed):
+        # An open-ended line is replaced by the next prescription, as on the dashboard
+        next_start = next((later for later, _ in prescribed[index + 1:] if later > start), None)
+        for med in lines:
+            if not isinstance(med, dict):
+                continue
+            name = str(med.get("medicine_name", med.get("medicine")) or "").strip()
+            if not name:
+                continue
+            days = course_days(med.get("duration"))
+            end = start + datetime.timedelta(days=days) if days else next_start
+            courses.append((name, start, end, doses_per_day(med.get("frequency"))))
+    return courses
+
+
+def dose_grid(course_series, course_start, course_end, course_rate, log_series, log_day, series_count, days):
+    """Returns (expected, taken): doses per series and day, arrays of shape (series_count, days).
+
+    Courses are parallel arrays: series row, first day and end day (exclusive;
+    either may fall outside 0..days) and doses per day. A later course of the
+    same series ends the one before it. Logged doses are parallel arrays of
+    series row and day, all inside the grid.
+    """
+    order = np.lexsort((course_start, course_series))
+    series, start, end = course_series[order], course_start[order], course_end[order].copy()
+    same_series = series[1:] == series[:-1]
+    end[:-1] = np.where(same_series, np.minimum(end[:-1], start[1:]), end[:-1])
+    day = np.arange(days)
+    active = (day >= start[:, None]) & (day < end[:, None])
+    expected = np.zeros((series_count, days))
+    np.add.at(expected, series, active * course_rate[order][:, None])
+    taken = np.bincount(log_series * days + log_day, minlength=series_count * days).reshape(series_count, days)
+    return expected, taken.astype(float)
+
+
+def compute_adherence(courses_by_patient, logs, today, days=ADHERENCE_WINDOW_DAYS):
+    """Adherence per patient over the `days` full days before today, plus today so far.
+
+    courses_by_patient: {patient_id: prescription_courses(...)}
+    logs: (patient_id, medication_name, taken_at) for doses taken in the window or today.
+    Returns {patient_id: summary}; patients with nothing prescribed or logged are left out.
+    """
+    window_start = today - datetime.timedelta(days=days)
+    series = {} # (patient_id, medicine key) -> row
+    names, patients = [], []
+    first_words = {} # (patient_id, first word of key) -> row
+    course_rows = []
+
+    def add_series(patient_id, key, name):
+        series[(patient_id, key)] = len(names)
+        first_words.setdefault((patient_id, key.split(" ")[0]), len(names))
+        names.append(name)
+        patients.append(patient_id)
+
+    for patient_id, courses in courses_by_patient.items():
+        # Newest course first, so each medicine is shown under its latest prescribed name
+        for name, start, end, rate in sorted(courses, key=lambda course: course[1], reverse=True):
+            key = medicine_key(name)
+            if not key:
+                continue
+            if (patient_id, key) not in series:
+                add_series(patient_id, key, name)
+            course_rows.append((series[(patient_id, key)], (start - window_start).days,
+                                (end - window_start).days if end else days + 1, rate or 0))
+
+    logs = list(logs)
+    taken_on = np.array([taken_at for _, _, taken_at in logs], dtype="datetime64[D]")
+    log_days = (taken_on - np.datetime64(window_start, "D")).astype(np.int64).tolist()
+    log_rows = []
+    for (patient_id, name, _), day in zip(logs, log_days):
+        key = medicine_key(name)
+        if not key or not 0 <= day <= days:
+            continue
+        row = series.get((patient_id, key), first_words.get((patient_id, key.split(" ")[0])))
+        if row is None:
+            add_series(patient_id, key, name)
+            row = series[(patient_id, key)]
+        log_rows.append((row, day))
+    if not names:
+        return {}
+
+    courses = np.array(course_rows, dtype=np.int64).reshape(-1, 4)
+    logged = np.array(log_rows, dtype=np.int64).reshape(-1, 2)
+    expected, taken = dose_grid(courses[:, 0], courses[:, 1], courses[:, 2], courses[:, 3],
+                                logged[:, 0], logged[:, 1], len(names), days + 1)
+    on_schedule = np.minimum(taken, expected)
+    past = slice(0, days) # The last column is today, which is not over yet
+    expected_total = expected[:, past].sum(axis=1)
+    on_schedule_total = on_schedule[:, past].sum(axis=1)
+    taken_total = taken[:, past].sum(axis=1)
+    missed_days = ((expected[:, past] > 0) & (on_schedule[:, past] < expected[:, past])).sum(axis=1)
+    percent = np.divide(100 * on_schedule_total, expected_total,
+                        out=np.full(len(names), np.nan), where=expected_total > 0)
+
+    patient_ids = list(dict.fromkeys(patients))
+    position = {patient_id: index for index, patient_id in enumerate(patient_ids)}
+    patient_row = np.array([position[patient_id] for patient_id in patients])
+    patient_expected = np.bincount(patient_row, weights=expected_total, minlength=len(patient_ids))
+    patient_on_schedule = np.bincount(patient_row, weights=on_schedule_total, minlength=len(patient_ids))
+
+    results = {}
+    for index, patient_id in enumerate(patient_ids):
+        results[patient_id] = {
+            "since": window_start, "days": days,
+            "expected": int(patient_expected[index]), "on_schedule": int(patient_on_schedule[index]),
+            "adherence_pct": round(float(100 * patient_on_schedule[index] / patient_expected[index]), 1)
+                             if patient_expected[index] else None,
+            "medicines": [],
+        }
+    for row, name in enumerate(names):
+        if not expected[row].any() and not taken[row].any(): # A course that ended before the window
+            continue
+        results[patients[row]]["medicines"].append({
+            "name": name,
+            "scheduled": bool(expected[row].any()),
+            "expected": int(expected_total[row]), "on_schedule": int(on_schedule_total[row]),
+            "taken": int(taken_total[row]), "missed_days": int(missed_days[row]),
+            "adherence_pct": None if np.isnan(percent[row]) else round(float(percent[row]), 1),
+            "today_expected": int(expected[row, days]), "today_taken": int(taken[row, days]),
+        })
+    for summary in results.values():
+        summary["medicines"].sort(key=lambda med: (not med["scheduled"], med["name"].casefold()))
+    return results
@@ -0,0 +1,75 @@
+"""Per-consultation state for incremental ADR checks.
+
+The consultation page polls /check_adr with only the transcript text added
+since the last poll. An AdrSession remembers, for one (user, session key):
+how much of the transcript has been analyzed, a short tail of it (so a drug
+name split across two polls is still seen), which drugs have already been
+alerted, and names whose validation was still pending at the last deadline.
+"""
+import time
+import threading
+
+ADR_OVERLAP_CHARS = 80
+
+
+class AdrSession:
+    def __init__(self):
+        self.processed_offset = 0 # Characters of the full transcript already analyzed
+        self.tail = "" # Last ADR_OVERLAP_CHARS of analyzed text, re-scanned with the next delta
+        self.alerted = set() # Keys (generic / normalized names) already returned as alerts
+        self.pending_names = set() # Names to re-validate on the next poll
+        self.last_used = time.time()
+        self.lock = threading.Lock() # Held for the duration of a check
+
+    def window(self, offset, delta):
+        """Returns (text to analyze, new processed offset) or None if delta leaves a gap.
+
+        Text before processed_offset that the client resent is dropped, so the
+        window is always the stored tail plus genuinely new text.
+        """
+        if offset > self.processed_offset:
+            return None
+        new_text = delta[self.processed_offset - offset:]
+        return self.tail + new_text, self.processed_offset + len(new_text)
+
+    def advance(self, window_text, processed_offset, overlap=ADR_OVERLAP_CHARS):
+        self.processed_offset = processed_offset
+        tail = window_text[-overlap:]
+        if len(window_text) > overlap and " " in tail:
+            tail = tail[tail.index(" ") + 1:] # Start on a word boundary so a cut-off word is not matched
+        self.tail = tail
+
+
+class AdrSessionStore:
+    """Thread-safe (user_id, session_key) -> AdrSession map with idle expiry."""
+
+    def __init__(self, ttl=7200, max_sessions=5000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, session_key):
+        """Returns the session, creating it (and pruning idle ones) if needed."""
+        now = time.time()
+        key = (user_id, session_key)
+        with self._lock:
+            adr_session = self._sessions.get(key)
+            if adr_session is None or now - adr_session.last_used > self.ttl:
+                if len(self._sessions) >= self.max_sessions:
+                    self._prune(now)
+                adr_session = self._sessions[key] = AdrSession()
+            adr_session.last_used = now
+            return adr_session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _prune(self, now):
+        expired = [key for key, s in self._sessions.items() if now - s.last_used > self.ttl]
+        for key in expired:
+            del self._sessions[key]
+        if len(self._sessions) >= self.max_sessions: # Still full: drop the least recently used
+            oldest = sorted(self._sessions, key=lambda k: self._sessions[k].last_used)
+            for key in oldest[:len(self._sessions) - self.max_sessions + 1]:
+                del self._sessions[key]
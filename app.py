@@ -2,33 +2,66 @@ import os
 import io
 import datetime
 import time # Ensure time is imported
-import re # Import regex for parsing
 import json # Import json for handling prescription data
 import logging
+import atexit
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from functools import wraps # Import wraps for decorators
 
 from dotenv import load_dotenv
 from flask import ( # Organize imports
     Flask, request, jsonify, render_template, send_file, 
-    redirect, url_for, flash, session, abort 
+    redirect, url_for, flash, session, abort, Response, stream_with_context
 )
 from flask_sock import Sock # Added for WebSockets
 # Import WebSocket exceptions
 from websockets.exceptions import ConnectionClosedOK, ConnectionClosedError
 from werkzeug.security import generate_password_hash, check_password_hash # For password hashing
+from werkzeug.utils import secure_filename
 
 import mysql.connector
+from mysql.connector import pooling
 from google.cloud import speech
 import google.generativeai as genai # Updated import for Gemini API
 # Import Google API core exceptions
 import google.api_core.exceptions
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos # Import XPos and YPos for modern API
 import requests # Add requests import
 
+from job_queue import JobQueue, JobQueueFull, JobQueueUnavailable, JOB_QUEUED, TERMINAL_STATES as JOB_TERMINAL_STATES
+from gemini_client import GeminiClient, GeminiBusyError, GeminiUnavailableError, PRIORITY_SUMMARY, PRIORITY_ADR
+from openfda import DrugLabelCache, query_drug_label
+from health_monitor import HealthMonitor
+from drug_matcher import DrugMatcher, fallback_sentences, normalize_term
+from adr_state import AdrSessionStore
+from fuzzy_drug_index import FuzzyDrugIndex
+from pdf_cache import PdfCache, pdf_version
+from consultation_pdf import PDF_LAYOUT_VERSION, render_consultation_pdf
+from pdf_export import iter_zip, map_as_completed
+from history_pdf import render_patient_history_pdf
+from vitals_as_of import vitals_as_of
+from adherence import compute_adherence, lookback_start, prescription_courses
+from consultation_search import build_search_query, drug_names, snippet
+from archive import ArchiveWatermarks, ARCHIVED_TABLES
+from db_rows import row_class
+from prepared_statements import PreparedStatements
+from transcript_store import INSERT_TRANSCRIPT_QUERY, TRANSCRIPT_QUERY, transcript_params, decode_transcript_row
+from pdf_render_pool import PdfRenderPool, PdfRenderPoolFull, PdfRenderTimeout
+from consultation_draft import (
+    DRAFT_RESPONSE_SCHEMA, StreamingDraftDecoder,
+    build_summary_prompt, decode_draft, new_empty_draft,
+    build_chunk_prompt, build_merge_prompt, estimate_tokens, merge_drafts, split_transcript
+)
+
 # Load environment variables from .env file
 load_dotenv()
 
+# PDF rendering runs in spawned worker processes, which re-import this file as
+# __mp_main__ when the app is started with `python app.py`; the drug dictionary,
+# Google clients, executors and background services are not set up there (under
+# gunicorn/flask run the workers never import this file)
+IS_PDF_WORKER = __name__ == '__mp_main__'
+
 # --- Configuration ---
 google_credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
 gcp_project_id = os.getenv('GCP_PROJECT_ID')
@@ -46,6 +79,52 @@ STREAMING_RATE = 48000 # Keep 48kHz based on browser reality
 OPENFDA_API_KEY = os.getenv("OPENFDA_API_KEY")
 if not OPENFDA_API_KEY:
     logging.warning("OPENFDA_API_KEY not found in .env file. ADR validation will be skipped.")
+# Override to point at a local stand-in (see fake_services.py) for offline load testing
+OPENFDA_BASE_URL = os.getenv("OPENFDA_BASE_URL", "https://api.fda.gov").rstrip('/')
+OPENFDA_LABEL_URL = f"{OPENFDA_BASE_URL}/drug/label.json"
+# Label existence rarely changes, so results are cached per normalized drug name
+# (404s for less time) and persisted across restarts
+drug_label_cache = DrugLabelCache(
+    path=os.getenv('OPENFDA_CACHE_PATH', 'instance/openfda_label_cache.json') or None,
+    positive_ttl=int(os.getenv('OPENFDA_CACHE_TTL', '86400')),
+    negative_ttl=int(os.getenv('OPENFDA_CACHE_NEGATIVE_TTL', '3600'))
+)
+if not IS_PDF_WORKER:
+    atexit.register(drug_label_cache.save)
+# Uncached names are validated concurrently; a poll waits at most ADR_CHECK_DEADLINE_SECONDS
+# and returns partial results, while slower lookups finish in the background into the cache
+openfda_executor = None if IS_PDF_WORKER else ThreadPoolExecutor(max_workers=int(os.getenv('OPENFDA_MAX_WORKERS', '8')), thread_name_prefix='openfda')
+ADR_CHECK_DEADLINE_SECONDS = float(os.getenv('ADR_CHECK_DEADLINE_SECONDS', '6'))
+# Offline drug dictionary (build with build_drug_dictionary.py): names found in it need no
+# Gemini call or OpenFDA validation; Gemini only sees medicine-like sentences it misses
+DRUG_DICTIONARY_PATH = os.getenv('DRUG_DICTIONARY_PATH', 'instance/drug_dictionary.json')
+drug_matcher = None
+fuzzy_drug_index = None
+if IS_PDF_WORKER:
+    pass
+elif os.path.exists(DRUG_DICTIONARY_PATH):
+    drug_matcher = DrugMatcher.from_file(DRUG_DICTIONARY_PATH)
+    # Fuzzy index over the same dictionary for STT-garbled names ("lipator" -> Lipitor)
+    fuzzy_drug_index = FuzzyDrugIndex(drug_matcher.terms)
+else:
+    logging.warning(f"Drug dictionary not found at {DRUG_DICTIONARY_PATH}; ADR checks will use Gemini for every poll.")
+
+# Rendered consultation PDFs, keyed by consultation id + a hash of the data drawn in them
+pdf_cache = PdfCache(os.getenv('PDF_CACHE_DIR', 'instance/pdf_cache'))
+# fpdf2 layout is CPU-bound and holds the GIL, so renders run in worker processes;
+# downloads beyond workers + max_pending outstanding renders get a 503
+pdf_render_pool = PdfRenderPool(
+    workers=int(os.getenv('PDF_RENDER_WORKERS', '2')),
+    max_pending=int(os.getenv('PDF_RENDER_MAX_PENDING', '16')),
+    timeout=float(os.getenv('PDF_RENDER_TIMEOUT', '30'))
+)
+if not IS_PDF_WORKER:
+    atexit.register(pdf_render_pool.shutdown)
+PDF_HISTORY_TIMEOUT = float(os.getenv('PDF_HISTORY_TIMEOUT', '120')) # Whole-history documents can run to hundreds of pages
+# A consultation shows the latest vitals recorded before it, if taken within this window (same visit)
+VITALS_MAX_AGE = datetime.timedelta(hours=float(os.getenv('VITALS_MAX_AGE_HOURS', '24')))
+# Medication adherence on the patient dashboard and consultation page covers this many full days
+ADHERENCE_WINDOW_DAYS = int(os.getenv('ADHERENCE_WINDOW_DAYS', '30'))
 
 # --- Initialize Flask App & Sock ---
 app = Flask(__name__)
@@ -54,43 +133,103 @@ sock = Sock(app) # Initialize Flask-Sock
 
 # --- Initialize Google Cloud Clients ---
 # STT Client (Uses GOOGLE_APPLICATION_CREDENTIALS env var automatically)
-stt_client = speech.SpeechClient()
+stt_client = None if IS_PDF_WORKER else speech.SpeechClient()
 
 # Gemini Client (Uses API Key)
-genai.configure(api_key=gemini_api_key)
-gemini_model = genai.GenerativeModel(gemini_model_id)
+gemini_api_endpoint = os.getenv('GEMINI_API_ENDPOINT') # e.g. http://127.0.0.1:8091 for fake_services.py
+if IS_PDF_WORKER:
+    gemini_model = None
+else:
+    if gemini_api_endpoint:
+        logging.warning(f"Using non-default Gemini endpoint: {gemini_api_endpoint}")
+        genai.configure(api_key=gemini_api_key, transport="rest", client_options={"api_endpoint": gemini_api_endpoint})
+    else:
+        genai.configure(api_key=gemini_api_key)
+    gemini_model = genai.GenerativeModel(gemini_model_id)
+# Background dependency probes + circuit breakers (probes are registered below the DB helpers)
+health_monitor = HealthMonitor(
+    failure_threshold=int(os.getenv('HEALTH_FAILURE_THRESHOLD', '3')),
+    reset_timeout=int(os.getenv('HEALTH_RESET_TIMEOUT', '30'))
+)
+# Shared wrapper for every Gemini call: summaries are served before ADR polls,
+# identical in-flight prompts share one call, and 429s are retried with backoff
+gemini_client = GeminiClient(
+    gemini_model,
+    max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')),
+    max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '4')),
+    queue_timeouts={PRIORITY_ADR: float(os.getenv('GEMINI_ADR_QUEUE_TIMEOUT', '5'))},
+    breaker=health_monitor.breaker('gemini')
+)
 
 # --- Database Connection ---
-def get_db_connection():
-    """Establishes a new database connection."""
+# Pooled connections keep their prepared statements, so sessions are not reset on
+# return; autocommit keeps each read current (multi-statement writes call start_transaction())
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+db_pool = None # Opened on first use so the app still starts while MySQL is down
+db_pool_lock = threading.Lock()
+prepared_statements = PreparedStatements()
+
+def get_db_connection(fail_fast=True):
+    """Checks out a pooled database connection, or opens a direct one when the pool is exhausted.
+
+    Returns None straight away while the MySQL breaker is open, instead of
+    waiting on a connect timeout per request; the health probe passes
+    fail_fast=False so it can see MySQL come back.
+    """
+    global db_pool
+    if fail_fast and health_monitor.is_open('mysql'):
+        return None
+    config = dict(host=db_host, user=db_user, password=db_password, database=db_name, autocommit=True)
     try:
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name
-        )
+        if db_pool is None and DB_POOL_SIZE > 0:
+            with db_pool_lock:
+                if db_pool is None:
+                    db_pool = pooling.MySQLConnectionPool(pool_name="upai", pool_size=DB_POOL_SIZE, pool_reset_session=False, **config)
+        if db_pool is not None:
+            return db_pool.get_connection()
+    except mysql.connector.errors.PoolError:
+        pass # More concurrent requests than DB_POOL_SIZE; this one gets its own connection
+    except mysql.connector.Error as err:
+        print(f"Error connecting to database: {err}")
+        return None
+    try:
+        conn = mysql.connector.connect(**config)
         return conn
     except mysql.connector.Error as err:
         print(f"Error connecting to database: {err}")
         return None
 
+def open_cursor(conn, query, dictionary=True):
+    """Returns (cursor, query to execute, owned).
+
+    Registered hot queries on pooled connections get the connection's cached
+    prepared cursor (owned=False: read every row and leave it open); anything
+    else gets a fresh buffered cursor for the caller to close.
+    """
+    sql = prepared_statements.canonical(query) if isinstance(conn, pooling.PooledMySQLConnection) else None
+    if sql is None:
+        return conn.cursor(buffered=True, dictionary=dictionary), query, True
+    return prepared_statements.cursor(conn, sql, dictionary), sql, False
+
 def fetch_one(query, params=()):
     """Fetches a single record from the database."""
     conn = get_db_connection()
     if not conn:
         return None
-    # Use buffered cursor to avoid "Unread result found" errors
-    cursor = conn.cursor(buffered=True, dictionary=True)
+    # Buffered (or fully drained prepared) cursors avoid "Unread result found" errors
+    cursor, query, owned = open_cursor(conn, query)
     try:
         cursor.execute(query, params)
-        result = cursor.fetchone()
-        return result
+        results = cursor.fetchall() # Drains prepared cursors too
+        return results[0] if results else None
     except mysql.connector.Error as err:
         print(f"Database query error: {err}")
+        if not owned:
+            prepared_statements.forget(conn)
         return None
     finally:
-        cursor.close()
+        if owned:
+            cursor.close()
         conn.close()
 
 def fetch_all(query, params=()):
@@ -98,17 +237,51 @@ def fetch_all(query, params=()):
     conn = get_db_connection()
     if not conn:
         return []
-    # Use buffered cursor
-    cursor = conn.cursor(buffered=True, dictionary=True)
+    cursor, query, owned = open_cursor(conn, query)
     try:
         cursor.execute(query, params)
         results = cursor.fetchall()
         return results
     except mysql.connector.Error as err:
         print(f"Database query error: {err}")
+        if not owned:
+            prepared_statements.forget(conn)
         return []
     finally:
-        cursor.close()
+        if owned:
+            cursor.close()
+        conn.close()
+
+FETCH_ITER_BATCH_SIZE = 500
+
+def fetch_iter(query, params=(), batch_size=FETCH_ITER_BATCH_SIZE, row_type='slots'):
+    """Yields records one at a time from an unbuffered cursor, fetching batch_size rows per round trip.
+
+    row_type: 'slots' (compact db_rows.Row objects, readable as row.name or
+    row['name']), 'tuple' or 'dict'. The connection stays open until the
+    generator is exhausted or closed, so consume it promptly.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        names = tuple(cursor.column_names)
+        make_row = {'slots': row_class(names), 'tuple': None, 'dict': lambda *values: dict(zip(names, values))}[row_type]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield make_row(*row) if make_row else row
+    except mysql.connector.Error as err:
+        print(f"Database query error: {err}")
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error: # Unread rows when the caller stopped early
+            conn.disconnect() # Drops them with the socket; a pooled connection reconnects on its next checkout
         conn.close()
 
 def execute_query(query, params=()):
@@ -116,7 +289,7 @@ def execute_query(query, params=()):
     conn = get_db_connection()
     if not conn:
         return None
-    cursor = conn.cursor()
+    cursor, query, owned = open_cursor(conn, query, dictionary=False)
     last_row_id = None
     try:
         cursor.execute(query, params)
@@ -126,11 +299,132 @@ def execute_query(query, params=()):
     except mysql.connector.Error as err:
         print(f"Database execution error: {err}") # <<< ERROR IS PRINTED HERE
         conn.rollback()
+        if not owned:
+            prepared_statements.forget(conn)
         return None # Returns None on error
     finally:
+        if owned:
+            cursor.close()
+        conn.close()
+
+# --- Archived Rows ---
+# Old Consultation/Vitals/SymptomLog rows live in archive tables (archive.py, archive_data.py)
+archive_watermarks = ArchiveWatermarks(fetch_all, ttl=int(os.getenv('ARCHIVE_WATERMARK_TTL', '60')))
+
+def fetch_across(table, query, params=(), since=None, oldest_first=False, limit=None):
+    """Runs query ({table} stands for the table name) on table and, if rows dated since may be archived, its archive.
+
+    Rows come back hot table first (newest first), or archive first with
+    oldest_first; stops early once limit rows are found.
+    """
+    rows = []
+    for name in archive_watermarks.tables_for(table, since, oldest_first):
+        rows.extend(fetch_all(query.format(table=name), params))
+        if limit and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+def fetch_one_across(table, query, params=()):
+    """First row found for query in table or, failing that, its archive."""
+    for name in archive_watermarks.tables_for(table):
+        row = fetch_one(query.format(table=name), params)
+        if row:
+            return row
+    return None
+
+# --- Hot Queries ---
+# Run on every login, dashboard load and log entry; executed as prepared statements
+def prepare_across(table, query):
+    """Registers query ({table} placeholder) for table and its archive; returns the template."""
+    for name in (table, ARCHIVED_TABLES[table][0]):
+        prepared_statements.register(query.format(table=name))
+    return query
+
+STAFF_LOGIN_QUERY = prepared_statements.register(
+    "SELECT id, name, email, role, password_hash FROM User WHERE email = %s AND role IN ('doctor', 'operator')")
+PATIENT_LOGIN_QUERY = prepared_statements.register(
+    "SELECT id, name, email, role, password_hash, linked_patient_id FROM User WHERE mobile_number = %s AND role = 'patient'")
+PATIENT_NAME_QUERY = prepared_statements.register("SELECT id, name FROM Patient WHERE id = %s")
+PATIENT_DETAILS_QUERY = prepared_statements.register("SELECT name, dob, gender FROM Patient WHERE id = %s")
+TODAYS_CONSULTATION_COUNT_QUERY = prepared_statements.register("""SELECT COUNT(*) as count 
+                   FROM Consultation 
+                   WHERE doctor_id = %s AND DATE(consultation_date) = %s""")
+RECENT_PRESCRIPTIONS_QUERY = prepare_across('Consultation', """
+        SELECT consultation_date, prescription_details
+        FROM {table}
+        WHERE patient_id = %s AND prescription_details IS NOT NULL AND prescription_details != '[]'
+        ORDER BY consultation_date DESC
+        LIMIT 2
+    """)
+RECENT_SYMPTOMS_QUERY = prepare_across('SymptomLog', """
+        SELECT log_timestamp, symptom_description, severity
+        FROM {table}
+        WHERE patient_id = %s
+        ORDER BY log_timestamp DESC
+        LIMIT 5
+    """)
+SYMPTOM_CHART_QUERY = prepare_across('SymptomLog', """
+        SELECT DATE(log_timestamp) as date, COUNT(*) as count, AVG(severity) as avg_severity
+        FROM {table}
+        WHERE patient_id = %s AND log_timestamp >= %s
+        GROUP BY DATE(log_timestamp)
+        ORDER BY date ASC
+    """)
+LOG_SYMPTOM_QUERY = prepared_statements.register(
+    "INSERT INTO SymptomLog (patient_id, user_id, log_timestamp, symptom_description, severity) VALUES (%s, %s, %s, %s, %s)")
+LOG_MEDICATION_QUERY = prepared_statements.register(
+    "INSERT INTO MedicationLog (patient_id, medication_name, notes, taken_at) VALUES (%s, %s, %s, %s)")
+ADHERENCE_PRESCRIPTIONS_QUERY = prepare_across('Consultation', """
+        SELECT consultation_date, prescription_details
+        FROM {table}
+        WHERE patient_id = %s AND consultation_date >= %s AND prescription_details IS NOT NULL AND prescription_details != '[]'
+    """)
+MEDICATION_LOG_QUERY = prepared_statements.register(
+    "SELECT medication_name, taken_at FROM MedicationLog WHERE patient_id = %s AND taken_at >= %s")
+
+# --- Dependency Health Monitor ---
+# Probes run on a background thread; requests only read the cached state and breakers.
+def probe_openfda():
+    # A 404 still proves the API answered; only request errors and 5xx count as down
+    query_drug_label(requests, OPENFDA_LABEL_URL, OPENFDA_API_KEY, "aspirin", timeout=5)
+
+def probe_gemini():
+    model_name = gemini_model_id if gemini_model_id.startswith('models/') else f"models/{gemini_model_id}"
+    genai.get_model(model_name, request_options={"timeout": 10})
+
+def probe_stt():
+    # 100 ms of silence: exercises auth and the recognize path with minimal billed audio
+    stt_client.recognize(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=16000,
+            language_code="en-US",
+        ),
+        audio=speech.RecognitionAudio(content=b"\x00\x00" * 1600),
+        timeout=10
+    )
+
+def probe_mysql():
+    conn = get_db_connection(fail_fast=False)
+    if not conn:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
         cursor.close()
+    finally:
         conn.close()
 
+if OPENFDA_API_KEY:
+    health_monitor.register('openfda', probe_openfda, interval=int(os.getenv('HEALTH_OPENFDA_INTERVAL', '60')), critical=False)
+health_monitor.register('gemini', probe_gemini, interval=int(os.getenv('HEALTH_GEMINI_INTERVAL', '60')))
+# STT recognize calls are billed, so it is probed far less often
+health_monitor.register('stt', probe_stt, interval=int(os.getenv('HEALTH_STT_INTERVAL', '900')))
+health_monitor.register('mysql', probe_mysql, interval=int(os.getenv('HEALTH_MYSQL_INTERVAL', '30')))
+if os.getenv('HEALTH_MONITOR_ENABLED', 'true').lower() != 'false' and not IS_PDF_WORKER:
+    health_monitor.start()
+
 # --- Login / Auth Helper Functions & Decorators ---
 
 def login_required(f):
@@ -179,6 +473,17 @@ def patient_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def patient_adherence(patient_id):
+    """Adherence summary for one patient (adherence.py), or None if nothing was prescribed or logged."""
+    today = datetime.date.today()
+    since = lookback_start(today, ADHERENCE_WINDOW_DAYS)
+    consultations = fetch_across('Consultation', ADHERENCE_PRESCRIPTIONS_QUERY, (patient_id, since), since=since)
+    window_start = datetime.datetime.combine(today - datetime.timedelta(days=ADHERENCE_WINDOW_DAYS), datetime.time())
+    logs = [(patient_id, row['medication_name'], row['taken_at'])
+            for row in fetch_all(MEDICATION_LOG_QUERY, (patient_id, window_start))]
+    results = compute_adherence({patient_id: prescription_courses(consultations)}, logs, today, ADHERENCE_WINDOW_DAYS)
+    return results.get(patient_id)
+
 @app.route('/patient_dashboard')
 @patient_login_required # Use the specific patient decorator
 def patient_dashboard():
@@ -187,7 +492,7 @@ def patient_dashboard():
     user_name = session.get('user_name') # Get name from User session
 
     # Fetch basic patient details (optional, could just use user_name)
-    patient_details = fetch_one("SELECT name, dob, gender FROM Patient WHERE id = %s", (patient_id,))
+    patient_details = fetch_one(PATIENT_DETAILS_QUERY, (patient_id,))
     if not patient_details:
         # This indicates an inconsistency between User and Patient table linkage
         flash("Error: Patient profile not found for your login.", "danger")
@@ -196,14 +501,7 @@ def patient_dashboard():
 
     # Fetch recent medication prescriptions (Example: last 2 consultations)
     # This helps populate the medication logging section initially
-    prescriptions_query = """
-        SELECT consultation_date, prescription_details
-        FROM Consultation
-        WHERE patient_id = %s AND prescription_details IS NOT NULL AND prescription_details != '[]'
-        ORDER BY consultation_date DESC
-        LIMIT 2
-    """
-    recent_consultations = fetch_all(prescriptions_query, (patient_id,))
+    recent_consultations = fetch_across('Consultation', RECENT_PRESCRIPTIONS_QUERY, (patient_id,), limit=2)
 
     current_medications = []
     if recent_consultations:
@@ -224,18 +522,13 @@ def patient_dashboard():
 
 
     # Fetch recent symptom logs (Example: last 5)
-    recent_symptoms = fetch_all("""
-        SELECT log_timestamp, symptom_description, severity
-        FROM SymptomLog
-        WHERE patient_id = %s
-        ORDER BY log_timestamp DESC
-        LIMIT 5
-    """, (patient_id,))
+    recent_symptoms = fetch_across('SymptomLog', RECENT_SYMPTOMS_QUERY, (patient_id,), limit=5)
 
     return render_template('patient_dashboard.html',
                            patient=patient_details,
                            medications=current_medications,
-                           symptoms=recent_symptoms)
+                           symptoms=recent_symptoms,
+                           adherence=patient_adherence(patient_id))
 
 # Add routes for logging symptoms and medication usage
 @app.route('/log_symptom', methods=['POST'])
@@ -264,9 +557,8 @@ def log_symptom():
         current_timestamp = datetime.datetime.now()
 
         # --- FIX: Include log_timestamp in INSERT ---
-        query = "INSERT INTO SymptomLog (patient_id, user_id, log_timestamp, symptom_description, severity) VALUES (%s, %s, %s, %s, %s)"
         # --- FIX: Pass current_timestamp to execute_query ---
-        success = execute_query(query, (patient_id, user_id, current_timestamp, symptom_desc, severity_int))
+        success = execute_query(LOG_SYMPTOM_QUERY, (patient_id, user_id, current_timestamp, symptom_desc, severity_int))
         if success:
             flash("Symptom logged successfully.", "success")
         else:
@@ -287,8 +579,7 @@ def log_medication():
         flash("Medication name cannot be empty.", "warning")
     else:
         # Simple log: just record that the named medication was taken
-        query = "INSERT INTO MedicationLog (patient_id, medication_name, notes) VALUES (%s, %s, %s)"
-        success = execute_query(query, (patient_id, medication_name, notes))
+        success = execute_query(LOG_MEDICATION_QUERY, (patient_id, medication_name, notes, datetime.datetime.now()))
         if success:
             flash(f"'{medication_name}' logged as taken.", "success")
         else:
@@ -305,14 +596,8 @@ def get_symptom_data():
     days_limit = 30
     start_date = datetime.datetime.now() - datetime.timedelta(days=days_limit)
 
-    query = """
-        SELECT DATE(log_timestamp) as date, COUNT(*) as count, AVG(severity) as avg_severity
-        FROM SymptomLog
-        WHERE patient_id = %s AND log_timestamp >= %s
-        GROUP BY DATE(log_timestamp)
-        ORDER BY date ASC
-    """
-    symptom_data = fetch_all(query, (patient_id, start_date))
+    # Archive cut-offs fall on midnight, so no day is split between the two tables
+    symptom_data = fetch_across('SymptomLog', SYMPTOM_CHART_QUERY, (patient_id, start_date), since=start_date, oldest_first=True)
 
     # Format for Chart.js
     labels = [item['date'].strftime('%Y-%m-%d') for item in symptom_data]
@@ -342,360 +627,6 @@ def get_symptom_data():
 
 # --- END Patient Dashboard Routes --- 
 
-# --- PDF Generation Class (Redesigned Layout - Revision 3) ---
-
-class ConsultationPDF(FPDF):
-    def __init__(self, doctor_data, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.doctor_data = doctor_data
-        self.alias_nb_pages()
-        self.set_margins(12, 15, 12)
-        self.set_auto_page_break(auto=True, margin=20)
-        self.set_font("helvetica", size=9)
-        self.line_height = 4.5
-        self.section_title_height = self.line_height * 1.3
-        self.gap_after_section_title = 1.5
-        self.gap_between_sections = 3 # Renamed for clarity
-        self.gap_after_final_section = 4
-        self.page_content_width = self.w - self.l_margin - self.r_margin
-        self.col_width = (self.page_content_width - 6) / 2
-        self.col_gap = 6
-
-    def header(self):
-        header_y_start = self.get_y()
-        col1_width = self.page_content_width * 0.55
-        col2_width = self.page_content_width * 0.45
-        
-        # Left Block: Doctor Details
-        self.set_font("helvetica", "B", 11)
-        doctor_name = self.doctor_data.get('name', 'Dr. Default')
-        self.cell(col1_width, self.line_height + 1, doctor_name, border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-        self.set_font("helvetica", "", 9)
-        qualifications = self.doctor_data.get('qualifications', '')
-        if qualifications:
-             self.multi_cell(col1_width, self.line_height, qualifications, border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        reg_no = self.doctor_data.get('registration_number', '')
-        if reg_no:
-             # <<< FIX: Ensure Reg No is Left Aligned within its block >>>
-            self.cell(col1_width, self.line_height, f"Reg. No: {reg_no}", border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        phone = self.doctor_data.get('phone_number', '')
-        if phone:
-             # <<< FIX: Ensure Mob No is Left Aligned within its block >>>
-             self.cell(col1_width, self.line_height, f"Mob. No: {phone}", border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-             
-        y_after_left = self.get_y()
-        
-        # Right Block: Clinic Details
-        self.set_xy(self.l_margin + col1_width, header_y_start)
-        self.set_font("helvetica", "B", 11)
-        clinic_name = self.doctor_data.get('clinic_name', 'Clinic Name')
-        # Use multi_cell for potential wrapping of clinic name
-        self.multi_cell(col2_width, self.line_height + 1, clinic_name, border=0, align='R')
-        y_after_clinic_name = self.get_y()
-        current_x_right = self.l_margin + col1_width
-        
-        self.set_xy(current_x_right, y_after_clinic_name)
-        self.set_font("helvetica", "", 9)
-        address = self.doctor_data.get('clinic_address', '')
-        if address:
-            self.multi_cell(col2_width, self.line_height, address, border=0, align='R')
-        timings = self.doctor_data.get('clinic_timings', '')
-        if timings:
-            self.set_x(current_x_right) # Reset X
-            self.cell(col2_width, self.line_height, f"Timing: {timings}", border=0, align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        closed = self.doctor_data.get('clinic_closed_days', '')
-        if closed:
-            self.set_x(current_x_right) # Reset X
-            self.cell(col2_width, self.line_height, f"Closed: {closed}", border=0, align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-            
-        y_after_right = self.get_y()
-        
-        # Draw line below header
-        self.set_y(max(y_after_left, y_after_right) + 2) # Increased gap
-        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-        self.ln(4) # Increased gap
-
-    def footer(self):
-        self.set_y(-18) # Position further up for signature space
-        
-        # Page Number (Centered)
-        page_num_y = self.get_y()
-        self.set_font("helvetica", "I", 8)
-        self.cell(0, 10, f"Page {self.page_no()}/{{nb}}", align="C", border=0)
-        
-        # Signature Area (Bottom Right) - Adjusted Y positioning relative to bottom
-        sig_width = 60
-        sig_x = self.w - self.r_margin - sig_width
-        sig_y = self.h - self.b_margin - 15 # Y position for the signature line itself
-        
-        self.set_y(sig_y) # Go to Y pos for signature line
-        self.line(sig_x, sig_y, sig_x + sig_width, sig_y) # Draw signature line
-        
-        # Position text below the line
-        self.set_xy(sig_x, sig_y + 1) 
-        self.set_font("helvetica", "B", 9)
-        doctor_name = self.doctor_data.get('name', 'Dr. Default')
-        self.cell(sig_width, self.line_height, doctor_name, align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-        self.set_x(sig_x)
-        self.set_font("helvetica", "", 8)
-        qualifications = self.doctor_data.get('qualifications', '')
-        if qualifications:
-            self.cell(sig_width, self.line_height, qualifications, align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        reg_no = self.doctor_data.get('registration_number', '')
-        if reg_no:
-            self.set_x(sig_x)
-            self.cell(sig_width, self.line_height, f"Reg. No.: {reg_no}", align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-        # Reset Y to avoid interfering with page numbering if content was short
-        self.set_y(page_num_y)
-
-    def add_patient_details(self, name, patient_id, dob, gender):
-        self.set_font("helvetica", "", 9)
-        id_text = f"ID: {patient_id}"
-        id_width = self.get_string_width(id_text) + 5
-        self.cell(id_width, self.line_height, id_text)
-        name_text = f"{name}"
-        name_width = self.get_string_width(name_text) + 5
-        self.cell(name_width, self.line_height, name_text)
-        age = ''
-        if isinstance(dob, (datetime.date, datetime.datetime)):
-            today = datetime.date.today()
-            age_years = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-            age = f"({age_years} Yrs)"
-        gender_age_text = f"{gender} / {age}"
-        self.cell(0, self.line_height, gender_age_text, align='R')
-        self.ln(self.line_height + 1)
-        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-        self.ln(4) # Increased gap
-
-    def add_consultation_date(self, date):
-        self.set_font("helvetica", "B", 9)
-        date_str = date.strftime('%d-%b-%Y %I:%M %p') if isinstance(date, datetime.datetime) else str(date)
-        current_y = self.get_y()
-        # Position X for right alignment before calling cell
-        date_width = self.get_string_width(f"Date: {date_str}")
-        self.set_x(self.w - self.r_margin - date_width)
-        self.cell(date_width, self.line_height, f"Date: {date_str}", align="R")
-        # Use ln() to move below the date cell's height
-        self.ln(self.line_height + 3)
-
-    def add_vitals(self, vitals_dict):
-        self.set_font("helvetica", "B", 10)
-        title = "Vitals"
-        title_width = self.get_string_width(title) + 2
-        self.cell(title_width, self.section_title_height, title)
-        self.ln(self.section_title_height + self.gap_after_section_title)
-        
-        if not vitals_dict: 
-            self.set_font("helvetica", "I", 9)
-            self.cell(0, self.line_height, "(No vitals recorded)")
-            self.ln(self.line_height + self.gap_between_sections)
-            # No line below vitals
-            return
-        
-        self.set_font("helvetica", "", 9)
-        bp = f"BP: {vitals_dict.get('bp_systolic', '--')}/{vitals_dict.get('bp_diastolic', '--')} mmHg"
-        hr = f"HR: {vitals_dict.get('heart_rate', '--')} bpm"
-        temp = f"Temp: {vitals_dict.get('temperature', '--')} °C"
-        spo2 = f"SpO2: {vitals_dict.get('spo2', '--')} %"
-        weight = f"Wt: {vitals_dict.get('weight_kg', '--')} kg"
-        height = f"Ht: {vitals_dict.get('height_cm', '--')} cm"
-        
-        # 3-column layout for vitals
-        vitals_col_width = self.page_content_width / 3
-        # Row 1
-        self.cell(vitals_col_width, self.line_height, bp)
-        self.cell(vitals_col_width, self.line_height, hr)
-        self.cell(vitals_col_width, self.line_height, temp, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        # Row 2
-        self.cell(vitals_col_width, self.line_height, spo2)
-        self.cell(vitals_col_width, self.line_height, weight)
-        self.cell(vitals_col_width, self.line_height, height, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-        self.ln(self.gap_between_sections)
-
-    def add_section_in_column(self, title, content, width):
-        start_x = self.get_x() # Remember column starting X
-        y_start = self.get_y()
-        
-        # --- Draw Title --- 
-        self.set_font("helvetica", "B", 10)
-        self.cell(width, self.section_title_height, title, border="B", align="L")
-        # Y position after title and gap
-        y_after_title = y_start + self.section_title_height + self.gap_after_section_title
-        self.set_xy(start_x, y_after_title)
-            
-        # --- Draw Content --- 
-        if content:
-            self.set_font("helvetica", "", 9)
-            # Use split_lines=True to calculate height correctly before drawing
-            # This is more reliable than relying on get_y() immediately after multi_cell with ln=3
-            lines = self.multi_cell(width, self.line_height, str(content), border=0, align="L", split_only=True)
-            num_lines = len(lines)
-            content_height = num_lines * self.line_height
-            
-            # Check for page break BEFORE drawing the content multi_cell
-            if self.get_y() + content_height > self.page_break_trigger:
-                # This section is too long to fit, ideally handle this better
-                # For now, let auto-page-break handle it during the actual multi_cell draw
-                # Or add logic here to draw title on new page if content won't fit below it
-                pass 
-                
-            # Draw the actual content
-            self.multi_cell(width, self.line_height, str(content), border=0, align="L")
-            # Calculate Y position after drawing the content
-            y_after_content = y_after_title + content_height
-            self.set_y(y_after_content)
-        else: # No content, Y position is just after title gap
-            self.set_y(y_after_title)
-            
-        self.set_x(start_x) # Reset X to column start
-        return self.get_y() # Return final Y position after drawing this section
-
-    def add_full_width_section(self, title, content):
-         if content:
-            self.set_font("helvetica", "B", 10)
-            self.cell(0, self.section_title_height, title, border="B", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-            self.ln(self.gap_after_section_title)
-            self.set_font("helvetica", "", 9)
-            self.multi_cell(0, self.line_height, str(content))
-            self.ln(self.gap_between_sections)
-            self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-            self.ln(2)
-
-    def add_two_column_sections(self, left_sections, right_sections):
-        y_start_columns = self.get_y()
-        y_left_ends = []
-        y_right_ends = []
-        left_items = list(left_sections.items())
-        right_items = list(right_sections.items())
-        
-        # Draw Left Column Sections
-        current_x_left = self.l_margin
-        self.set_xy(current_x_left, y_start_columns)
-        current_y_left = y_start_columns
-        for i, (title, content) in enumerate(left_items):
-            self.set_xy(current_x_left, current_y_left) # Set position for this section
-            current_y_left = self.add_section_in_column(title, content, self.col_width)
-            y_left_ends.append(current_y_left) # Store end Y for each section
-            # Add gap between sections in the same column
-            if i < len(left_items) - 1:
-                 current_y_left += self.gap_between_sections
-            
-        # Set position for Right Column Sections
-        current_x_right = self.l_margin + self.col_width + self.col_gap
-        self.set_xy(current_x_right, y_start_columns) # Start right col at same Y
-        current_y_right = y_start_columns
-        for i, (title, content) in enumerate(right_items):
-            self.set_xy(current_x_right, current_y_right) # Set position for this section
-            current_y_right = self.add_section_in_column(title, content, self.col_width)
-            y_right_ends.append(current_y_right)
-             # Add gap between sections in the same column
-            if i < len(right_items) - 1:
-                 current_y_right += self.gap_between_sections
-            
-        # Determine the overall final Y position based on the tallest column's last section end
-        final_y = max(y_left_ends[-1] if y_left_ends else y_start_columns, 
-                      y_right_ends[-1] if y_right_ends else y_start_columns)
-        self.set_y(final_y)
-        self.ln(self.gap_after_final_section) # Use final gap after the whole block
-        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-        self.ln(2)
-
-    def add_prescription_table(self, prescriptions):
-        self.set_font("helvetica", "B", 10)
-        self.cell(0, self.section_title_height, "Prescription (Rx)", border="B", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        self.ln(self.gap_after_section_title)
-        if not prescriptions: 
-            self.set_font("helvetica", "I", 9)
-            self.cell(0, self.line_height, "(No prescription details recorded)")
-            self.ln(self.line_height + self.gap_between_sections)
-            self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-            self.ln(2)
-            return
-
-        self.set_font("helvetica", "B", 9)
-        total_width = self.page_content_width
-        sno_width = 8
-        med_width = total_width * 0.35 
-        dos_width = total_width * 0.15
-        instr_width = total_width - sno_width - med_width - dos_width # Remaining width
-        col_widths = (sno_width, med_width, dos_width, instr_width)
-        headers = ("S.No.", "Medicine", "Dosage", "Instructions")
-        
-        # Draw Table Header
-        for i, header in enumerate(headers):
-            self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
-        self.ln()
-
-        self.set_font("helvetica", "", 9)
-        for idx, med in enumerate(prescriptions):
-            y_before = self.get_y()
-            x_before = self.get_x()
-            cell_padding = 1.2 
-            
-            sno = str(idx + 1) + "."
-            # Use correct keys from JSON
-            text_medicine = str(med.get('medicine_name', ''))
-            text_dosage = str(med.get('dosage', ''))
-            # Combine frequency, duration, instructions
-            freq = med.get('frequency', '')
-            dur = med.get('duration', '')
-            instr = med.get('instructions', '')
-            text_instructions = f"{freq}{' for ' + dur if dur else ''}{('. ' + instr) if instr else ''}".strip()
-            if not text_instructions: # Handle empty case
-                 text_instructions = dur # Fallback to just duration if freq/instr are empty
-            
-            # Calculate max lines needed using multi_cell dry run
-            max_lines = 1
-            all_texts = [text_medicine, text_dosage, text_instructions]
-            all_widths = [col_widths[1], col_widths[2], col_widths[3]]
-            for i, text in enumerate(all_texts):
-                 lines = self.multi_cell(all_widths[i], self.line_height, text, border=0, align='L', dry_run=True, output='LINES')
-                 max_lines = max(max_lines, len(lines))
-            
-            row_height = max_lines * self.line_height * cell_padding
-            row_height = max(row_height, self.line_height * 1.4) # Min height
-
-            # Page break check
-            if self.get_y() + row_height > self.page_break_trigger:
-                 self.add_page()
-                 self.set_font("helvetica", "B", 9)
-                 for i, header in enumerate(headers):
-                     self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
-                 self.ln()
-                 self.set_font("helvetica", "", 9)
-                 y_before = self.get_y()
-                 x_before = self.get_x()
-
-            # Draw cells
-            current_x = x_before
-            self.set_y(y_before)
-            self.multi_cell(col_widths[0], row_height, sno, border='L', align='C', ln=3, max_line_height=self.line_height)
-            self.set_xy(current_x + col_widths[0], y_before)
-            self.multi_cell(col_widths[1], row_height, text_medicine, border='L', align='L', ln=3, max_line_height=self.line_height)
-            self.set_xy(current_x + col_widths[0] + col_widths[1], y_before)
-            self.multi_cell(col_widths[2], row_height, text_dosage, border='L', align='L', ln=3, max_line_height=self.line_height)
-            self.set_xy(current_x + col_widths[0] + col_widths[1] + col_widths[2], y_before)
-            self.multi_cell(col_widths[3], row_height, text_instructions, border='LR', align='L', ln=3, max_line_height=self.line_height)
-            
-            self.line(x_before, y_before + row_height, x_before + sum(col_widths), y_before + row_height)
-            self.set_y(y_before + row_height)
-        
-        self.ln(self.gap_between_sections)
-        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
-        self.ln(2)
-
-    def add_follow_up(self, date):
-        if not date: return
-        self.set_font("helvetica", "B", 9)
-        date_str = date.strftime('%d-%b-%Y') if isinstance(date, datetime.date) else str(date)
-        self.cell(0, self.line_height, f"Follow-up advised on: {date_str}", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        self.ln(self.gap_after_final_section)
-        # No line needed if this is the last item before footer
-
 # --- Flask Routes ---
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -712,7 +643,7 @@ def login():
                 error = 'Email and Password are required for staff login.'
             else:
                 # Fetch staff user (doctor or operator) by email
-                user = fetch_one("SELECT id, name, email, role, password_hash FROM User WHERE email = %s AND role IN ('doctor', 'operator')", (email,))
+                user = fetch_one(STAFF_LOGIN_QUERY, (email,))
                 if user is None or not check_password_hash(user['password_hash'], password):
                     error = 'Incorrect email or password for staff.'
 
@@ -726,7 +657,7 @@ def login():
             else:
                 # Fetch patient user by mobile number
                 # Ensure we select linked_patient_id
-                user = fetch_one("SELECT id, name, email, role, password_hash, linked_patient_id FROM User WHERE mobile_number = %s AND role = 'patient'", (mobile,))
+                user = fetch_one(PATIENT_LOGIN_QUERY, (mobile,))
                 if user is None or not check_password_hash(user['password_hash'], password):
                     error = 'Incorrect mobile number or password for patient.'
         else:
@@ -800,10 +731,7 @@ def index():
     # Assuming doctor_id 1 for now
     doctor_id = 1 # <<< HARDCODED DOCTOR ID
     today_date = datetime.date.today()
-    query_today = """SELECT COUNT(*) as count 
-                   FROM Consultation 
-                   WHERE doctor_id = %s AND DATE(consultation_date) = %s"""
-    today_data = fetch_one(query_today, (doctor_id, today_date))
+    today_data = fetch_one(TODAYS_CONSULTATION_COUNT_QUERY, (doctor_id, today_date))
     todays_consultations_count = today_data['count'] if today_data else 0
     
     # --- DEBUGGING LOG ---
@@ -812,7 +740,8 @@ def index():
     return render_template(
         'index.html', 
         patients=patients, 
-        todays_count=todays_consultations_count
+        todays_count=todays_consultations_count,
+        today=today_date.isoformat()
     )
 
 @app.route('/consultation/<int:patient_id>')
@@ -825,7 +754,7 @@ def consultation_page(patient_id):
         flash("Only doctors can access the consultation page.", "danger")
         return redirect(url_for('index'))
         
-    patient = fetch_one("SELECT id, name FROM Patient WHERE id = %s", (patient_id,))
+    patient = fetch_one(PATIENT_NAME_QUERY, (patient_id,))
     if not patient:
         flash(f"Patient with ID {patient_id} not found.", "error")
         return redirect(url_for('index'))
@@ -836,7 +765,174 @@ def consultation_page(patient_id):
         flash("Session error. Please log in again.", "warning")
         return redirect(url_for('login'))
         
-    return render_template('consultation.html', patient=patient, patient_id=patient_id, doctor_id=doctor_id)
+    return render_template('consultation.html', patient=patient, patient_id=patient_id, doctor_id=doctor_id,
+                           adherence=patient_adherence(patient_id))
+
+# --- Gemini Consultation Summary Helpers ---
+
+# Ask Gemini for JSON matching the draft schema (set GEMINI_JSON_MODE=false for free-text headings)
+GEMINI_JSON_MODE = os.getenv('GEMINI_JSON_MODE', 'true').lower() != 'false'
+DRAFT_GENERATION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=DRAFT_RESPONSE_SCHEMA
+) if GEMINI_JSON_MODE else None
+
+# --- Long Transcript Summarization (Map-Reduce) ---
+# Transcripts above the threshold are split into overlapping chunks, each chunk
+# is summarized in parallel (map) and the partial drafts are merged (reduce).
+SUMMARY_MAP_REDUCE_TOKENS = int(os.getenv('SUMMARY_MAP_REDUCE_TOKENS', '6000'))
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '3000'))
+SUMMARY_CHUNK_OVERLAP_TOKENS = int(os.getenv('SUMMARY_CHUNK_OVERLAP_TOKENS', '200'))
+SUMMARY_MAP_WORKERS = int(os.getenv('SUMMARY_MAP_WORKERS', '4'))
+summary_map_executor = None if IS_PDF_WORKER else ThreadPoolExecutor(max_workers=SUMMARY_MAP_WORKERS, thread_name_prefix='summary-map')
+
+def needs_map_reduce(raw_transcript):
+    """True if a transcript is too long to summarize in a single prompt."""
+    return estimate_tokens(raw_transcript) > SUMMARY_MAP_REDUCE_TOKENS
+
+def gemini_usage(response):
+    """Returns (prompt_tokens, output_tokens) reported by Gemini, or (None, None)."""
+    usage = getattr(response, 'usage_metadata', None)
+    return (getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None))
+
+def summarize_chunk(chunk, index, total):
+    """Map stage: summarizes one transcript chunk into a partial draft."""
+    start_time = time.time()
+    response = gemini_client.generate(
+        build_chunk_prompt(chunk, index, total),
+        priority=PRIORITY_SUMMARY,
+        generation_config=DRAFT_GENERATION_CONFIG
+    )
+    partial_draft, _ = decode_draft(response.text)
+    prompt_tokens, output_tokens = gemini_usage(response)
+    logging.info(f"[SUMMARY MAP] chunk {index}/{total}: est_tokens={estimate_tokens(chunk)} "
+                 f"prompt_tokens={prompt_tokens} output_tokens={output_tokens} latency={time.time() - start_time:.2f}s")
+    return partial_draft
+
+def summarize_long_transcript(raw_transcript):
+    """Summarizes a long transcript via parallel chunk summaries and a merge step.
+
+    Returns (draft, original_text) like the single-prompt path. If the Gemini
+    merge fails, the partial drafts are merged deterministically instead.
+    """
+    start_time = time.time()
+    chunks = split_transcript(raw_transcript, SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_OVERLAP_TOKENS)
+    logging.info(f"[SUMMARY SPLIT] est_tokens={estimate_tokens(raw_transcript)} chunks={len(chunks)} "
+                 f"chunk_tokens={SUMMARY_CHUNK_TOKENS} overlap_tokens={SUMMARY_CHUNK_OVERLAP_TOKENS}")
+
+    futures = [summary_map_executor.submit(summarize_chunk, chunk, i, len(chunks))
+               for i, chunk in enumerate(chunks, 1)]
+    partial_drafts = [future.result() for future in futures]
+    map_done_time = time.time()
+    logging.info(f"[SUMMARY MAP] {len(chunks)} chunks done in {map_done_time - start_time:.2f}s")
+
+    try:
+        response = gemini_client.generate(
+            build_merge_prompt(partial_drafts),
+            priority=PRIORITY_SUMMARY,
+            generation_config=DRAFT_GENERATION_CONFIG
+        )
+        merged_draft, draft_source = decode_draft(response.text)
+        if draft_source != "json":
+            raise ValueError("merge response was not a valid JSON draft")
+        original_text = response.text
+        prompt_tokens, output_tokens = gemini_usage(response)
+        logging.info(f"[SUMMARY REDUCE] prompt_tokens={prompt_tokens} output_tokens={output_tokens} "
+                     f"latency={time.time() - map_done_time:.2f}s")
+    except Exception as e:
+        logging.warning(f"[SUMMARY REDUCE] Gemini merge failed ({type(e).__name__}: {e}); merging locally.")
+        merged_draft = merge_drafts(partial_drafts)
+        original_text = json.dumps(merged_draft, indent=2)
+
+    logging.info(f"[SUMMARY TOTAL] chunks={len(chunks)} latency={time.time() - start_time:.2f}s")
+    return merged_draft, original_text
+
+def sse_event(event, data, event_id=None):
+    """Formats a single Server-Sent Events frame with a JSON payload."""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def add_prescription_suggestions(prescriptions):
+    """Adds suggested_medicine_name to items whose name looks like a misheard known drug."""
+    if not fuzzy_drug_index or not isinstance(prescriptions, list):
+        return prescriptions
+    for item in prescriptions:
+        if isinstance(item, dict) and item.get('medicine_name'):
+            candidate = fuzzy_drug_index.suggest(item['medicine_name'])
+            if candidate:
+                item['suggested_medicine_name'] = candidate.term.title()
+    return prescriptions
+
+def iter_summary_events(raw_transcript):
+    """Summarizes a transcript, yielding (event, data) as the draft is produced.
+
+    Yields one `section` event per draft field ({"key", "value"}) as soon as
+    Gemini finishes it, then a `done` event carrying the full draft and
+    original text, or an `error` event if Gemini fails. Prescription items
+    get a suggested_medicine_name when the fuzzy drug index has one.
+    """
+    for event, payload in _iter_summary_events(raw_transcript):
+        if event == "section" and payload["key"] == "prescription_details":
+            add_prescription_suggestions(payload["value"])
+        elif event == "done" and isinstance(payload.get("ai_draft"), dict):
+            add_prescription_suggestions(payload["ai_draft"].get("prescription_details"))
+        yield event, payload
+
+def _iter_summary_events(raw_transcript):
+    if not raw_transcript or raw_transcript == "(Listening...)":
+        yield "done", {"ai_draft": new_empty_draft(), "original_gemini_text": ""}
+        return
+
+    decoder = StreamingDraftDecoder()
+    first_section_sent = False
+    start_time = time.time()
+    try:
+        if needs_map_reduce(raw_transcript):
+            # Chunk summaries must all finish before the merge, so send the result at once
+            ai_draft_structured, gemini_text = summarize_long_transcript(raw_transcript)
+            for key, value in ai_draft_structured.items():
+                yield "section", {"key": key, "value": value}
+            yield "done", {"ai_draft": ai_draft_structured, "original_gemini_text": gemini_text}
+            return
+
+        print("Calling Gemini API (streaming)...")
+        gemini_stream = gemini_client.generate_stream(
+            build_summary_prompt(raw_transcript, json_mode=GEMINI_JSON_MODE),
+            priority=PRIORITY_SUMMARY,
+            generation_config=DRAFT_GENERATION_CONFIG
+        )
+        for chunk in gemini_stream:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                # Chunk carried no text (e.g. safety block or finish marker)
+                continue
+            for key, value in decoder.feed(chunk_text):
+                if not first_section_sent:
+                    first_section_sent = True
+                    print(f"First draft section streamed after {time.time() - start_time:.2f}s")
+                yield "section", {"key": key, "value": value}
+
+        # The last free-text section is only complete once the stream has ended
+        for key, value in decoder.close():
+            yield "section", {"key": key, "value": value}
+
+        gemini_text = decoder.text
+        if not gemini_text:
+            print("Gemini streaming response was blocked or empty.")
+            yield "error", {"error": "AI analysis failed or response structure invalid"}
+            return
+
+        ai_draft_structured, draft_source = decode_draft(gemini_text)
+        if GEMINI_JSON_MODE and draft_source != "json":
+            logging.warning("Streamed Gemini JSON draft failed validation; used heading parser fallback.")
+        print(f"Gemini streaming finished in {time.time() - start_time:.2f}s ({len(gemini_text)} chars)")
+        yield "done", {"ai_draft": ai_draft_structured, "original_gemini_text": gemini_text}
+
+    except Exception as e:
+        import traceback
+        print(f"Error during Gemini streaming: {e}\n{traceback.format_exc()}")
+        yield "error", {"error": f"Gemini processing/parsing failed: {type(e).__name__}"}
 
 # UPDATED Route: Process accumulated transcript text via Gemini
 @app.route('/process_transcript_text', methods=['POST'])
@@ -850,64 +946,26 @@ def process_transcript_text():
     raw_transcript = data['transcript_text']
     print(f"Received transcript text for processing: {len(raw_transcript)} chars")
 
-    # Define the empty structure here for reuse
-    empty_structure = {
-        "chief_complaints": "",
-        "clinical_findings": "",
-        "internal_notes": "", # Added internal notes field
-        "diagnosis": "",
-        "procedures_conducted": "",
-        "prescription_details": [],
-        "investigations": "",
-        "advice_given": "",
-        "follow_up_date": ""
-    }
-
     if not raw_transcript or raw_transcript == "(Listening...)":
         print("Received empty or placeholder transcript.")
-        return jsonify({"ai_draft": empty_structure}) # Return empty structure
+        return jsonify({"ai_draft": new_empty_draft()}) # Return empty structure
 
     try:
-        # --- Prepare Gemini Prompt (Updated for more structure) ---
-        prompt = f"""Analyze the following doctor-patient consultation transcript. Extract the relevant medical information and structure it clearly under the specified headings. Be concise and accurate. If information for a heading is not present, leave it blank or write 'None mentioned'.
-
-TRANSCRIPT:
-```
-{raw_transcript}
-```
+        # --- Long transcripts: chunked map-reduce summarization ---
+        if needs_map_reduce(raw_transcript):
+            ai_generated_draft, original_gemini_text = summarize_long_transcript(raw_transcript)
+            add_prescription_suggestions(ai_generated_draft.get("prescription_details"))
+            return jsonify({
+                "ai_draft": ai_generated_draft,
+                "original_gemini_text": original_gemini_text
+            })
 
-EXTRACTED INFORMATION:
-Chief Complaints:
-[Extract chief complaints here]
-
-Clinical Findings:
-[Extract clinical findings here]
-
-Internal Notes:
-[Extract any notes clearly intended for the doctor only, if any. If none, state 'None mentioned']
-
-Diagnosis:
-[Extract diagnosis here]
-
-Procedures Conducted:
-[Extract procedures conducted, if any. If none, state 'None mentioned']
-
-Prescription:
-[List each prescribed medicine on a new line in the format: Medicine Name | Dosage | Duration/Total. Example: Tab Metformin | 500mg | 1 tab twice daily for 30 days. If no prescription, state 'None mentioned']
-
-Investigations:
-[List investigations ordered, if any. Example: CBC, X-Ray Chest. If none, state 'None mentioned']
-
-Advice Given:
-[Extract advice given to the patient]
-
-Follow-Up Date:
-[Extract follow-up date, if mentioned, in YYYY-MM-DD format. If not mentioned, state 'None mentioned']
-"""
+        # --- Prepare Gemini Prompt (Updated for more structure) ---
+        prompt = build_summary_prompt(raw_transcript, json_mode=GEMINI_JSON_MODE)
 
         # --- Call Gemini API ---
         print("Calling Gemini API...")
-        gemini_response = gemini_model.generate_content(prompt)
+        gemini_response = gemini_client.generate(prompt, priority=PRIORITY_SUMMARY, generation_config=DRAFT_GENERATION_CONFIG)
         print("Gemini API call finished.")
 
         # Check for safety ratings or blocks
@@ -925,65 +983,17 @@ Follow-Up Date:
 {original_gemini_text}
 ---""")
 
-        # --- Parse the Gemini Output ---
-        ai_draft_structured = empty_structure.copy()
-        ai_draft_structured["prescription_details"] = [] # Ensure list is empty
-
-        # Helper function to extract section text (more robust)
-        def extract_section(text, heading):
-            # Regex explanation:
-            # ^                       - Start of line (due to re.MULTILINE)
-            # {re.escape(heading)}    - The literal heading string, escaping special chars
-            # :?                      - Optional colon
-            # \s*                    - Optional whitespace
-            # (                       - Start capturing group 1
-            #   [\s\S]*?            - Any character (including newlines), non-greedy
-            # )                       - End capturing group 1
-            # (?=                     - Positive lookahead (pattern must follow, but isn't captured)
-            #    \n^[A-Z][a-zA-Z ]+:?  - Newline, then a likely next heading (starts with capital, has letters/spaces, optional colon)
-            #   |                      - OR
-            #    \Z                   - End of the entire string
-            # )
-            # Handle case where "None mentioned" is the value
-            regex_str = f"^{re.escape(heading)}:?\\s*([\s\S]*?)(?=\n^[A-Z][a-zA-Z ]+:?|\Z)"
-            match = re.search(regex_str, text, re.MULTILINE | re.IGNORECASE)
-            content = match.group(1).strip() if match else ""
-            # If extracted content is effectively "None mentioned", return empty string
-            return "" if content.lower().startswith(('none mentioned', 'n/a')) else content
-
-        ai_draft_structured["chief_complaints"] = extract_section(original_gemini_text, "Chief Complaints")
-        ai_draft_structured["clinical_findings"] = extract_section(original_gemini_text, "Clinical Findings")
-        ai_draft_structured["internal_notes"] = extract_section(original_gemini_text, "Internal Notes")
-        ai_draft_structured["diagnosis"] = extract_section(original_gemini_text, "Diagnosis")
-        ai_draft_structured["procedures_conducted"] = extract_section(original_gemini_text, "Procedures Conducted")
-        ai_draft_structured["investigations"] = extract_section(original_gemini_text, "Investigations")
-        ai_draft_structured["advice_given"] = extract_section(original_gemini_text, "Advice Given")
-        ai_draft_structured["follow_up_date"] = extract_section(original_gemini_text, "Follow-Up Date")
-
-        # Parse Prescription section
-        prescription_text = extract_section(original_gemini_text, "Prescription")
-        if prescription_text:
-            lines = prescription_text.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line or line.lower().startswith(('none mentioned', 'n/a')):
-                    continue
-                parts = [p.strip() for p in line.split('|')]
-                if len(parts) == 3:
-                    ai_draft_structured["prescription_details"].append({
-                        "medicine": parts[0],
-                        "dosage": parts[1],
-                        "duration": parts[2]
-                    })
-                elif len(parts) > 0 and parts[0]: # Fallback for less structured lines
-                    ai_draft_structured["prescription_details"].append({
-                        "medicine": line, # Use the whole line as name
-                        "dosage": "",
-                        "duration": ""
-                    })
+        # --- Parse the Gemini Output (JSON schema, heading parser as fallback) ---
+        ai_draft_structured, draft_source = decode_draft(original_gemini_text)
+        if GEMINI_JSON_MODE and draft_source != "json":
+            logging.warning("Gemini JSON draft failed validation; used heading parser fallback.")
+        add_prescription_suggestions(ai_draft_structured.get("prescription_details"))
         print("Parsed structured draft:", ai_draft_structured)
         ai_generated_draft = ai_draft_structured
 
+    except GeminiUnavailableError:
+        error_message = "Gemini is currently unavailable. Please retry shortly."
+        return jsonify({"ai_draft": f"ERROR: {error_message}", "original_gemini_text": f"ERROR: {error_message}"}), 503
     except Exception as e:
         import traceback
         print(f"Error during Gemini processing or parsing: {e}\n{traceback.format_exc()}")
@@ -1000,6 +1010,144 @@ Follow-Up Date:
         "original_gemini_text": original_gemini_text
     })
 
+# Route: Stream the Gemini draft section by section via Server-Sent Events
+@app.route('/process_transcript_stream', methods=['POST'])
+@login_required # Secure this endpoint
+def process_transcript_stream():
+    """Streams the structured draft to the client as each Gemini section completes."""
+    data = request.json
+    if not data or 'transcript_text' not in data:
+        return jsonify({"error": "Missing 'transcript_text' in request"}), 400
+
+    raw_transcript = data['transcript_text']
+    print(f"Received transcript text for streaming: {len(raw_transcript)} chars")
+
+    def generate():
+        for event, payload in iter_summary_events(raw_transcript):
+            yield sse_event(event, payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # Disable proxy buffering
+    )
+
+# --- Summary Job Queue ---
+# Summaries are queued in MySQL (job_queue.py, migrations/006) and run by worker
+# threads in any process, so web requests return immediately; clients poll the
+# job for its status and new events, or subscribe to them as SSE.
+SUMMARY_WORKERS = int(os.getenv('SUMMARY_WORKERS', '2'))
+SSE_KEEPALIVE_SECONDS = 15
+
+def run_summary_job(job, payload):
+    """Worker: publishes summary events to the job and returns the final draft."""
+    for event, data in iter_summary_events(payload['transcript_text']):
+        job.publish(event, data)
+        if event == "done":
+            return data
+        if event == "error":
+            raise RuntimeError(data["error"])
+
+summary_jobs = JobQueue(
+    get_db_connection, run_summary_job,
+    max_pending=int(os.getenv('SUMMARY_JOB_MAX_PENDING', '50')),
+    result_ttl=int(os.getenv('SUMMARY_JOB_TTL', '900')),
+    stale_after=int(os.getenv('SUMMARY_JOB_STALE_SECONDS', '600')),
+    name='summary-jobs'
+)
+if not IS_PDF_WORKER:
+    summary_jobs.start_workers(SUMMARY_WORKERS)
+
+def summary_jobs_unavailable(err):
+    logging.error(f"Summary job tables unavailable: {err}")
+    return jsonify({"error": "Summarization queue is unavailable. Please retry shortly."}), 503
+
+@app.route('/summary_jobs', methods=['POST'])
+@login_required
+def create_summary_job():
+    """Enqueues a transcript for summarization and returns the job id immediately."""
+    data = request.json
+    if not data or 'transcript_text' not in data:
+        return jsonify({"error": "Missing 'transcript_text' in request"}), 400
+
+    raw_transcript = data['transcript_text']
+    if health_monitor.is_open('gemini'):
+        return jsonify({"error": "Gemini is currently unavailable. Please retry shortly."}), 503
+    try:
+        job_id = summary_jobs.submit(session['user_id'], {'transcript_text': raw_transcript})
+    except JobQueueFull:
+        return jsonify({"error": "Summarization queue is full. Please retry shortly."}), 503
+    except JobQueueUnavailable as err:
+        return summary_jobs_unavailable(err)
+    print(f"Queued summary job {job_id} for transcript of {len(raw_transcript)} chars")
+    return jsonify({
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "status_url": url_for('get_summary_job', job_id=job_id),
+        "events_url": url_for('summary_job_events', job_id=job_id)
+    }), 202
+
+@app.route('/summary_jobs/<job_id>')
+@login_required
+def get_summary_job(job_id):
+    """Returns a summary job's status, its events after ?after=<seq>, and its draft once finished (polling API)."""
+    after = request.args.get('after', 0, type=int)
+    try:
+        job = summary_jobs.get(job_id, owner_id=session['user_id'])
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        # Read after the status, so a finished job's events are all included
+        job["events"] = [{"seq": seq, "event": event, "data": data}
+                         for seq, event, data in summary_jobs.events(job_id, after)]
+    except JobQueueUnavailable as err:
+        return summary_jobs_unavailable(err)
+    return jsonify(job)
+
+@app.route('/summary_jobs/<job_id>/events')
+@login_required
+def summary_job_events(job_id):
+    """Streams a summary job's events as Server-Sent Events until it finishes.
+
+    Each open stream holds a web thread for the whole job; the consultation
+    page polls /summary_jobs/<job_id> instead.
+    """
+    try:
+        if not summary_jobs.get(job_id, owner_id=session['user_id']):
+            return jsonify({"error": "Job not found"}), 404
+    except JobQueueUnavailable as err:
+        return summary_jobs_unavailable(err)
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+
+    def generate():
+        seq = last_seq
+        idle_since = time.monotonic()
+        while True:
+            try:
+                job = summary_jobs.get(job_id)
+                events = summary_jobs.events(job_id, seq) if job else []
+            except JobQueueUnavailable as err:
+                yield sse_event("error", {"error": f"Summarization queue is unavailable: {err}"})
+                return
+            for seq, event, data in events:
+                yield sse_event(event, data, event_id=seq)
+            if not job or job["status"] in JOB_TERMINAL_STATES:
+                return
+            if events:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= SSE_KEEPALIVE_SECONDS:
+                idle_since = time.monotonic()
+                yield ": keepalive\n\n"
+            time.sleep(summary_jobs.poll_interval)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # UPDATED Route: Save consultation details (structured)
 @app.route('/save_consultation', methods=['POST']) # Removed patient_id from URL
 @login_required # Secure this endpoint
@@ -1071,24 +1219,70 @@ def save_consultation():
     # ai_summary = "" # Or handle NULL in DB
 
     # Updated SQL Query (ensure ai_summary placeholder exists if using Option 1)
+    # The full transcript goes to ConsultationTranscript (compressed); the hot row keeps ''
     query = ("""INSERT INTO Consultation (
                 patient_id, doctor_id, consultation_date, raw_transcript, ai_summary,
                 chief_complaints, clinical_findings, internal_notes, diagnosis,
-                procedures_conducted, prescription_details, investigations, advice_given,
+                procedures_conducted, prescription_details, prescription_drug_names, investigations, advice_given,
                 follow_up_date
-             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""")
-    params = (patient_id, doctor_id, consultation_date, raw_transcript, ai_summary, # Use derived ai_summary
+             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""")
+    params = (patient_id, doctor_id, consultation_date, '', ai_summary, # Use derived ai_summary
               chief_complaints, clinical_findings, internal_notes, diagnosis,
-              procedures_conducted, prescription_details_json, investigations, advice_given,
+              procedures_conducted, prescription_details_json, drug_names(prescription_details_list), # Drug names feed the search index
+              investigations, advice_given,
               follow_up_date) # Pass None if date was invalid/empty
 
-    consultation_id = execute_query(query, params)
+    consultation_id = save_consultation_rows(query, params, raw_transcript, data.get("original_gemini_text", ""))
 
     if consultation_id:
         return jsonify({"success": True, "consultation_id": consultation_id})
     else:
         return jsonify({"error": "Failed to save consultation to database"}), 500
 
+def save_consultation_rows(query, params, raw_transcript, original_gemini_text):
+    """Inserts the consultation and its compressed transcript in one transaction; returns the new id or None."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(query, params)
+        consultation_id = cursor.lastrowid
+        cursor.execute(INSERT_TRANSCRIPT_QUERY, transcript_params(consultation_id, raw_transcript, original_gemini_text))
+        conn.commit()
+        return consultation_id
+    except mysql.connector.Error as err:
+        print(f"Database execution error: {err}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+@app.route('/consultation/<int:consultation_id>/transcript')
+@login_required
+@role_required('doctor')
+def consultation_transcript(consultation_id):
+    """Returns the raw transcript and original Gemini text of a consultation, decompressed on demand."""
+    consultation = fetch_one_across('Consultation', "SELECT id, patient_id, consultation_date FROM {table} WHERE id = %s", (consultation_id,))
+    if not consultation:
+        return jsonify({"error": "Consultation not found"}), 404
+    row = fetch_one(TRANSCRIPT_QUERY, (consultation_id,))
+    if row:
+        transcript = decode_transcript_row(row)
+    else:
+        # Saved before the side table existed and not yet moved by backfill_transcripts.py
+        legacy = fetch_one_across('Consultation', "SELECT raw_transcript FROM {table} WHERE id = %s", (consultation_id,))
+        transcript = {"raw_transcript": (legacy or {}).get('raw_transcript') or "", "original_gemini_text": ""}
+    return jsonify({
+        "consultation_id": consultation_id,
+        "patient_id": consultation['patient_id'],
+        "consultation_date": consultation['consultation_date'].isoformat() if consultation['consultation_date'] else None,
+        "raw_transcript": transcript["raw_transcript"],
+        "original_gemini_text": transcript["original_gemini_text"],
+    })
+
 # --- Settings Routes ---
 @app.route('/settings')
 @login_required
@@ -1142,6 +1336,8 @@ def update_settings():
                   clinic_time, clinic_closed, doctor_id)
         
         execute_query(query, params)
+        # Every cached PDF of this doctor shows the old clinic details
+        pdf_cache.invalidate_doctor(doctor_id)
         flash("Settings updated successfully!", "success")
 
     except Exception as e:
@@ -1150,6 +1346,38 @@ def update_settings():
 
     return redirect(url_for('settings_page'))
 
+# --- Consultation PDF Data ---
+# Only the columns drawn in the PDF; shared by single downloads and bulk export so both
+# hash the same rows into the same cache version
+CONSULTATION_PDF_QUERY = """
+    SELECT c.id, c.patient_id, c.doctor_id, c.consultation_date, c.chief_complaints, c.clinical_findings,
+           c.procedures_conducted, c.diagnosis, c.investigations, c.advice_given, c.prescription_details,
+           c.follow_up_date, p.name as patient_name, p.dob as patient_dob, p.gender as patient_gender
+    FROM {table} c
+    JOIN Patient p ON c.patient_id = p.id
+"""
+
+def fetch_pdf_doctor(doctor_id):
+    """Doctor/clinic details for the PDF header, falling back to doctor 1 and then placeholders."""
+    doctor_query = """
+        SELECT name, email, phone_number, registration_number, qualifications,
+               clinic_name, clinic_address, clinic_timings, clinic_closed_days
+        FROM User WHERE id = %s AND role = 'doctor' 
+    """
+    doctor_data = fetch_one(doctor_query, (doctor_id,))
+    if not doctor_data: doctor_data = fetch_one(doctor_query, (1,))
+    if not doctor_data:
+        doctor_data = {'name': 'Dr. Default', 'qualifications': '', 'registration_number': '', 'clinic_name': 'Default Clinic', 'clinic_address': '', 'clinic_timings': '', 'clinic_closed_days': ''}
+    return doctor_data
+
+def fetch_visit_vitals(consultations):
+    """Vitals recorded for each consultation's visit (list parallel to consultations; {} if none), in one query."""
+    pairs = [(c['patient_id'], c['consultation_date']) for c in consultations]
+    if not pairs:
+        return []
+    tables = archive_watermarks.tables_for('Vitals', min(as_of for _, as_of in pairs) - VITALS_MAX_AGE)
+    return vitals_as_of(fetch_all, pairs, max_age=VITALS_MAX_AGE, tables=tables)
+
 # UPDATED Route: PDF Download (Using Dynamic Doctor/Clinic Data)
 @app.route('/download_pdf/<int:consultation_id>')
 @login_required
@@ -1157,105 +1385,168 @@ def download_pdf(consultation_id):
     """Generates and returns a PDF for a specific consultation."""
     try:
         # 1. Fetch Consultation Data
-        consultation_query = """
-            SELECT c.*, p.name as patient_name, p.dob as patient_dob, p.gender as patient_gender
-            FROM Consultation c
-            JOIN Patient p ON c.patient_id = p.id
-            WHERE c.id = %s
-        """
-        consultation_data = fetch_one(consultation_query, (consultation_id,))
+        consultation_data = fetch_one_across('Consultation', CONSULTATION_PDF_QUERY + " WHERE c.id = %s", (consultation_id,))
         if not consultation_data: return jsonify({"error": "Consultation not found"}), 404
 
-        # 2. Fetch Doctor/Clinic Data (as before)
+        # 2. Fetch Doctor/Clinic Data
         doctor_id = consultation_data.get('doctor_id', 1)
-        doctor_query = """
-            SELECT name, email, phone_number, registration_number, qualifications,
-                   clinic_name, clinic_address, clinic_timings, clinic_closed_days
-            FROM User WHERE id = %s AND role = 'doctor' 
-        """
-        doctor_data = fetch_one(doctor_query, (doctor_id,))
-        if not doctor_data: doctor_data = fetch_one(doctor_query, (1,))
-        if not doctor_data:
-            doctor_data = {'name': 'Dr. Default', 'qualifications': '', 'registration_number': '', 'clinic_name': 'Default Clinic', 'clinic_address': '', 'clinic_timings': '', 'clinic_closed_days': ''}
-
-        # 3. Fetch Latest Vitals (as before)
-        latest_vitals = None
-        vitals_query = "SELECT * FROM Vitals WHERE patient_id = %s ORDER BY checkin_time DESC LIMIT 1"
-        latest_vitals = fetch_one(vitals_query, (consultation_data['patient_id'],))
-        if latest_vitals is None: latest_vitals = {}
-
-        # 4. Create PDF
-        pdf = ConsultationPDF(doctor_data)
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        # Add Patient Details & Date (using updated methods)
-        pdf.add_patient_details(consultation_data['patient_name'], consultation_data['patient_id'], consultation_data['patient_dob'], consultation_data['patient_gender'])
-        pdf.add_consultation_date(consultation_data['consultation_date'])
-        
-        # Add Vitals Section (using updated method)
-        pdf.add_vitals(latest_vitals)
-        
-        # --- Add Consultation Sections in Two Columns --- 
-        left_column_data = {
-            "Chief Complaints": consultation_data.get('chief_complaints', ''),
-            "Clinical Findings": consultation_data.get('clinical_findings', ''),
-            "Procedures Conducted": consultation_data.get('procedures_conducted', '')
-        }
-        right_column_data = {
-            "Diagnosis": consultation_data.get('diagnosis', ''),
-            "Investigations": consultation_data.get('investigations', ''),
-            "Advice Given": consultation_data.get('advice_given', '')
-        }
-        pdf.add_two_column_sections(left_column_data, right_column_data)
-        # --- End Two Column Section --- 
-        
-        # Add Prescription Table (Full Width)
-        prescription_details = consultation_data.get('prescription_details')
-        if isinstance(prescription_details, str): # Handle JSON string from DB
-            try: prescription_details = json.loads(prescription_details)
-            except json.JSONDecodeError: prescription_details = None
-        
-        if prescription_details and isinstance(prescription_details, list) and len(prescription_details) > 0:
-             pdf.add_prescription_table(prescription_details)
-        else:
-             # Add note if no prescription (using full_width_section for consistency)
-             pdf.add_full_width_section("Prescription", "(No prescription details recorded)")
-
-        # Add Follow-up Date (Full Width)
-        if consultation_data.get('follow_up_date'):
-            pdf.add_follow_up(consultation_data['follow_up_date'])
-
-        # Generate PDF output
-        pdf_output = pdf.output()
-
-        # Send PDF as a file download
-        return send_file(
-            io.BytesIO(pdf_output),
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'Consultation_{consultation_data["patient_name"]}_{consultation_id}.pdf'
-        )
+        doctor_data = fetch_pdf_doctor(doctor_id)
 
+        # 3. Fetch the Vitals recorded for this visit
+        latest_vitals = fetch_visit_vitals([consultation_data])[0]
+
+        # 4. Serve the cached render of exactly this data, if any
+        version = pdf_version(PDF_LAYOUT_VERSION, consultation_data, doctor_data, latest_vitals)
+        if version in request.if_none_match:
+            response = Response(status=304)
+        else:
+            cached_path = pdf_cache.get(doctor_id, consultation_id, version)
+            if cached_path is None:
+                pdf_output = pdf_render_pool.render(render_consultation_pdf, consultation_data, doctor_data, latest_vitals)
+                cached_path = pdf_cache.put(doctor_id, consultation_id, version, pdf_output)
+            response = send_file(
+                cached_path if cached_path else io.BytesIO(pdf_output),
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name=f'Consultation_{consultation_data["patient_name"]}_{consultation_id}.pdf',
+                etag=version
+            )
+        response.set_etag(version)
+        # Patient data: browsers may keep it but must revalidate; shared caches must not store it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except PdfRenderPoolFull:
+        return jsonify({"error": "PDF generation is busy. Please try again shortly."}), 503, {'Retry-After': '5'}
+    except PdfRenderTimeout:
+        return jsonify({"error": "PDF generation timed out. Please try again."}), 504
     except Exception as e:
         print(f"Error generating PDF: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"Failed to generate PDF: {e}"}), 500
 
-# --- Helper to fetch latest vitals before a certain time ---
-def get_latest_vitals(patient_id, before_time):
-    query = """SELECT * FROM Vitals 
-               WHERE patient_id = %s AND checkin_time < %s 
-               ORDER BY checkin_time DESC 
-               LIMIT 1"""
-    return fetch_one(query, (patient_id, before_time))
+# --- Bulk PDF Export ---
+PDF_EXPORT_WINDOW = int(os.getenv('PDF_EXPORT_WINDOW', '4')) # Renders in flight per export; bounds memory
+PDF_EXPORT_BATCH_SIZE = 50 # Consultation rows fetched per query as the window advances
+
+def submit_export_render(fn, *args):
+    """Waits for a render slot; a render that never gets one is reported in the archive, not raised."""
+    try:
+        return pdf_render_pool.submit(fn, *args, wait=pdf_render_pool.timeout)
+    except PdfRenderPoolFull as e:
+        future = Future()
+        future.set_exception(e)
+        return future
+
+def iter_pdf_rows(consultation_ids):
+    """Yields (consultation, doctor, vitals) for each id, fetching rows one batch at a time."""
+    doctors = {}
+    for i in range(0, len(consultation_ids), PDF_EXPORT_BATCH_SIZE):
+        batch = consultation_ids[i:i + PDF_EXPORT_BATCH_SIZE]
+        placeholders = ", ".join(["%s"] * len(batch))
+        rows = fetch_across('Consultation', CONSULTATION_PDF_QUERY + f" WHERE c.id IN ({placeholders}) ORDER BY c.consultation_date",
+                            tuple(batch), oldest_first=True, limit=len(batch))
+        for row, vitals in zip(rows, fetch_visit_vitals(rows)):
+            doctor_id = row.get('doctor_id', 1)
+            if doctor_id not in doctors:
+                doctors[doctor_id] = fetch_pdf_doctor(doctor_id)
+            yield row, doctors[doctor_id], vitals
+
+def pdf_export_member(row, data):
+    """(arcname, ZIP date_time, bytes) for one consultation PDF."""
+    consultation_date = row.get('consultation_date')
+    if not isinstance(consultation_date, datetime.date) or consultation_date.year < 1980: # ZIP dates start in 1980
+        consultation_date = datetime.datetime.now()
+    if not isinstance(consultation_date, datetime.datetime):
+        consultation_date = datetime.datetime.combine(consultation_date, datetime.time())
+    arcname = f"{consultation_date:%Y-%m-%d}_{secure_filename(row.get('patient_name') or '') or 'patient'}_{row['id']}.pdf"
+    return arcname, consultation_date.timetuple()[:6], data
+
+def iter_export_members(consultation_ids):
+    """Yields ZIP members: cached PDFs as they are found, fresh renders as they complete."""
+    cached = [] # (row, path) found while the render window was being filled
+    failures = []
+
+    def render_jobs():
+        for row, doctor_data, vitals in iter_pdf_rows(consultation_ids):
+            version = pdf_version(PDF_LAYOUT_VERSION, row, doctor_data, vitals)
+            path = pdf_cache.get(row['doctor_id'], row['id'], version)
+            if path:
+                cached.append((row, path))
+            else:
+                yield (row, version), (row, doctor_data, vitals)
+
+    def drain_cached():
+        while cached:
+            row, path = cached.pop(0)
+            try:
+                with open(path, 'rb') as f:
+                    yield pdf_export_member(row, f.read())
+            except OSError: # Superseded by a newer version since the lookup
+                failures.append(f"{row['id']}: cached PDF disappeared; download it individually")
+
+    renders = map_as_completed(submit_export_render, render_consultation_pdf, render_jobs(), PDF_EXPORT_WINDOW,
+                               timeout=pdf_render_pool.timeout)
+    for (row, version), future in renders:
+        yield from drain_cached()
+        try:
+            data = future.result(timeout=0) # Finished, or past its deadline (cancelled if it never started)
+        except (FutureTimeoutError, CancelledError):
+            logging.error(f"Bulk export: rendering consultation {row['id']} timed out")
+            failures.append(f"{row['id']}: timed out after {pdf_render_pool.timeout:g}s; download it individually")
+            continue
+        except Exception as e:
+            logging.exception(f"Bulk export: rendering consultation {row['id']} failed")
+            failures.append(f"{row['id']}: {type(e).__name__}")
+            continue
+        pdf_cache.put(row['doctor_id'], row['id'], version, data)
+        yield pdf_export_member(row, data)
+    yield from drain_cached()
+    if failures:
+        # Headers are long gone once streaming starts, so failures are reported inside the archive
+        yield "export_errors.txt", datetime.datetime.now().timetuple()[:6], "\n".join(failures).encode()
+
+@app.route('/export_pdfs')
+@login_required
+@role_required('doctor')
+def export_pdfs():
+    """Streams a ZIP of consultation PDFs for one patient (?patient_id=) or one day (?date=YYYY-MM-DD)."""
+    patient_id = request.args.get('patient_id', type=int)
+    date_str = request.args.get('date')
+    if patient_id:
+        rows = fetch_across('Consultation', "SELECT id FROM {table} WHERE patient_id = %s ORDER BY consultation_date", (patient_id,), oldest_first=True)
+        download_name = f"Consultations_patient_{patient_id}.zip"
+    elif date_str:
+        try:
+            day = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+        rows = fetch_across('Consultation', """SELECT id FROM {table}
+                            WHERE doctor_id = %s AND consultation_date >= %s AND consultation_date < %s
+                            ORDER BY consultation_date""", (session.get('user_id'), day, day + datetime.timedelta(days=1)),
+                            since=day, oldest_first=True)
+        download_name = f"Consultations_{day:%Y-%m-%d}.zip"
+    else:
+        return jsonify({"error": "patient_id or date is required"}), 400
+    if not rows:
+        return jsonify({"error": "No consultations found"}), 404
+
+    return Response(
+        stream_with_context(iter_zip(iter_export_members([row['id'] for row in rows]))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"', 'Cache-Control': 'private, no-store'}
+    )
 
 # --- WebSocket Route for Live Transcription Demo ---
 @sock.route('/live_transcript')
 @login_required # Secure WebSocket endpoint
 def live_transcript(ws): # ws is the WebSocket connection object
     print("Live transcript WebSocket connected")
+    if health_monitor.is_open('stt'):
+        ws.send("ERROR: Speech-to-text is currently unavailable. Please retry shortly.")
+        ws.close()
+        return
     first_chunk_received = False
     last_activity_time = time.time()
     TIMEOUT_SECONDS = 7 # Timeout if no results after 7s of first chunk
@@ -1411,52 +1702,12 @@ def get_eod_data():
         "consultations": todays_consultations
         })
 
-# --- New Route for Live ADR Check --- (Used by Consultation Page)
-@app.route('/check_adr', methods=['POST'])
-@login_required # Secure this endpoint
-def check_adr():
-    # Optional: Add role check if needed (e.g., ensure only doctor triggers)
-    # if session.get('user_role') != 'doctor':
-    #     return jsonify({"error": "Unauthorized"}), 403
-    
-    if not OPENFDA_API_KEY:
-        return jsonify({"error": "OpenFDA API Key not configured"}), 500
-
-    # --- START: Simple MVP OpenFDA Check (Always Runs) ---
-    try:
-        # Use a common, known drug for this simple check
-        fixed_drug_term_for_check = "aspirin"
-        # Simple query for the label endpoint
-        simple_label_query = f'(openfda.brand_name:"{fixed_drug_term_for_check}"+OR+openfda.generic_name:"{fixed_drug_term_for_check}")'
-        simple_label_url = f"https://api.fda.gov/drug/label.json?api_key={OPENFDA_API_KEY}&search={simple_label_query}&limit=1"
-        
-        # Log the attempt clearly
-        logging.info(f"[MVP VALIDATION CHECK] Attempting hardcoded OpenFDA query for '{fixed_drug_term_for_check}'. URL: {simple_label_url}")
-        
-        # Make the request
-        simple_fda_response = requests.get(simple_label_url, timeout=10)
-        
-        # Log the outcome clearly
-        logging.info(f"[MVP VALIDATION CHECK] OpenFDA Response Status for '{fixed_drug_term_for_check}': {simple_fda_response.status_code}")
-        
-    except requests.exceptions.RequestException as mvp_e:
-        logging.error(f"[MVP VALIDATION CHECK] OpenFDA API request failed for fixed term '{fixed_drug_term_for_check}': {mvp_e}")
-    except Exception as mvp_e_generic:
-         logging.error(f"[MVP VALIDATION CHECK] Unexpected error during simple OpenFDA check: {mvp_e_generic}")
-    # --- END: Simple MVP OpenFDA Check ---
+def gemini_drug_names(text):
+    """Asks Gemini for the drug names in a transcript excerpt; returns a list of strings.
 
-    data = request.get_json()
-    transcript = data.get('transcript', '')
-
-    if not transcript or len(transcript.split()) < 10: # Avoid checking very short transcripts
-        return jsonify({"validated_adrs": []})
-
-    logging.info(f"Checking ADR for transcript segment: {transcript[:100]}...")
-
-    validated_adrs = []
-    try:
-        # 1. Call Gemini to identify potential Drug Names with context awareness
-        prompt = f"""
+    Raises GeminiBusyError / GeminiUnavailableError when no call could be made.
+    """
+    prompt = f"""
         Analyze the following medical consultation transcript. Identify potential drug names mentioned.
         Note that the transcript may contain errors due to speech-to-text inaccuracies. Use your knowledge to infer the most likely correct drug names based on the context.
         Format the output STRICTLY as a JSON list of strings, where each string is a potential drug name.
@@ -1464,85 +1715,230 @@ def check_adr():
         If no drug names are clearly mentioned or inferable, return an empty list [].
 
         Transcript:
-        "{transcript}"
+        "{text}"
 
         Potential Drug Names (JSON list of strings):
         """
-        response = gemini_model.generate_content(prompt)
-        logging.debug(f"Gemini Drug Name check response: {response.text}")
+    response = gemini_client.generate(prompt, priority=PRIORITY_ADR)
+    logging.debug(f"Gemini Drug Name check response: {response.text}")
+
+    # Attempt to parse the JSON list of drug names from Gemini
+    try:
+        # Clean the response text if necessary (remove markdown, etc.)
+        cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
+        potential_drug_names = json.loads(cleaned_response)
+    except json.JSONDecodeError:
+        logging.error(f"Failed to decode JSON list from Gemini drug name response: {response.text}")
+        return [] # Proceed without potential drugs if parsing fails
+    # Validate that it's a list of strings
+    if not isinstance(potential_drug_names, list) or not all(isinstance(item, str) for item in potential_drug_names):
+        logging.warning(f"Gemini did not return a valid list of strings: {cleaned_response}")
+        return []
+    return potential_drug_names
+
+ADR_SYMPTOM_MESSAGE = "Potential Interaction/Side Effect Mentioned"
+
+def detect_adrs(text, deadline, already_alerted=frozenset(), extra_names=()):
+    """Finds and validates drug names in text; returns a dict of results for check_adr.
 
-        # Attempt to parse the JSON list of drug names from Gemini
-        potential_drug_names = []
+    Keys: alerts (list of (key, alert dict) not in already_alerted), partial,
+    skipped (why the Gemini fallback did not run, or None) and pending_names
+    (names whose OpenFDA validation had not finished by the deadline).
+    """
+    alerts = []
+    alerted_keys = set(already_alerted)
+    def add_alert(key, drug_name, heard=None):
+        if key not in alerted_keys:
+            alerted_keys.add(key)
+            alert = {"drug": drug_name, "symptom": ADR_SYMPTOM_MESSAGE}
+            if heard:
+                alert["heard"] = heard # Misrecognized form the name was corrected from
+            alerts.append((key, alert))
+
+    # 1. Scan for known drug names offline; their labels exist, so no validation is needed
+    gemini_text = text
+    if drug_matcher:
+        matches = drug_matcher.find(text)
+        for match in matches:
+            add_alert(match.generic, match.term.title())
+        # Medicine-like sentences without an exact hit: try fuzzy matching, then Gemini
+        unresolved = []
+        for sentence in fallback_sentences(text, matches):
+            fuzzy_hits = fuzzy_drug_index.find_in_text(sentence)
+            for heard, candidate in fuzzy_hits:
+                add_alert(candidate.generic, candidate.term.title(), heard=heard)
+            if not fuzzy_hits:
+                unresolved.append(sentence)
+        gemini_text = " ".join(unresolved)
+        logging.info(f"Drug dictionary matched {[m.term for m in matches]}; "
+                     f"{len(gemini_text)} of {len(text)} chars left for Gemini")
+
+    # 2. Call Gemini to identify remaining potential Drug Names with context awareness
+    potential_drug_names = []
+    skipped = None
+    if gemini_text and len(gemini_text.split()) >= 3:
         try:
-            # Clean the response text if necessary (remove markdown, etc.)
-            cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-            potential_drug_names = json.loads(cleaned_response)
-            # Validate that it's a list of strings
-            if not isinstance(potential_drug_names, list) or not all(isinstance(item, str) for item in potential_drug_names):
-                 logging.warning(f"Gemini did not return a valid list of strings: {cleaned_response}")
-                 potential_drug_names = []
-        except json.JSONDecodeError:
-            logging.error(f"Failed to decode JSON list from Gemini drug name response: {response.text}")
-            potential_drug_names = [] # Proceed without potential drugs if parsing fails
-
-        # 2. Validate potential drug names with OpenFDA label endpoint
-        if potential_drug_names:
-            logging.info(f"Gemini identified potential drug names: {potential_drug_names}")
-            session_requests = requests.Session() # Use session for potential connection reuse
-            # Use a set to avoid duplicate alerts for the same drug in one transcript segment
-            validated_drugs_in_segment = set()
-
-            for drug_name in potential_drug_names:
-                # Skip if already validated in this segment
-                if not drug_name or drug_name.lower() in validated_drugs_in_segment:
-                    continue
-
-                drug_term = drug_name.replace(' ', '+').strip()
-
-                # --- SIMPLIFIED VALIDATION: Check if drug exists in OpenFDA labels ---
-                label_query = f'(openfda.brand_name:"{drug_term}"+OR+openfda.generic_name:"{drug_term}")'
-                label_url = f"https://api.fda.gov/drug/label.json?api_key={OPENFDA_API_KEY}&search={label_query}&limit=1"
-
-                try:
-                    logging.debug(f"Querying OpenFDA Drug Label: {label_url}") # DEBUG level log for URL
-                    fda_response = session_requests.get(label_url, timeout=10)
-
-                    # Handle 404 Not Found gracefully (drug not in label DB)
-                    if fda_response.status_code == 404:
-                        logging.info(f"OpenFDA Drug Label check FAILED for '{drug_name}' (404 Not Found in labels)")
-                        continue # Skip to the next potential drug identified by Gemini
-
-                    # Raise errors for other non-404 issues (like 500, timeout, etc.)
-                    fda_response.raise_for_status()
-
-                    fda_data = fda_response.json()
-                    # Log the result count for clarity
-                    total_found = fda_data.get("meta", {}).get("results", {}).get("total", 0)
-                    logging.info(f"OpenFDA Label response for '{drug_name}': Status={fda_response.status_code}, Total={total_found}")
-
-                    # Check if any results were found (drug label exists)
-                    if total_found > 0:
-                        logging.info(f"OpenFDA Drug Label validation SUCCESS for '{drug_name}'. Adding alert.")
-                        # Add to validated list with a generic symptom message
-                        validated_adrs.append({"drug": drug_name, "symptom": "Potential Interaction/Side Effect Mentioned"})
-                        validated_drugs_in_segment.add(drug_name.lower()) # Add to set to prevent duplicates
-                    else:
-                         # This case might occur if the API returns 200 OK but total is 0
-                         logging.info(f"OpenFDA Drug Label validation FAILED for '{drug_name}' (No matching labels found, total=0)")
+            # ADR polls yield to summaries and give up quickly when Gemini is saturated
+            potential_drug_names = gemini_drug_names(gemini_text)
+        except GeminiBusyError:
+            logging.warning("Skipping Gemini ADR fallback: Gemini is busy with higher-priority calls.")
+            skipped = "gemini_busy"
+        except GeminiUnavailableError:
+            logging.warning("Skipping Gemini ADR fallback: Gemini circuit breaker is open.")
+            skipped = "gemini_unavailable"
+
+    names = []
+    for name in list(potential_drug_names) + list(extra_names):
+        if not name or not name.strip():
+            continue
+        generic = drug_matcher.terms.get(normalize_term(name)) if drug_matcher else None
+        candidate = fuzzy_drug_index.best_match(name) if fuzzy_drug_index and generic is None else None
+        if generic is not None: # Gemini corrected a mis-transcription to a known name
+            add_alert(generic, name)
+        elif candidate is not None: # Close to a known name (e.g. Gemini's own misspelling)
+            add_alert(candidate.generic, candidate.term.title(), heard=name)
+        elif normalize_term(name) not in alerted_keys:
+            names.append(name)
+
+    # 3. Validate the remaining names with OpenFDA label endpoint
+    # (cached names answer immediately; misses run concurrently until the deadline)
+    lookup = None
+    if names and not OPENFDA_API_KEY: # Dictionary and fuzzy hits above still alert
+        logging.info(f"OpenFDA not configured; not alerting on unvalidated names: {names}")
+    elif names:
+        logging.info(f"Validating potential drug names with OpenFDA: {names}")
+        lookup = drug_label_cache.lookup_many(
+            openfda_executor, names, OPENFDA_LABEL_URL, OPENFDA_API_KEY,
+            deadline=deadline, breaker=health_monitor.breaker('openfda')
+        )
+        for drug_name in lookup.found:
+            logging.info(f"OpenFDA Drug Label validation SUCCESS for '{drug_name}'. Adding alert.")
+            add_alert(normalize_term(drug_name), drug_name)
+        if lookup.not_found:
+            logging.info(f"OpenFDA Drug Label validation FAILED (no matching labels) for: {lookup.not_found}")
+        if lookup.partial:
+            logging.warning(f"ADR check returning partial results; pending={lookup.pending}, failed={lookup.failed}")
+
+    return {
+        "alerts": alerts,
+        "partial": bool(lookup and lookup.partial),
+        "skipped": skipped,
+        "pending_names": (lookup.pending + lookup.failed) if lookup else [],
+    }
 
-                except requests.exceptions.RequestException as e:
-                    # Log API errors but don't stop the whole process
-                    logging.error(f"OpenFDA API request failed for drug label '{drug_name}': {e}")
-                except json.JSONDecodeError:
-                    logging.error(f"Failed to decode JSON from OpenFDA label response for '{drug_name}'")
-                # Let other unexpected errors propagate up if necessary
+# Per-consultation incremental ADR state, keyed by (user_id, session_key)
+adr_sessions = AdrSessionStore(ttl=int(os.getenv('ADR_SESSION_TTL', '7200')))
+ADR_MAX_WINDOW_CHARS = 4000 # Advance past text Gemini could not analyze once the backlog is this long
 
-    except Exception as e:
-        import traceback # Ensure traceback is imported if used here
-        logging.error(f"Error during ADR check: {e}", exc_info=True)
+# --- New Route for Live ADR Check --- (Used by Consultation Page)
+@app.route('/check_adr', methods=['POST'])
+@login_required # Secure this endpoint
+def check_adr():
+    """Checks a transcript for drugs with potential ADRs.
+
+    Incremental mode (consultation page): {"session_key", "offset", "delta"}
+    sends only text added since the last processed_offset; only new alerts are
+    returned. Legacy mode: {"transcript"} analyzes the whole text every time.
+    """
+    # Optional: Add role check if needed (e.g., ensure only doctor triggers)
+    # if session.get('user_role') != 'doctor':
+    #     return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.get_json() or {}
+    check_started = time.time()
+    deadline = check_started + ADR_CHECK_DEADLINE_SECONDS
+
+    if 'session_key' not in data:
+        transcript = data.get('transcript', '')
+        if not transcript or len(transcript.split()) < 10: # Avoid checking very short transcripts
+            return jsonify({"validated_adrs": []})
+        logging.info(f"Checking ADR for transcript segment: {transcript[:100]}...")
+        try:
+            result = detect_adrs(transcript, deadline)
+        except Exception as e:
+            logging.error(f"Error during ADR check: {e}", exc_info=True)
+            return jsonify({"validated_adrs": [], "partial": True})
+        validated_adrs = [alert for _, alert in result["alerts"]]
+        logging.info(f"Returning validated ADRs: {validated_adrs}")
+        response = {"validated_adrs": validated_adrs, "partial": result["partial"]}
+        if result["skipped"]:
+            response["skipped"] = result["skipped"]
+        return jsonify(response)
+
+    # --- Incremental mode ---
+    try:
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'offset' must be an integer"}), 400
+    delta = data.get('delta', '')
+    final = bool(data.get('final'))
+    adr_session = adr_sessions.get(session['user_id'], str(data['session_key'])[:64])
+
+    if not adr_session.lock.acquire(blocking=False):
+        # A previous poll for this consultation is still running; the client resends the same delta later
+        return jsonify({"validated_adrs": [], "processed_offset": adr_session.processed_offset, "busy": True})
+    try:
+        window = adr_session.window(offset, delta)
+        if window is None:
+            # State expired or the server restarted: ask the client to resend from our offset
+            return jsonify({"validated_adrs": [], "processed_offset": adr_session.processed_offset, "resync": True})
+        window_text, new_offset = window
+        if new_offset == adr_session.processed_offset and not adr_session.pending_names:
+            return jsonify({"validated_adrs": [], "processed_offset": new_offset})
+        if len(window_text.split()) < 10 and not final: # Wait for more text before analyzing
+            return jsonify({"validated_adrs": [], "processed_offset": adr_session.processed_offset})
+
+        logging.info(f"Incremental ADR check: offset {adr_session.processed_offset} -> {new_offset}, "
+                     f"window {len(window_text)} chars, {len(adr_session.pending_names)} pending names")
+        try:
+            result = detect_adrs(window_text, deadline, adr_session.alerted, sorted(adr_session.pending_names))
+        except Exception as e:
+            logging.error(f"Error during ADR check: {e}", exc_info=True)
+            return jsonify({"validated_adrs": [], "processed_offset": adr_session.processed_offset, "partial": True})
+
+        adr_session.alerted.update(key for key, _ in result["alerts"])
+        adr_session.pending_names = set(result["pending_names"])
+        # Re-analyze text Gemini had to skip on the next poll, unless the backlog grows too long
+        if not result["skipped"] or len(window_text) > ADR_MAX_WINDOW_CHARS:
+            adr_session.advance(window_text, new_offset)
+        new_adrs = [alert for _, alert in result["alerts"]]
+        logging.info(f"Returning new ADRs: {new_adrs}")
+        response = {"validated_adrs": new_adrs, "processed_offset": adr_session.processed_offset,
+                    "partial": result["partial"]}
+        if result["skipped"]:
+            response["skipped"] = result["skipped"]
+        return jsonify(response)
+    finally:
+        adr_session.lock.release()
+
+# --- Gemini Usage Metrics ---
+@app.route('/gemini_stats')
+@login_required
+@role_required('doctor')
+def gemini_stats():
+    """Returns Gemini queue depth, retry counters and latency percentiles."""
+    return jsonify(gemini_client.stats())
+
+@app.route('/openfda_stats')
+@login_required
+@role_required('doctor')
+def openfda_stats():
+    """Returns OpenFDA label cache size and hit rate."""
+    return jsonify(drug_label_cache.stats())
 
-    logging.info(f"Returning validated ADRs: {validated_adrs}")
-    return jsonify({"validated_adrs": validated_adrs})
+@app.route('/pdf_stats')
+@login_required
+@role_required('doctor')
+def pdf_stats():
+    """Returns PDF render pool queue depth, counters and render time percentiles, plus cache counters."""
+    return jsonify({"render_pool": pdf_render_pool.stats(), "cache": pdf_cache.stats()})
+
+# --- Health Endpoint (no login; for load balancers and uptime checks) ---
+@app.route('/health')
+def health():
+    """Returns the cached dependency status; 503 if a critical dependency is down."""
+    ok, dependencies = health_monitor.status()
+    return jsonify({"status": "ok" if ok else "degraded", "dependencies": dependencies}), 200 if ok else 503
 
 # --- Check-in / Vitals Routes (Operator Interface) ---
 
@@ -1552,7 +1948,7 @@ def check_adr():
 def check_in_dashboard():
     """Displays the operator check-in dashboard."""
     # Fetch patients for selection
-    patients = fetch_all("SELECT id, name, dob FROM Patient ORDER BY name")
+    patients = fetch_iter("SELECT id, name FROM Patient ORDER BY name")
     return render_template('check_in.html', patients=patients)
 
 @app.route('/add_patient', methods=['GET', 'POST'])
@@ -1746,7 +2142,7 @@ def manage_patients():
     """Displays a list of patients for management."""
     # Fetch patient details and JOIN with User to get mobile number
     # Using LEFT JOIN in case a Patient record somehow exists without a linked User
-    patients = fetch_all("""
+    patients = fetch_iter("""
         SELECT 
             p.id, p.name, p.dob, p.gender, p.address, 
             u.mobile_number 
@@ -1832,6 +2228,7 @@ def edit_patient(patient_id):
                  
             cursor = conn.cursor()
             try:
+                conn.start_transaction() # Connections autocommit otherwise
                 # 1. Update Patient table (always do this)
                 patient_query = """UPDATE Patient SET name = %s, dob = %s, gender = %s, address = %s
                                    WHERE id = %s"""
@@ -1897,11 +2294,12 @@ def delete_patient(patient_id):
         flash("Patient not found.", "danger")
     else:
         try:
-            related_consultations = fetch_one("SELECT COUNT(*) as count FROM Consultation WHERE patient_id = %s", (patient_id,))
-            if related_consultations and related_consultations['count'] > 0:
+            related_consultations = fetch_one_across('Consultation', "SELECT id FROM {table} WHERE patient_id = %s LIMIT 1", (patient_id,))
+            if related_consultations:
                  flash(f"Cannot delete patient '{patient['name']}' because they have existing consultations.", "danger")
             else:
-                 execute_query("DELETE FROM Vitals WHERE patient_id = %s", (patient_id,))
+                 for vitals_table in archive_watermarks.tables_for('Vitals'):
+                     execute_query(f"DELETE FROM {vitals_table} WHERE patient_id = %s", (patient_id,))
                  execute_query("DELETE FROM Patient WHERE id = %s", (patient_id,))
                  flash(f"Patient '{patient['name']}' and associated vitals deleted successfully.", "success")
         except Exception as e:
@@ -1909,25 +2307,100 @@ def delete_patient(patient_id):
 
     return redirect(url_for('manage_patients'))
     
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50 # Deep OFFSETs rescan every skipped hit; refine the query instead
+
+@app.route('/search_consultations')
+@login_required
+@role_required('doctor')
+def search_consultations():
+    """Ranked full-text search over past consultations (complaints, diagnosis, drugs, advice)."""
+    text = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int) or 1, 1), SEARCH_MAX_PAGE)
+    patient_id = request.args.get('patient_id', type=int)
+    hits, has_more, searched = [], False, False
+    search = build_search_query(text, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE, patient_id,
+                                archive_watermarks.tables_for('Consultation'))
+    if search:
+        searched = True
+        start = time.perf_counter()
+        rows = fetch_all(*search)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logging.info(f"[SEARCH] terms={search[1][0]!r} page={page} hits={len(rows)} ms={elapsed_ms:.1f}")
+        has_more = len(rows) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGE # No Next link past the last page served
+        terms = [term.strip('+*') for term in search[1][0].split()]
+        for row in rows[:SEARCH_PAGE_SIZE]:
+            row['matched'] = snippet(row['chief_complaints'] or row['advice_given'], terms)
+            hits.append(row)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            "query": text, "page": page, "has_more": has_more,
+            "results": [{
+                "consultation_id": hit['id'], "patient_id": hit['patient_id'], "patient_name": hit['patient_name'],
+                "consultation_date": hit['consultation_date'].isoformat() if hit['consultation_date'] else None,
+                "diagnosis": hit['diagnosis'], "drugs": hit['prescription_drug_names'], "matched": hit['matched'],
+                "score": float(hit['score']),
+            } for hit in hits],
+        })
+    return render_template('search_consultations.html', query=text, page=page, patient_id=patient_id,
+                           hits=hits, has_more=has_more, searched=searched)
+
 @app.route('/patient_history/<int:patient_id>')
 @login_required
 @role_required('doctor')
 def patient_history(patient_id):
     """Displays the consultation history for a specific patient."""
-    patient = fetch_one("SELECT id, name FROM Patient WHERE id = %s", (patient_id,))
+    patient = fetch_one(PATIENT_NAME_QUERY, (patient_id,))
     if not patient:
         flash("Patient not found.", "danger")
         return redirect(url_for('manage_patients'))
 
-    consultations = fetch_all("""
-        SELECT id, consultation_date, diagnosis 
-        FROM Consultation 
+    consultations = fetch_across('Consultation', """
+        SELECT id, patient_id, consultation_date, diagnosis 
+        FROM {table} 
         WHERE patient_id = %s 
         ORDER BY consultation_date DESC
     """, (patient_id,))
+    for consultation, vitals in zip(consultations, fetch_visit_vitals(consultations)):
+        consultation['vitals'] = vitals
 
     return render_template('patient_history.html', patient=patient, consultations=consultations)
 
+@app.route('/patient_history/<int:patient_id>/pdf')
+@login_required
+@role_required('doctor')
+def patient_history_pdf(patient_id):
+    """Returns one PDF with every consultation of the patient (for referrals)."""
+    patient = fetch_one(PATIENT_NAME_QUERY, (patient_id,))
+    if not patient:
+        return jsonify({"error": "Patient not found"}), 404
+    # The render worker streams the consultations from its own connection
+    db_config = {'host': db_host, 'user': db_user, 'password': db_password, 'database': db_name}
+    try:
+        pdf_output, count = pdf_render_pool.render(
+            render_patient_history_pdf, db_config, patient_id, fetch_pdf_doctor(session.get('user_id')), VITALS_MAX_AGE,
+            archive_watermarks.snapshot(),
+            timeout=PDF_HISTORY_TIMEOUT
+        )
+    except PdfRenderPoolFull:
+        return jsonify({"error": "PDF generation is busy. Please try again shortly."}), 503, {'Retry-After': '5'}
+    except PdfRenderTimeout:
+        return jsonify({"error": "History PDF generation timed out."}), 504
+    except mysql.connector.Error as err:
+        print(f"Database query error: {err}")
+        return jsonify({"error": "Could not read the consultation history"}), 500
+    if not count:
+        return jsonify({"error": "No consultations found"}), 404
+    response = send_file(
+        io.BytesIO(pdf_output),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'History_{secure_filename(patient["name"] or "") or "patient"}_{patient_id}.pdf'
+    )
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
 @app.route('/add_user', methods=['GET', 'POST'])
 @login_required
 @role_required('doctor') # Only doctors can add operators
@@ -2027,6 +2500,7 @@ def register_patient():
             
             cursor = conn.cursor() # Need a single cursor for transaction-like behavior
             try:
+                conn.start_transaction() # Connections autocommit otherwise
                 # 1. Insert into Patient table
                 # --- FIX: Remove mobile_number from Patient insert ---
                 patient_query = """INSERT INTO Patient (name, dob, gender, address)
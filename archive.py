@@ -0,0 +1,84 @@
+"""Archive tables for rows that have aged out of the hot Consultation, Vitals and SymptomLog tables.
+
+archive_data.py moves rows older than a horizon (whole months) into
+ConsultationArchive, VitalsArchive and SymptomLogArchive
+(migrations/004_archive_tables.sql) and records the cut-off per table in
+ArchiveWatermark. The watermark is written before any row moves and each
+batch moves in one transaction, so every row is in exactly one of the two
+tables and rows older than the watermark may be in either. Readers cache
+the watermark (ArchiveWatermarks, ARCHIVE_WATERMARK_TTL seconds), so
+archive_data.py waits longer than that TTL after raising it before moving
+rows; the two settings must be kept in step.
+
+Readers ask tables_for() which tables can hold the rows they need: a query
+about the last 30 days only touches the hot table, a patient's full history
+reads both. Hot rows are always newer than archived ones, so results from
+the two tables are concatenated in date order without re-sorting.
+"""
+import time
+import datetime
+import threading
+
+import mysql.connector
+
+ARCHIVED_TABLES = {
+    # hot table: (archive table, date column the horizon applies to)
+    "Consultation": ("ConsultationArchive", "consultation_date"),
+    "Vitals": ("VitalsArchive", "checkin_time"),
+    "SymptomLog": ("SymptomLogArchive", "log_timestamp"),
+}
+WATERMARK_QUERY = "SELECT table_name, archived_before FROM ArchiveWatermark"
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.datetime) or value is None:
+        return value
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def read_watermarks(conn):
+    """{table: archived_before} read on conn, for scripts without an ArchiveWatermarks cache."""
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute(WATERMARK_QUERY)
+        return {row["table_name"]: _as_datetime(row["archived_before"]) for row in cursor.fetchall()}
+    except mysql.connector.Error: # Archive tables not created (migration 004 not applied)
+        return {}
+    finally:
+        cursor.close()
+
+
+def tables_for(watermarks, table, since=None, oldest_first=False):
+    """Tables holding rows of table dated at or after since (None: all of history), newest first by default.
+
+    watermarks: {table: archived_before datetime}, e.g. ArchiveWatermarks.snapshot().
+    """
+    archived_before = watermarks.get(table)
+    since = _as_datetime(since)
+    if archived_before is None or (since is not None and since >= archived_before):
+        return (table,)
+    tables = (table, ARCHIVED_TABLES[table][0])
+    return tables[::-1] if oldest_first else tables
+
+
+class ArchiveWatermarks:
+    """Cached ArchiveWatermark rows; archival runs rarely, so they are re-read at most every ttl seconds."""
+
+    def __init__(self, fetch_all, ttl=60):
+        self._fetch_all = fetch_all
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._watermarks = {}
+        self._loaded_at = None
+
+    def snapshot(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl:
+                # A missing table (migration not applied) reads as no archive
+                rows = self._fetch_all(WATERMARK_QUERY)
+                self._watermarks = {row["table_name"]: _as_datetime(row["archived_before"]) for row in rows}
+                self._loaded_at = time.monotonic()
+            return dict(self._watermarks)
+
+    def tables_for(self, table, since=None, oldest_first=False):
+        return tables_for(self.snapshot(), table, since, oldest_first)
@@ -0,0 +1,111 @@
+"""Moves Consultation, Vitals and SymptomLog rows older than the horizon into their archive tables.
+
+Run nightly (e.g. from cron) after applying migrations/004_archive_tables.sql.
+The cut-off is the first day of the month ARCHIVE_HORIZON_MONTHS (default 12)
+months back, so rows move a month at a time. For each table the watermark is
+raised first; then rows are copied and deleted in id-ordered batches, one
+transaction per batch (see archive.py for why this order keeps readers
+correct). Web processes cache the watermark for ARCHIVE_WATERMARK_TTL seconds
+(default 60), so after raising it the script waits that long plus a margin
+(--settle-seconds) before moving any row; otherwise a process still holding the
+old watermark would read only the hot table and miss the moved rows. The
+watermark never moves back, so lowering the horizon later does not hide rows
+that were already archived.
+
+Usage:
+    python archive_data.py [--months 12] [--batch-size 1000] [--tables Consultation Vitals SymptomLog]
+                           [--settle-seconds 65] [--dry-run]
+"""
+import os
+import sys
+import time
+import datetime
+import argparse
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from archive import ARCHIVED_TABLES
+
+CURRENT_WATERMARK_QUERY = "SELECT archived_before FROM ArchiveWatermark WHERE table_name = %s"
+RAISE_WATERMARK_QUERY = """
+    INSERT INTO ArchiveWatermark (table_name, archived_before) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE archived_before = GREATEST(archived_before, VALUES(archived_before))
+"""
+
+
+def horizon_cutoff(months, today=None):
+    """Midnight on the first day of the month `months` months before today's month."""
+    today = today or datetime.date.today()
+    month_index = today.year * 12 + today.month - 1 - months
+    return datetime.datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def archive_table(conn, table, before, batch_size, settle_seconds=0, dry_run=False):
+    """Moves rows of table dated before `before` into its archive; returns the number moved.
+
+    When the watermark is raised, waits settle_seconds before moving rows so
+    that every reader's cached watermark has expired.
+    """
+    archive, date_column = ARCHIVED_TABLES[table]
+    cursor = conn.cursor()
+    if dry_run:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {date_column} < %s", (before,))
+        (count,) = cursor.fetchone()
+        cursor.close()
+        return count
+    cursor.execute(CURRENT_WATERMARK_QUERY, (table,))
+    current = cursor.fetchone()
+    cursor.execute(RAISE_WATERMARK_QUERY, (table, before))
+    conn.commit()
+    if current is None or current[0] < before:
+        time.sleep(settle_seconds)
+    moved = 0
+    while True:
+        cursor.execute(f"SELECT id FROM {table} WHERE {date_column} < %s ORDER BY id LIMIT %s", (before, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"INSERT INTO {archive} SELECT * FROM {table} WHERE id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        conn.commit()
+        moved += len(ids)
+    cursor.close()
+    return moved
+
+
+def main():
+    load_dotenv() # Before parsing: defaults come from the environment
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, default=int(os.getenv("ARCHIVE_HORIZON_MONTHS", "12")))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--tables", nargs="+", choices=list(ARCHIVED_TABLES), default=list(ARCHIVED_TABLES))
+    parser.add_argument("--settle-seconds", type=float,
+                        default=int(os.getenv("ARCHIVE_WATERMARK_TTL", "60")) + 5,
+                        help="Wait after raising a watermark; must exceed the web app's ARCHIVE_WATERMARK_TTL")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would move")
+    args = parser.parse_args()
+    if args.months < 1:
+        parser.error("--months must be at least 1")
+
+    before = horizon_cutoff(args.months)
+    conn = mysql.connector.connect(host=os.getenv("DB_HOST"), user=os.getenv("DB_USER"),
+                                   password=os.getenv("DB_PASSWORD"), database=os.getenv("DB_NAME"))
+    try:
+        for table in args.tables:
+            start = time.perf_counter()
+            count = archive_table(conn, table, before, args.batch_size, args.settle_seconds, args.dry_run)
+            verb = "would move" if args.dry_run else "moved"
+            print(f"{table}: {verb} {count} rows dated before {before:%Y-%m-%d} in {time.perf_counter() - start:.1f}s")
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Archival stopped: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Moves raw transcripts from Consultation into the compressed ConsultationTranscript table.
+
+Run once after applying migrations/002_consultation_transcript.sql. Rows are
+processed in id order, a batch per transaction: each transcript is compressed
+(transcript_store.py), inserted into ConsultationTranscript and then blanked in
+Consultation. The column is kept (as '') rather than dropped so older code and
+the INSERT in save_consultation keep working. Safe to re-run: only rows that
+still have text in Consultation.raw_transcript are picked up.
+
+Usage:
+    python backfill_transcripts.py [--batch-size 200] [--codec zlib|zstd] [--keep-source]
+"""
+import os
+import sys
+import argparse
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from transcript_store import DEFAULT_CODEC, CODEC_ZLIB, CODEC_ZSTD, INSERT_TRANSCRIPT_QUERY, transcript_params
+
+PENDING_QUERY = """
+    SELECT id, raw_transcript FROM Consultation
+    WHERE id > %s AND raw_transcript IS NOT NULL AND raw_transcript != ''
+    ORDER BY id
+    LIMIT %s
+"""
+
+
+def backfill(conn, batch_size, codec, keep_source):
+    stats = {"rows": 0, "chars": 0, "compressed_bytes": 0}
+    last_id = 0
+    while True:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(PENDING_QUERY, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            cursor.close()
+            return stats
+        params = [transcript_params(row["id"], row["raw_transcript"], codec=codec) for row in rows]
+        cursor.executemany(INSERT_TRANSCRIPT_QUERY, params)
+        ids = [row["id"] for row in rows]
+        if not keep_source:
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"UPDATE Consultation SET raw_transcript = '' WHERE id IN ({placeholders})", ids)
+        conn.commit()
+        cursor.close()
+        last_id = ids[-1]
+        stats["rows"] += len(rows)
+        stats["chars"] += sum(p[4] for p in params)
+        stats["compressed_bytes"] += sum(len(p[2] or b"") for p in params)
+        print(f"Moved {stats['rows']} transcripts (up to consultation {last_id})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--codec", choices=[CODEC_ZLIB, CODEC_ZSTD], default=DEFAULT_CODEC)
+    parser.add_argument("--keep-source", action="store_true", help="Copy without blanking Consultation.raw_transcript")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = mysql.connector.connect(host=os.getenv("DB_HOST"), user=os.getenv("DB_USER"),
+                                   password=os.getenv("DB_PASSWORD"), database=os.getenv("DB_NAME"))
+    try:
+        stats = backfill(conn, args.batch_size, args.codec, args.keep_source)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Backfill stopped: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    ratio = stats["compressed_bytes"] / stats["chars"] if stats["chars"] else 0
+    print(f"Done: {stats['rows']} transcripts, {stats['chars']} chars -> {stats['compressed_bytes']} bytes ({ratio:.0%}) with {args.codec}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Benchmark: Gemini draft parsing speed and field accuracy.
+
+Compares, over the recorded outputs in corpus/gemini_draft_outputs.jsonl:
+  * legacy  - the original per-heading regex parser (nine scans, pattern built per call)
+  * text    - the single-scan heading parser now used as the fallback
+  * json    - ConsultationDraft.from_json on the schema-constrained output
+
+Usage: python benchmarks/bench_draft_parser.py [--iterations 2000]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from consultation_draft import ConsultationDraft, parse_free_text_draft, DRAFT_SECTION_HEADINGS
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "gemini_draft_outputs.jsonl")
+
+
+def legacy_parse(text):
+    """The original process_transcript_text parser, kept here as the baseline."""
+    def extract_section(text, heading):
+        regex_str = f"^{re.escape(heading)}:?\\s*([\\s\\S]*?)(?=\n^[A-Z][a-zA-Z ]+:?|\\Z)"
+        match = re.search(regex_str, text, re.MULTILINE | re.IGNORECASE)
+        content = match.group(1).strip() if match else ""
+        return "" if content.lower().startswith(('none mentioned', 'n/a')) else content
+
+    draft = {key: extract_section(text, heading) for heading, key in DRAFT_SECTION_HEADINGS if key != "prescription_details"}
+    draft["prescription_details"] = []
+    for line in extract_section(text, "Prescription").split('\n'):
+        line = line.strip()
+        if not line or line.lower().startswith(('none mentioned', 'n/a')):
+            continue
+        parts = [p.strip() for p in line.split('|')]
+        if len(parts) == 3:
+            draft["prescription_details"].append({"medicine_name": parts[0], "dosage": parts[1], "duration": parts[2]})
+        elif parts[0]:
+            draft["prescription_details"].append({"medicine_name": line, "dosage": "", "duration": ""})
+    return draft
+
+
+def json_parse(text):
+    return ConsultationDraft.from_json(text).to_dict()
+
+
+def field_matches(key, actual, expected):
+    if key == "prescription_details":
+        def summary(items):
+            return [(i.get("medicine_name", ""), i.get("dosage", ""), i.get("duration", "")) for i in items or []]
+        return summary(actual) == summary(expected)
+    return " ".join(str(actual or "").split()) == " ".join(str(expected or "").split())
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(parser_name, parser, inputs, expected, iterations):
+    correct = total = 0
+    for text, exp in zip(inputs, expected):
+        draft = parser(text)
+        for _, key in DRAFT_SECTION_HEADINGS:
+            total += 1
+            correct += field_matches(key, draft.get(key), exp.get(key))
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in inputs:
+            parser(text)
+    elapsed = time.perf_counter() - start
+    per_parse_us = elapsed / (iterations * len(inputs)) * 1e6
+    print(f"{parser_name:<8} {per_parse_us:>10.1f} us/parse {correct:>4}/{total:<4} fields correct ({correct / total:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    expected = [case["expected"] for case in corpus]
+    print(f"{len(corpus)} recorded outputs, {args.iterations} iterations each\n")
+    run("legacy", legacy_parse, [case["free_text"] for case in corpus], expected, args.iterations)
+    run("text", parse_free_text_draft, [case["free_text"] for case in corpus], expected, args.iterations)
+    run("json", json_parse, [case["json_text"] for case in corpus], expected, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark: offline drug-name detection speed.
+
+Builds the dictionary from an OpenFDA label dump (the local seed data by
+default) and scans synthetic transcripts of increasing length with:
+  * regex    - one word-boundary regex per dictionary term (the naive approach)
+  * matcher  - the Aho-Corasick DrugMatcher used by check_adr
+then times FuzzyDrugIndex lookups for misheard spellings of dictionary terms.
+
+Usage: python benchmarks/bench_drug_matcher.py [--labels fake_data/openfda_labels.json] [--iterations 200]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_drug_dictionary import build_dictionary
+from drug_matcher import DrugMatcher
+from fuzzy_drug_index import FuzzyDrugIndex
+
+FILLER = ("patient reports feeling tired in the evenings and mild headache since monday. "
+          "no fever, appetite is fine, sleeping about six hours. ").split()
+
+
+def make_transcript(rng, words, terms):
+    tokens = [rng.choice(FILLER) for _ in range(words)]
+    for _ in range(max(1, words // 60)):
+        tokens[rng.randrange(words)] = rng.choice(terms)
+    return " ".join(tokens)
+
+
+def garble(rng, term):
+    """Applies one substitution, deletion or duplication, like a typical STT slip."""
+    i = rng.randrange(1, len(term) - 1)
+    edit = rng.choice(("sub", "del", "dup"))
+    if edit == "sub":
+        return term[:i] + rng.choice("aeiou") + term[i + 1:], term
+    if edit == "del":
+        return term[:i] + term[i + 1:], term
+    return term[:i] + term[i] + term[i:], term
+
+
+def time_it(fn, text, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn(text)
+    return (time.perf_counter() - start) / iterations * 1e6, result
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", nargs="+", default=[os.path.join(root, "fake_data", "openfda_labels.json")])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    terms, _ = build_dictionary(args.labels)
+    start = time.perf_counter()
+    matcher = DrugMatcher(terms)
+    build_ms = (time.perf_counter() - start) * 1e3
+    patterns = [re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE) for term in terms]
+
+    def regex_scan(text):
+        return [pattern.pattern for pattern in patterns if pattern.search(text)]
+
+    print(f"{len(terms)} terms, automaton built in {build_ms:.1f} ms\n")
+    print(f"{'words':>6} {'regex us':>10} {'matcher us':>11} {'speedup':>8} {'hits':>5}")
+    rng = random.Random(1)
+    for words in (50, 200, 1000, 5000):
+        text = make_transcript(rng, words, list(terms))
+        regex_us, _ = time_it(regex_scan, text, args.iterations)
+        matcher_us, matches = time_it(matcher.find, text, args.iterations)
+        print(f"{words:>6} {regex_us:>10.1f} {matcher_us:>11.1f} {regex_us / matcher_us:>7.1f}x {len(matches):>5}")
+
+    index = FuzzyDrugIndex(terms)
+    misheard = [garble(rng, term) for term in terms if len(term) >= 6]
+    start = time.perf_counter()
+    correct = 0
+    for _ in range(max(1, args.iterations // 50)):
+        correct = 0
+        for word, term in misheard:
+            candidates = index.lookup(word, limit=1)
+            correct += bool(candidates) and candidates[0].term == term
+    per_lookup_us = (time.perf_counter() - start) / (max(1, args.iterations // 50) * len(misheard)) * 1e6
+    print(f"\nfuzzy: {per_lookup_us:.1f} us/lookup, top-1 correct for {correct}/{len(misheard)} single-edit misspellings")
+
+
+if __name__ == "__main__":
+    main()
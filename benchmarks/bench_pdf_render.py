@@ -0,0 +1,148 @@
+"""Benchmark: consultation PDF render time by prescription size.
+
+Renders synthetic consultations with 1, 20 and 200 prescription rows with:
+  * legacy  - the original two-pass layout (split_only / dry_run measurement,
+              then multi_cell again to draw every column section and table cell)
+  * current - ConsultationPDF, which wraps each text block once and draws the lines
+
+Usage: python benchmarks/bench_pdf_render.py [--iterations 20] [--rows 1 20 200]
+"""
+import os
+import sys
+import time
+import random
+import datetime
+import argparse
+import statistics
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf.enums import XPos, YPos
+
+import consultation_pdf
+from consultation_pdf import ConsultationPDF, render_consultation_pdf
+
+MEDICINES = ["Metformin 500 mg", "Amlodipine 5 mg", "Atorvastatin 20 mg", "Pantoprazole 40 mg",
+             "Amoxicillin 500 mg + Clavulanic Acid 125 mg", "Paracetamol 650 mg", "Cetirizine 10 mg",
+             "Salbutamol 100 mcg inhaler", "Vitamin D3 60000 IU sachet", "Losartan 50 mg"]
+INSTRUCTIONS = ["after food", "before breakfast, on an empty stomach", "at bedtime",
+                "with plenty of water; stop if rash or swelling of the face develops", ""]
+DOCTOR = {"name": "Dr. Meera Iyer", "qualifications": "MBBS, MD (General Medicine)", "registration_number": "KMC 45821",
+          "phone_number": "+91 98450 00000", "email": "clinic@example.com", "clinic_name": "Iyer Family Clinic",
+          "clinic_address": "12, 4th Cross, Jayanagar, Bengaluru 560041", "clinic_timings": "Mon-Sat 9:00-13:00, 17:00-20:00",
+          "clinic_closed_days": "Sunday"}
+VITALS = {"temperature": 98.9, "bp_systolic": 132, "bp_diastolic": 86, "pulse": 78, "spo2": 98, "weight": 71.5, "height": 168}
+
+
+class LegacyConsultationPDF(ConsultationPDF):
+    """The original two-pass section and table layout, kept here as the baseline."""
+
+    def add_section_in_column(self, title, content, width):
+        start_x = self.get_x()
+        y_start = self.get_y()
+        self.set_font("helvetica", "B", 10)
+        self.cell(width, self.section_title_height, title, border="B", align="L")
+        y_after_title = y_start + self.section_title_height + self.gap_after_section_title
+        self.set_xy(start_x, y_after_title)
+        if content:
+            self.set_font("helvetica", "", 9)
+            lines = self.multi_cell(width, self.line_height, str(content), border=0, align="L", split_only=True)
+            content_height = len(lines) * self.line_height
+            self.multi_cell(width, self.line_height, str(content), border=0, align="L")
+            self.set_y(y_after_title + content_height)
+        else:
+            self.set_y(y_after_title)
+        self.set_x(start_x)
+        return self.get_y()
+
+    def add_prescription_table(self, prescriptions):
+        self.set_font("helvetica", "B", 10)
+        self.cell(0, self.section_title_height, "Prescription (Rx)", border="B", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(self.gap_after_section_title)
+        self.set_font("helvetica", "B", 9)
+        total_width = self.page_content_width
+        col_widths = (8, total_width * 0.35, total_width * 0.15, total_width - 8 - total_width * 0.35 - total_width * 0.15)
+        headers = ("S.No.", "Medicine", "Dosage", "Instructions")
+        for i, header in enumerate(headers):
+            self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
+        self.ln()
+        self.set_font("helvetica", "", 9)
+        for idx, med in enumerate(prescriptions):
+            y_before, x_before = self.get_y(), self.get_x()
+            freq, dur, instr = med.get('frequency', ''), med.get('duration', ''), med.get('instructions', '')
+            text_instructions = f"{freq}{' for ' + dur if dur else ''}{('. ' + instr) if instr else ''}".strip() or dur
+            texts = [str(med.get('medicine_name', '')), str(med.get('dosage', '')), text_instructions]
+            max_lines = 1
+            for i, text in enumerate(texts):
+                lines = self.multi_cell(col_widths[i + 1], self.line_height, text, border=0, align='L', dry_run=True, output='LINES')
+                max_lines = max(max_lines, len(lines))
+            row_height = max(max_lines * self.line_height * 1.2, self.line_height * 1.4)
+            if self.get_y() + row_height > self.page_break_trigger:
+                self.add_page()
+                self.set_font("helvetica", "B", 9)
+                for i, header in enumerate(headers):
+                    self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
+                self.ln()
+                self.set_font("helvetica", "", 9)
+                y_before, x_before = self.get_y(), self.get_x()
+            x = x_before
+            for i, (text, border, align) in enumerate(zip([f"{idx + 1}."] + texts, ('L', 'L', 'L', 'LR'), ('C', 'L', 'L', 'L'))):
+                self.set_xy(x, y_before)
+                self.multi_cell(col_widths[i], row_height, text, border=border, align=align, ln=3, max_line_height=self.line_height)
+                x += col_widths[i]
+            self.line(x_before, y_before + row_height, x_before + sum(col_widths), y_before + row_height)
+            self.set_y(y_before + row_height)
+        self.ln(self.gap_between_sections)
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(2)
+
+
+def make_consultation(rng, rows):
+    return {
+        "id": 1, "patient_id": 42, "doctor_id": 1, "patient_name": "Ravi Kumar", "patient_dob": datetime.date(1968, 3, 14),
+        "patient_gender": "Male", "consultation_date": datetime.datetime(2024, 6, 3, 10, 45),
+        "chief_complaints": "Burning sensation in the chest after meals for two weeks, worse on lying down. " * 3,
+        "clinical_findings": "Epigastric tenderness, no guarding. Chest clear. Heart sounds normal.",
+        "procedures_conducted": "", "diagnosis": "Gastro-oesophageal reflux disease; type 2 diabetes, controlled.",
+        "investigations": "HbA1c, lipid profile, upper GI endoscopy if symptoms persist beyond four weeks.",
+        "advice_given": "Small frequent meals, avoid late dinners, raise the head end of the bed, reduce tea and coffee. " * 2,
+        "prescription_details": [
+            {"medicine_name": rng.choice(MEDICINES), "dosage": rng.choice(["1 tab", "1-0-1", "1-1-1", "2 puffs SOS"]),
+             "frequency": rng.choice(["Once daily", "Twice daily", "Thrice daily"]), "duration": rng.choice(["5 days", "1 month", "3 months"]),
+             "instructions": rng.choice(INSTRUCTIONS)}
+            for _ in range(rows)
+        ],
+        "follow_up_date": datetime.date(2024, 7, 1),
+    }
+
+
+def time_render(consultation, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        data = render_consultation_pdf(consultation, DOCTOR, VITALS)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e3, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 20, 200])
+    args = parser.parse_args()
+    warnings.simplefilter("ignore", DeprecationWarning) # split_only / ln in the legacy baseline
+
+    rng = random.Random(1)
+    print(f"{'rows':>5} {'legacy ms':>10} {'current ms':>11} {'speedup':>8} {'bytes':>8}")
+    for rows in args.rows:
+        consultation = make_consultation(rng, rows)
+        consultation_pdf.ConsultationPDF = LegacyConsultationPDF
+        legacy_ms, _ = time_render(consultation, args.iterations)
+        consultation_pdf.ConsultationPDF = ConsultationPDF
+        current_ms, size = time_render(consultation, args.iterations)
+        print(f"{rows:>5} {legacy_ms:>10.1f} {current_ms:>11.1f} {legacy_ms / current_ms:>7.2f}x {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Benchmark: per-query latency of the login, dashboard and logging statements.
+
+Runs each hot query (the ones app.py registers with PreparedStatements) against
+the database in .env in three modes:
+  * direct   - a new connection and text-protocol cursor per call (the old get_db_connection)
+  * pooled   - a pooled connection, text protocol
+  * prepared - a pooled connection with the query's prepared cursor cached on it
+
+The symptom insert runs inside a transaction that is rolled back, so no rows
+are left behind. Sample ids come from the first doctor, the first patient login
+and its patient row; the database needs at least one of each.
+
+Usage: python benchmarks/bench_prepared_statements.py [--iterations 500] [--pool-size 4]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from mysql.connector import pooling
+from dotenv import load_dotenv
+
+from prepared_statements import PreparedStatements
+
+# path: [(label, sql, kind)]; kind is "read" or "write"; params are filled from the sample rows
+PATHS = {
+    "login": [
+        ("staff by email", "SELECT id, name, email, role, password_hash FROM User WHERE email = %s AND role IN ('doctor', 'operator')", "read"),
+        ("patient by mobile", "SELECT id, name, email, role, password_hash, linked_patient_id FROM User WHERE mobile_number = %s AND role = 'patient'", "read"),
+    ],
+    "dashboard": [
+        ("patient details", "SELECT name, dob, gender FROM Patient WHERE id = %s", "read"),
+        ("recent prescriptions", "SELECT consultation_date, prescription_details FROM Consultation WHERE patient_id = %s AND prescription_details IS NOT NULL AND prescription_details != '[]' ORDER BY consultation_date DESC LIMIT 2", "read"),
+        ("recent symptoms", "SELECT log_timestamp, symptom_description, severity FROM SymptomLog WHERE patient_id = %s ORDER BY log_timestamp DESC LIMIT 5", "read"),
+        ("symptom chart", "SELECT DATE(log_timestamp) as date, COUNT(*) as count, AVG(severity) as avg_severity FROM SymptomLog WHERE patient_id = %s AND log_timestamp >= %s GROUP BY DATE(log_timestamp) ORDER BY date ASC", "read"),
+        ("today's count", "SELECT COUNT(*) as count FROM Consultation WHERE doctor_id = %s AND DATE(consultation_date) = %s", "read"),
+    ],
+    "logging": [
+        ("symptom insert", "INSERT INTO SymptomLog (patient_id, user_id, log_timestamp, symptom_description, severity) VALUES (%s, %s, %s, %s, %s)", "write"),
+    ],
+}
+
+
+def sample_params(conn):
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute("SELECT id, email FROM User WHERE role = 'doctor' ORDER BY id LIMIT 1")
+    doctor = cursor.fetchone()
+    cursor.execute("SELECT id, mobile_number, linked_patient_id FROM User WHERE role = 'patient' ORDER BY id LIMIT 1")
+    patient_user = cursor.fetchone()
+    cursor.close()
+    if not doctor or not patient_user:
+        raise SystemExit("Need at least one doctor and one patient login in the database")
+    patient_id = patient_user["linked_patient_id"]
+    now = datetime.datetime.now()
+    return {
+        "staff by email": (doctor["email"],),
+        "patient by mobile": (patient_user["mobile_number"],),
+        "patient details": (patient_id,),
+        "recent prescriptions": (patient_id,),
+        "recent symptoms": (patient_id,),
+        "symptom chart": (patient_id, now - datetime.timedelta(days=30)),
+        "today's count": (doctor["id"], now.date()),
+        "symptom insert": (patient_id, patient_user["id"], now, "benchmark row (rolled back)", 1),
+    }
+
+
+def run_once(conn, sql, params, kind, statements):
+    if statements is not None:
+        cursor = statements.cursor(conn, statements.register(sql), dictionary=True)
+    else:
+        cursor = conn.cursor(buffered=True, dictionary=True)
+    if kind == "write":
+        conn.start_transaction()
+    cursor.execute(sql if statements is None else statements.canonical(sql), params)
+    if kind == "read":
+        cursor.fetchall()
+    else:
+        conn.rollback()
+    if statements is None:
+        cursor.close()
+
+
+def time_mode(mode, config, pool, statements, sql, params, kind, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        conn = mysql.connector.connect(**config) if mode == "direct" else pool.get_connection()
+        try:
+            run_once(conn, sql, params, kind, statements if mode == "prepared" else None)
+        finally:
+            conn.close()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings) * 1e6, timings[int(0.95 * (len(timings) - 1))] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    load_dotenv()
+    config = dict(host=os.getenv("DB_HOST"), user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"),
+                  database=os.getenv("DB_NAME"), autocommit=True)
+    pool = pooling.MySQLConnectionPool(pool_name="bench", pool_size=args.pool_size, pool_reset_session=False, **config)
+    statements = PreparedStatements()
+    conn = pool.get_connection()
+    params = sample_params(conn)
+    conn.close()
+
+    modes = ("direct", "pooled", "prepared")
+    print(f"{'path':<10} {'query':<22}" + "".join(f" {m + ' p50':>13} {m + ' p95':>13}" for m in modes) + "   (microseconds)")
+    for path, queries in PATHS.items():
+        for label, sql, kind in queries:
+            cells = []
+            for mode in modes:
+                iterations = max(1, args.iterations // 10) if mode == "direct" else args.iterations # Connects are slow
+                p50, p95 = time_mode(mode, config, pool, statements, sql, params[label], kind, iterations)
+                cells.append(f" {p50:>13.0f} {p95:>13.0f}")
+            print(f"{path:<10} {label:<22}" + "".join(cells))
+    print(f"prepared statement cache: {statements.stats()}")
+
+
+if __name__ == "__main__":
+    main()
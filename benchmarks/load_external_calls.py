@@ -0,0 +1,146 @@
+"""Load test: the app's external-call paths (/check_adr and summary jobs).
+
+Start the stand-in services and point a running app at them first:
+    python fake_services.py --gemini-latency lognormal:-0.3,0.4 --gemini-429-rate 0.05
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8091 OPENFDA_BASE_URL=http://127.0.0.1:8092 python app.py
+
+Then drive concurrent ADR polls and summary jobs as a logged-in doctor:
+    python benchmarks/load_external_calls.py --email doctor@example.com --password secret \\
+        --adr-clients 8 --summary-clients 2 --duration 60
+
+Reports request counts, failures and latency percentiles per path, plus the
+app's /gemini_stats snapshot at the end.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+import requests
+
+TRANSCRIPT_SENTENCES = [
+    "Patient reports a dry cough for the last five days.",
+    "She has been taking metformin 500 mg twice daily for diabetes.",
+    "Blood pressure is controlled on lisinopril ten milligrams.",
+    "Complains of mild stomach upset after starting ibuprofen.",
+    "No fever, chest is clear on auscultation.",
+    "Advised to continue atorvastatin at night.",
+    "We will start amoxicillin 500 mg three times a day for seven days.",
+    "Review after one week with a fasting sugar report.",
+]
+
+
+def make_transcript(rng, sentences):
+    return " ".join(rng.choice(TRANSCRIPT_SENTENCES) for _ in range(sentences))
+
+
+def login(base_url, email, password):
+    http = requests.Session()
+    response = http.post(f"{base_url}/login", data={"login_type": "staff", "email": email, "password": password},
+                         allow_redirects=False, timeout=10)
+    if response.status_code != 302 or "session" not in http.cookies:
+        sys.exit(f"Login failed (status {response.status_code}); check --email/--password")
+    return http
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {} # path -> list of seconds
+        self.outcomes = {} # path -> {outcome: count}
+
+    def record(self, path, seconds, outcome):
+        with self._lock:
+            self.samples.setdefault(path, []).append(seconds)
+            counts = self.outcomes.setdefault(path, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def report(self, elapsed):
+        print(f"{'path':<16} {'requests':>8} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}  outcomes")
+        for path, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            pct = lambda f: samples[min(len(samples) - 1, int(round(f * (len(samples) - 1))))]
+            print(f"{path:<16} {len(samples):>8} {len(samples) / elapsed:>7.2f} {pct(0.5):>7.3f} {pct(0.95):>7.3f} "
+                  f"{pct(0.99):>7.3f} {samples[-1]:>7.3f}  {self.outcomes[path]}")
+
+
+def adr_client(http, base_url, recorder, deadline, rng, interval):
+    while time.time() < deadline:
+        transcript = make_transcript(rng, rng.randint(4, 12))
+        start = time.perf_counter()
+        try:
+            response = http.post(f"{base_url}/check_adr", json={"transcript": transcript}, timeout=60)
+            body = response.json() if response.ok else {}
+            outcome = body.get("skipped") or ("ok" if response.ok else f"http_{response.status_code}")
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        recorder.record("check_adr", time.perf_counter() - start, outcome)
+        time.sleep(interval)
+
+
+def summary_client(http, base_url, recorder, deadline, rng, sentences):
+    while time.time() < deadline:
+        transcript = make_transcript(rng, sentences)
+        start = time.perf_counter()
+        try:
+            response = http.post(f"{base_url}/summary_jobs", json={"transcript_text": transcript}, timeout=30)
+            if response.status_code != 202:
+                recorder.record("summary_job", time.perf_counter() - start, f"http_{response.status_code}")
+                time.sleep(1)
+                continue
+            status_url = response.json()["status_url"]
+            while True:
+                job = http.get(f"{base_url}{status_url}", timeout=30).json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.25)
+            outcome = job["status"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            outcome = type(e).__name__
+        recorder.record("summary_job", time.perf_counter() - start, outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--email", required=True, help="doctor account email")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--adr-clients", type=int, default=8, help="concurrent ADR pollers")
+    parser.add_argument("--adr-interval", type=float, default=1.0, help="seconds between polls per client")
+    parser.add_argument("--summary-clients", type=int, default=2)
+    parser.add_argument("--summary-sentences", type=int, default=40, help="transcript length per summary job")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    recorder = Recorder()
+    deadline = time.time() + args.duration
+    threads = []
+    for i in range(args.adr_clients):
+        http = login(base_url, args.email, args.password)
+        threads.append(threading.Thread(target=adr_client, args=(http, base_url, recorder, deadline,
+                                                                 random.Random(args.seed + i), args.adr_interval)))
+    for i in range(args.summary_clients):
+        http = login(base_url, args.email, args.password)
+        threads.append(threading.Thread(target=summary_client, args=(http, base_url, recorder, deadline,
+                                                                     random.Random(args.seed + 1000 + i), args.summary_sentences)))
+
+    print(f"{args.adr_clients} ADR clients, {args.summary_clients} summary clients for {args.duration:.0f}s against {base_url}\n")
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.report(time.time() - start)
+
+    stats = login(base_url, args.email, args.password).get(f"{base_url}/gemini_stats", timeout=10)
+    if stats.ok:
+        print("\n/gemini_stats:")
+        print(json.dumps(stats.json(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
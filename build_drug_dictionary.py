@@ -0,0 +1,123 @@
+"""Builds the offline drug dictionary used by drug_matcher.DrugMatcher.
+
+Reads one or more OpenFDA drug label dumps (the bulk download files from
+https://open.fda.gov/apis/downloads/, either .json or the original .json.zip)
+and writes a JSON dictionary of normalized term -> generic name, covering
+brand names, generic names and active moieties (generic name without salts).
+Labels without a generic name are skipped, and so are brand names made only
+of symptom or everyday words ("Cough", "Headache Relief").
+
+Usage:
+    python build_drug_dictionary.py drug-label-0001-of-0012.json.zip ... -o instance/drug_dictionary.json
+    python build_drug_dictionary.py fake_data/openfda_labels.json # Local seed data for development
+"""
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+
+from drug_matcher import normalize_term, active_moiety, STOP_TERMS, MIN_TERM_LENGTH
+
+DEFAULT_OUTPUT_PATH = "instance/drug_dictionary.json"
+
+# OTC and homeopathic labels are often branded with what they treat ("Cough",
+# "Fever", "Headache Relief"). Brand names made only of these words (or
+# STOP_TERMS) would alert on every consultation that mentions the symptom.
+COMMON_BRAND_WORDS = frozenset("""
+    ache aches acid acne arthritis back bite bites body burn burns calm chest children chills congestion
+    constipation cough cramp cramps diarrhea dry ear eye eyes fever gas head headache heartburn hives
+    itch itching itchy joint leg migraine mucus muscle nasal nausea nose pms rash rest sinus skin sore
+    sneezing stomach stress teething throat tooth toothache upset warts
+    adult adults baby care clear fast formula kids max maximum medicine multi original regular strength
+    extra severe symptom symptoms tablet capsule liquid spray gel cream ointment drops
+""".split())
+
+
+def iter_label_files(path):
+    """Yields parsed label dump documents from a .json file or every .json inside a .zip."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as f:
+                        yield json.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def is_common_brand(term):
+    """True for a normalized brand name made only of everyday or symptom words."""
+    return all(word in COMMON_BRAND_WORDS or word in STOP_TERMS or word.isdigit() for word in term.split())
+
+
+def add_term(terms, term, generic, stats, brand=False):
+    term = normalize_term(term)
+    if len(term) < MIN_TERM_LENGTH or term in STOP_TERMS or term.isdigit() or (brand and is_common_brand(term)):
+        stats["skipped"] += 1
+        return
+    # Keep the first generic seen for a term; brand names shared by several products are rare
+    if term not in terms:
+        terms[term] = generic
+
+
+def build_dictionary(paths):
+    terms = {}
+    stats = {"labels": 0, "labels_without_names": 0, "skipped": 0}
+    for path in paths:
+        for document in iter_label_files(path):
+            for label in document.get("results", []):
+                stats["labels"] += 1
+                openfda = label.get("openfda", {})
+                generic_names = openfda.get("generic_name", [])
+                brand_names = openfda.get("brand_name", [])
+                if not generic_names: # A brand alone says nothing about what the product contains
+                    stats["labels_without_names"] += 1
+                    continue
+                generic = normalize_term(generic_names[0])
+                for name in generic_names:
+                    add_term(terms, name, generic, stats)
+                    moiety = active_moiety(name)
+                    if moiety:
+                        add_term(terms, moiety, generic, stats)
+                for name in brand_names:
+                    add_term(terms, name, generic, stats, brand=True)
+    return terms, stats
+
+
+def write_dictionary(path, terms, sources):
+    """Writes via a temp file and rename so a running app never reads a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".drug-dictionary-", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "sources": [os.path.basename(source) for source in sources],
+            "terms": dict(sorted(terms.items())),
+        }, f, indent=0)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="+", help="OpenFDA drug label dump files (.json or .json.zip)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_PATH)
+    args = parser.parse_args()
+
+    start = time.time()
+    terms, stats = build_dictionary(args.dumps)
+    if not terms:
+        sys.exit("No drug names found; check the input files.")
+    write_dictionary(args.output, terms, args.dumps)
+    print(f"Read {stats['labels']} labels ({stats['labels_without_names']} without a generic name), "
+          f"skipped {stats['skipped']} short/common names")
+    print(f"Wrote {len(terms)} terms to {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
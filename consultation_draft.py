@@ -0,0 +1,502 @@
+"""Structured consultation draft: Gemini prompt, response schema and parsers.
+
+Kept free of Flask/Google imports so the benchmarks and tools can load it
+without the app's cloud clients.
+"""
+import re
+import json
+import datetime
+from dataclasses import dataclass, field, fields
+
+
+class DraftParseError(ValueError):
+    """Raised when a Gemini response cannot be decoded as a structured draft."""
+
+
+# Headings used by the free-text prompt, in order, mapped to draft keys
+DRAFT_SECTION_HEADINGS = (
+    ("Chief Complaints", "chief_complaints"),
+    ("Clinical Findings", "clinical_findings"),
+    ("Internal Notes", "internal_notes"),
+    ("Diagnosis", "diagnosis"),
+    ("Procedures Conducted", "procedures_conducted"),
+    ("Prescription", "prescription_details"),
+    ("Investigations", "investigations"),
+    ("Advice Given", "advice_given"),
+    ("Follow-Up Date", "follow_up_date"),
+)
+DRAFT_HEADING_KEYS = {heading.lower(): key for heading, key in DRAFT_SECTION_HEADINGS}
+
+# Matches any known heading at the start of a line, with optional markdown and colon
+DRAFT_HEADING_PATTERN = re.compile(
+    r"^[ \t*#]*(" + "|".join(re.escape(h) for h, _ in DRAFT_SECTION_HEADINGS) + r")[ \t*]*(?::[ \t*]*|(?=\n))",
+    re.MULTILINE | re.IGNORECASE
+)
+NONE_MENTIONED_PREFIXES = ('none mentioned', 'n/a')
+NONE_MENTIONED_VALUES = frozenset(('none', 'nil', '-'))
+JSON_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+LIST_BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+PRESCRIPTION_ITEM_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "medicine_name": {"type": "STRING"},
+        "dosage": {"type": "STRING"},
+        "frequency": {"type": "STRING"},
+        "duration": {"type": "STRING"},
+        "instructions": {"type": "STRING"},
+    },
+    "required": ["medicine_name"],
+}
+
+# Gemini response_schema matching the draft structure (OpenAPI subset)
+DRAFT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "chief_complaints": {"type": "STRING"},
+        "clinical_findings": {"type": "STRING"},
+        "internal_notes": {"type": "STRING"},
+        "diagnosis": {"type": "STRING"},
+        "procedures_conducted": {"type": "STRING"},
+        "prescription_details": {"type": "ARRAY", "items": PRESCRIPTION_ITEM_SCHEMA},
+        "investigations": {"type": "STRING"},
+        "advice_given": {"type": "STRING"},
+        "follow_up_date": {"type": "STRING", "description": "YYYY-MM-DD, or empty if not mentioned"},
+    },
+    "required": [key for _, key in DRAFT_SECTION_HEADINGS],
+    # No propertyOrdering: google-generativeai's Schema rejects it, and the streaming decoder accepts any key order
+}
+
+
+def clean_text_value(value):
+    """Normalises a text field, blanking out 'None mentioned' style values."""
+    if value is None:
+        return ""
+    text = str(value).strip()
+    lowered = text.lower().rstrip('.')
+    if lowered in NONE_MENTIONED_VALUES or lowered.startswith(NONE_MENTIONED_PREFIXES):
+        return ""
+    return text
+
+
+def clean_follow_up_date(value):
+    """Returns the follow-up date as YYYY-MM-DD, or '' if it is missing or malformed."""
+    text = clean_text_value(value)
+    try:
+        return datetime.datetime.strptime(text, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return ""
+
+
+@dataclass
+class PrescriptionItem:
+    medicine_name: str = ""
+    dosage: str = ""
+    frequency: str = ""
+    duration: str = ""
+    instructions: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise DraftParseError(f"Prescription item must be an object, got {type(data).__name__}")
+        return cls(
+            medicine_name=clean_text_value(data.get('medicine_name', data.get('medicine'))),
+            dosage=clean_text_value(data.get('dosage')),
+            frequency=clean_text_value(data.get('frequency')),
+            duration=clean_text_value(data.get('duration')),
+            instructions=clean_text_value(data.get('instructions')),
+        )
+
+    @classmethod
+    def from_line(cls, line):
+        """Parses a free-text 'Medicine | Dosage | Duration' prescription line."""
+        parts = [p.strip() for p in line.split('|')]
+        if len(parts) >= 3:
+            return cls(medicine_name=parts[0], dosage=parts[1], duration=parts[2],
+                       instructions=" | ".join(p for p in parts[3:] if p))
+        if len(parts) == 2:
+            return cls(medicine_name=parts[0], dosage=parts[1])
+        return cls(medicine_name=line) # Fallback: use the whole line as the name
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+@dataclass
+class ConsultationDraft:
+    chief_complaints: str = ""
+    clinical_findings: str = ""
+    internal_notes: str = ""
+    diagnosis: str = ""
+    procedures_conducted: str = ""
+    prescription_details: list = field(default_factory=list)
+    investigations: str = ""
+    advice_given: str = ""
+    follow_up_date: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a validated draft from a decoded JSON object."""
+        if not isinstance(data, dict):
+            raise DraftParseError(f"Draft must be a JSON object, got {type(data).__name__}")
+        draft = cls()
+        for key, value in data.items():
+            if key in DRAFT_FIELD_NAMES:
+                setattr(draft, key, coerce_field(key, value))
+        return draft
+
+    @classmethod
+    def from_json(cls, text):
+        """Decodes a JSON-mode Gemini response in a single pass."""
+        try:
+            data = json.loads(JSON_FENCE_PATTERN.sub("", text))
+        except (TypeError, json.JSONDecodeError) as e:
+            raise DraftParseError(f"Response is not valid JSON: {e}") from e
+        return cls.from_dict(data)
+
+    def to_dict(self):
+        draft = dict(self.__dict__)
+        draft["prescription_details"] = [dict(item) for item in self.prescription_details]
+        return draft
+
+
+DRAFT_FIELD_NAMES = frozenset(f.name for f in fields(ConsultationDraft))
+
+
+def coerce_field(key, value):
+    """Validates one draft field value and converts it to its stored form."""
+    if key == "prescription_details":
+        if value is None or value == "":
+            return []
+        if isinstance(value, str):
+            return parse_prescription_text(value)
+        if not isinstance(value, list):
+            raise DraftParseError(f"prescription_details must be a list, got {type(value).__name__}")
+        items = [PrescriptionItem.from_dict(item) for item in value]
+        return [item.to_dict() for item in items if item.medicine_name]
+    if key == "follow_up_date":
+        return clean_follow_up_date(value)
+    if isinstance(value, (dict, list)):
+        raise DraftParseError(f"{key} must be a string, got {type(value).__name__}")
+    return clean_text_value(value)
+
+
+def new_empty_draft():
+    """Returns a fresh empty draft dict."""
+    return ConsultationDraft().to_dict()
+
+
+def parse_prescription_text(prescription_text):
+    """Parses free-text prescription lines into prescription dicts."""
+    prescriptions = []
+    for line in (prescription_text or "").split('\n'):
+        line = LIST_BULLET_PATTERN.sub("", line).strip()
+        if not clean_text_value(line):
+            continue
+        prescriptions.append(PrescriptionItem.from_line(line).to_dict())
+    return prescriptions
+
+
+def section_value(key, body):
+    """Converts a raw free-text section body into the value stored under its key."""
+    if key == "prescription_details":
+        return parse_prescription_text(clean_text_value(body))
+    return coerce_field(key, body)
+
+
+def iter_completed_sections(text, final=False):
+    """Yields (key, body) for each heading whose section is complete in a partial output.
+
+    A section is only complete once the next known heading has started; pass
+    final=True once the output has ended to also yield the last section.
+    """
+    matches = list(DRAFT_HEADING_PATTERN.finditer(text))
+    for i, match in enumerate(matches):
+        if i + 1 < len(matches):
+            end = matches[i + 1].start()
+        elif final:
+            end = len(text)
+        else:
+            break
+        yield DRAFT_HEADING_KEYS[match.group(1).lower()], text[match.end():end]
+
+
+def parse_free_text_draft(text):
+    """Fallback parser for heading-formatted output: one scan over precompiled headings."""
+    draft = new_empty_draft()
+    for key, body in iter_completed_sections(text or "", final=True):
+        draft[key] = section_value(key, body)
+    return draft
+
+
+def decode_draft(text):
+    """Decodes a Gemini response into a draft dict.
+
+    Returns (draft, source) where source is 'json' when the schema-constrained
+    response decoded cleanly and 'text' when the heading parser was used.
+    """
+    try:
+        return ConsultationDraft.from_json(text).to_dict(), "json"
+    except DraftParseError:
+        return parse_free_text_draft(text), "text"
+
+
+class StreamingDraftDecoder:
+    """Incrementally decodes a streamed Gemini draft into completed fields.
+
+    Handles both the JSON-mode response (a field is complete once its value
+    has been fully received) and the free-text heading format (a section is
+    complete once the next heading starts).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._json_decoder = json.JSONDecoder()
+        self._json_pos = None # Index of the next unread JSON member
+        self._json_failed = False
+        self._mode = None # 'json' or 'text', decided by the first significant character
+        self._sections_emitted = 0
+
+    @property
+    def is_json(self):
+        self._decide_mode(final=False)
+        return self._mode == "json" and not self._json_failed
+
+    def _decide_mode(self, final):
+        if self._mode is not None:
+            return
+        head = self.text.lstrip()
+        # A chunk may end inside the opening fence ("```jso"); wait for the newline after it
+        if not final and "```".startswith(head[:3]) and "\n" not in head:
+            return
+        stripped = JSON_FENCE_PATTERN.sub("", head)
+        if stripped:
+            self._mode = "json" if stripped.startswith("{") else "text"
+
+    def feed(self, chunk):
+        """Adds a chunk of streamed text; returns newly completed (key, value) pairs."""
+        self.text += chunk
+        return self._drain(final=False)
+
+    def close(self):
+        """Marks the stream finished; returns any fields completed by the end of input."""
+        return self._drain(final=True)
+
+    def _drain(self, final):
+        self._decide_mode(final)
+        if self.is_json:
+            return list(self._drain_json())
+        completed = list(iter_completed_sections(self.text, final=final))
+        new_sections = completed[self._sections_emitted:]
+        self._sections_emitted = len(completed)
+        return [(key, section_value(key, body)) for key, body in new_sections]
+
+    def _skip(self, pos, chars):
+        text = self.text
+        while pos < len(text) and text[pos] in chars:
+            pos += 1
+        return pos
+
+    def _drain_json(self):
+        text = self.text
+        if self._json_pos is None:
+            self._json_pos = text.index("{") + 1
+        while True:
+            pos = self._skip(self._json_pos, " \t\r\n,")
+            if pos >= len(text) or text[pos] == "}":
+                return
+            if text[pos] != '"':
+                self._json_failed = True # Not an object member; let the final decode handle it
+                return
+            try:
+                key, pos = json.decoder.scanstring(text, pos + 1)
+                pos = self._skip(pos, " \t\r\n")
+                if pos >= len(text):
+                    return
+                if text[pos] != ":":
+                    self._json_failed = True
+                    return
+                pos = self._skip(pos + 1, " \t\r\n")
+                value, end = self._json_decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                return # Member still incomplete; wait for more text
+            if end >= len(text):
+                return # A bare number or literal might still be growing
+            self._json_pos = end
+            if key in DRAFT_FIELD_NAMES:
+                try:
+                    yield key, coerce_field(key, value)
+                except DraftParseError:
+                    pass # Invalid member; the final decode reports the failure
+
+
+def build_summary_prompt(raw_transcript, json_mode=True):
+    """Builds the Gemini summarization prompt for a transcript.
+
+    In JSON mode the response shape is enforced by DRAFT_RESPONSE_SCHEMA;
+    otherwise Gemini is asked for the legacy free-text headings.
+    """
+    if json_mode:
+        return f"""Analyze the following doctor-patient consultation transcript. Extract the relevant medical information into the JSON fields. Be concise and accurate. Use an empty string (or an empty list for prescription_details) when information is not present.
+
+Field guidance:
+- chief_complaints, clinical_findings, diagnosis, procedures_conducted, advice_given: short free text.
+- internal_notes: notes clearly intended for the doctor only.
+- prescription_details: one object per prescribed medicine, e.g. {{"medicine_name": "Tab Metformin", "dosage": "500mg", "frequency": "1 tab twice daily", "duration": "30 days", "instructions": "After food"}}.
+- investigations: investigations ordered, e.g. "CBC, X-Ray Chest".
+- follow_up_date: YYYY-MM-DD if a follow-up date is mentioned, otherwise "".
+
+TRANSCRIPT:
+```
+{raw_transcript}
+```
+"""
+    return f"""Analyze the following doctor-patient consultation transcript. Extract the relevant medical information and structure it clearly under the specified headings. Be concise and accurate. If information for a heading is not present, leave it blank or write 'None mentioned'.
+
+TRANSCRIPT:
+```
+{raw_transcript}
+```
+
+EXTRACTED INFORMATION:
+Chief Complaints:
+[Extract chief complaints here]
+
+Clinical Findings:
+[Extract clinical findings here]
+
+Internal Notes:
+[Extract any notes clearly intended for the doctor only, if any. If none, state 'None mentioned']
+
+Diagnosis:
+[Extract diagnosis here]
+
+Procedures Conducted:
+[Extract procedures conducted, if any. If none, state 'None mentioned']
+
+Prescription:
+[List each prescribed medicine on a new line in the format: Medicine Name | Dosage | Duration/Total. Example: Tab Metformin | 500mg | 1 tab twice daily for 30 days. If no prescription, state 'None mentioned']
+
+Investigations:
+[List investigations ordered, if any. Example: CBC, X-Ray Chest. If none, state 'None mentioned']
+
+Advice Given:
+[Extract advice given to the patient]
+
+Follow-Up Date:
+[Extract follow-up date, if mentioned, in YYYY-MM-DD format. If not mentioned, state 'None mentioned']
+"""
+
+
+# --- Long transcript chunking and merging (map-reduce summarization) ---
+
+CHARS_PER_TOKEN = 4 # Rough average for English text; good enough for budgeting
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate used to decide whether to split a transcript."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_long_sentence(sentence, max_chars):
+    """Hard-splits an unpunctuated run of text on word boundaries."""
+    pieces, current = [], ""
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_transcript(text, chunk_tokens, overlap_tokens=0):
+    """Splits a transcript into sentence-aligned chunks of about chunk_tokens each.
+
+    Consecutive chunks share roughly overlap_tokens of trailing sentences so
+    that facts spanning a boundary are seen whole by at least one chunk.
+    """
+    max_chars = max(chunk_tokens * CHARS_PER_TOKEN, 1)
+    overlap_chars = max(overlap_tokens * CHARS_PER_TOKEN, 0)
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY_PATTERN.split((text or "").strip()):
+        if len(sentence) > max_chars:
+            sentences.extend(_split_long_sentence(sentence, max_chars))
+        elif sentence:
+            sentences.append(sentence)
+
+    chunks, current, current_len = [], [], 0
+    for sentence in sentences:
+        if current and current_len + len(sentence) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            # Carry trailing sentences into the next chunk as overlap
+            overlap, overlap_len = [], 0
+            for previous in reversed(current):
+                if overlap_len + len(previous) + 1 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_len += len(previous) + 1
+            current, current_len = overlap, overlap_len
+        current.append(sentence)
+        current_len += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def merge_drafts(drafts):
+    """Deterministically merges partial drafts (in transcript order) into one draft.
+
+    Text fields keep each distinct value once, prescriptions are de-duplicated
+    by medicine name with later chunks winning, and the last follow-up date
+    mentioned is kept.
+    """
+    merged = new_empty_draft()
+    prescriptions = {}
+    for draft in drafts:
+        for key, value in draft.items():
+            if key == "prescription_details":
+                for item in value or []:
+                    name_key = " ".join(item.get("medicine_name", "").lower().split())
+                    if name_key:
+                        prescriptions.pop(name_key, None) # Re-insert so order follows the latest mention
+                        prescriptions[name_key] = dict(item)
+            elif key == "follow_up_date":
+                merged[key] = value or merged[key]
+            elif key in DRAFT_FIELD_NAMES and value:
+                existing = merged[key]
+                if value.lower() in existing.lower():
+                    continue # Already covered, usually by the overlap window
+                if existing and existing.lower() in value.lower():
+                    merged[key] = value
+                else:
+                    merged[key] = f"{existing}\n{value}" if existing else value
+    merged["prescription_details"] = list(prescriptions.values())
+    return merged
+
+
+def build_chunk_prompt(chunk, index, total):
+    """Builds the map-stage prompt for one part of a long transcript."""
+    return f"""The following is part {index} of {total} of a long doctor-patient consultation transcript (consecutive parts overlap slightly). Extract only the medical information stated in THIS part into the JSON fields. Be concise and accurate. Use an empty string (or an empty list for prescription_details) when a field is not mentioned in this part.
+
+prescription_details: one object per prescribed medicine with medicine_name, dosage, frequency, duration and instructions.
+follow_up_date: YYYY-MM-DD if a follow-up date is mentioned, otherwise "".
+
+TRANSCRIPT PART {index}/{total}:
+```
+{chunk}
+```
+"""
+
+
+def build_merge_prompt(partial_drafts):
+    """Builds the reduce-stage prompt that merges partial drafts into one."""
+    parts = "\n".join(f"Part {i}: {json.dumps(draft, ensure_ascii=False)}" for i, draft in enumerate(partial_drafts, 1))
+    return f"""The following JSON objects were extracted, in order, from consecutive overlapping parts of one doctor-patient consultation. Merge them into a single consultation record with the same fields. Remove duplicates caused by the overlap, combine complementary details, and where parts conflict prefer the later part (e.g. a changed dose or final diagnosis). Keep each prescribed medicine once. Be concise.
+
+{parts}
+"""
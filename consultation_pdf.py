@@ -0,0 +1,429 @@
+"""Consultation PDF layout (Redesigned Layout - Revision 3).
+
+Kept free of Flask, database and Google client imports so PDFs can be rendered
+in worker processes (see the bulk export in app.py) as well as on the web thread.
+"""
+import json
+import datetime
+
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos, MethodReturnValue # Import XPos and YPos for modern API
+
+# Part of every cached PDF's version: bump when ConsultationPDF output changes
+PDF_LAYOUT_VERSION = 5
+
+class ConsultationPDF(FPDF):
+    def __init__(self, doctor_data, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.doctor_data = doctor_data
+        self.alias_nb_pages()
+        self.set_margins(12, 15, 12)
+        self.set_auto_page_break(auto=True, margin=20)
+        self.set_font("helvetica", size=9)
+        self.line_height = 4.5
+        self.section_title_height = self.line_height * 1.3
+        self.gap_after_section_title = 1.5
+        self.gap_between_sections = 3 # Renamed for clarity
+        self.gap_after_final_section = 4
+        self.page_content_width = self.w - self.l_margin - self.r_margin
+        self.col_width = (self.page_content_width - 6) / 2
+        self.col_gap = 6
+        self._wrap_cache = {} # (font, size, width, text) -> wrapped lines
+
+    def header(self):
+        header_y_start = self.get_y()
+        col1_width = self.page_content_width * 0.55
+        col2_width = self.page_content_width * 0.45
+        
+        # Left Block: Doctor Details
+        self.set_font("helvetica", "B", 11)
+        doctor_name = self.doctor_data.get('name', 'Dr. Default')
+        self.cell(col1_width, self.line_height + 1, doctor_name, border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+        self.set_font("helvetica", "", 9)
+        qualifications = self.doctor_data.get('qualifications', '')
+        if qualifications:
+             self.multi_cell(col1_width, self.line_height, qualifications, border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        reg_no = self.doctor_data.get('registration_number', '')
+        if reg_no:
+             # <<< FIX: Ensure Reg No is Left Aligned within its block >>>
+            self.cell(col1_width, self.line_height, f"Reg. No: {reg_no}", border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        phone = self.doctor_data.get('phone_number', '')
+        if phone:
+             # <<< FIX: Ensure Mob No is Left Aligned within its block >>>
+             self.cell(col1_width, self.line_height, f"Mob. No: {phone}", border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+             
+        y_after_left = self.get_y()
+        
+        # Right Block: Clinic Details
+        self.set_xy(self.l_margin + col1_width, header_y_start)
+        self.set_font("helvetica", "B", 11)
+        clinic_name = self.doctor_data.get('clinic_name', 'Clinic Name')
+        # Use multi_cell for potential wrapping of clinic name
+        self.multi_cell(col2_width, self.line_height + 1, clinic_name, border=0, align='R')
+        y_after_clinic_name = self.get_y()
+        current_x_right = self.l_margin + col1_width
+        
+        self.set_xy(current_x_right, y_after_clinic_name)
+        self.set_font("helvetica", "", 9)
+        address = self.doctor_data.get('clinic_address', '')
+        if address:
+            self.multi_cell(col2_width, self.line_height, address, border=0, align='R')
+        timings = self.doctor_data.get('clinic_timings', '')
+        if timings:
+            self.set_x(current_x_right) # Reset X
+            self.cell(col2_width, self.line_height, f"Timing: {timings}", border=0, align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        closed = self.doctor_data.get('clinic_closed_days', '')
+        if closed:
+            self.set_x(current_x_right) # Reset X
+            self.cell(col2_width, self.line_height, f"Closed: {closed}", border=0, align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            
+        y_after_right = self.get_y()
+        
+        # Draw line below header
+        self.set_y(max(y_after_left, y_after_right) + 2) # Increased gap
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(4) # Increased gap
+
+    def footer(self):
+        self.set_y(-18) # Position further up for signature space
+        
+        # Page Number (Centered)
+        page_num_y = self.get_y()
+        self.set_font("helvetica", "I", 8)
+        self.cell(0, 10, f"Page {self.page_no()}/{{nb}}", align="C", border=0)
+        
+        # Signature Area (Bottom Right) - Adjusted Y positioning relative to bottom
+        sig_width = 60
+        sig_x = self.w - self.r_margin - sig_width
+        sig_y = self.h - self.b_margin - 15 # Y position for the signature line itself
+        
+        self.set_y(sig_y) # Go to Y pos for signature line
+        self.line(sig_x, sig_y, sig_x + sig_width, sig_y) # Draw signature line
+        
+        # Position text below the line
+        self.set_xy(sig_x, sig_y + 1) 
+        self.set_font("helvetica", "B", 9)
+        doctor_name = self.doctor_data.get('name', 'Dr. Default')
+        self.cell(sig_width, self.line_height, doctor_name, align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+        self.set_x(sig_x)
+        self.set_font("helvetica", "", 8)
+        qualifications = self.doctor_data.get('qualifications', '')
+        if qualifications:
+            self.cell(sig_width, self.line_height, qualifications, align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        reg_no = self.doctor_data.get('registration_number', '')
+        if reg_no:
+            self.set_x(sig_x)
+            self.cell(sig_width, self.line_height, f"Reg. No.: {reg_no}", align="C", border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+        # Reset Y to avoid interfering with page numbering if content was short
+        self.set_y(page_num_y)
+
+    def add_patient_details(self, name, patient_id, dob, gender, as_of):
+        """Patient line; the age is as of `as_of` (the consultation date), so a cached PDF never goes stale."""
+        self.set_font("helvetica", "", 9)
+        id_text = f"ID: {patient_id}"
+        id_width = self.get_string_width(id_text) + 5
+        self.cell(id_width, self.line_height, id_text)
+        name_text = f"{name}"
+        name_width = self.get_string_width(name_text) + 5
+        self.cell(name_width, self.line_height, name_text)
+        age = ''
+        if isinstance(dob, datetime.date) and isinstance(as_of, datetime.date):
+            age_years = as_of.year - dob.year - ((as_of.month, as_of.day) < (dob.month, dob.day))
+            age = f"({age_years} Yrs)"
+        gender_age_text = f"{gender} / {age}"
+        self.cell(0, self.line_height, gender_age_text, align='R')
+        self.ln(self.line_height + 1)
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(4) # Increased gap
+
+    def add_consultation_date(self, date):
+        self.set_font("helvetica", "B", 9)
+        date_str = date.strftime('%d-%b-%Y %I:%M %p') if isinstance(date, datetime.datetime) else str(date)
+        current_y = self.get_y()
+        # Position X for right alignment before calling cell
+        date_width = self.get_string_width(f"Date: {date_str}")
+        self.set_x(self.w - self.r_margin - date_width)
+        self.cell(date_width, self.line_height, f"Date: {date_str}", align="R")
+        # Use ln() to move below the date cell's height
+        self.ln(self.line_height + 3)
+
+    def add_consulting_doctor(self, name):
+        self.set_font("helvetica", "", 9)
+        self.cell(0, self.line_height, f"Consulting doctor: {name}", align="R", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(2)
+
+    def add_vitals(self, vitals_dict):
+        self.set_font("helvetica", "B", 10)
+        title = "Vitals"
+        title_width = self.get_string_width(title) + 2
+        self.cell(title_width, self.section_title_height, title)
+        self.ln(self.section_title_height + self.gap_after_section_title)
+        
+        if not vitals_dict: 
+            self.set_font("helvetica", "I", 9)
+            self.cell(0, self.line_height, "(No vitals recorded)")
+            self.ln(self.line_height + self.gap_between_sections)
+            # No line below vitals
+            return
+        
+        self.set_font("helvetica", "", 9)
+        bp = f"BP: {vitals_dict.get('bp_systolic', '--')}/{vitals_dict.get('bp_diastolic', '--')} mmHg"
+        hr = f"HR: {vitals_dict.get('heart_rate', '--')} bpm"
+        temp = f"Temp: {vitals_dict.get('temperature', '--')} °C"
+        spo2 = f"SpO2: {vitals_dict.get('spo2', '--')} %"
+        weight = f"Wt: {vitals_dict.get('weight_kg', '--')} kg"
+        height = f"Ht: {vitals_dict.get('height_cm', '--')} cm"
+        
+        # 3-column layout for vitals
+        vitals_col_width = self.page_content_width / 3
+        # Row 1
+        self.cell(vitals_col_width, self.line_height, bp)
+        self.cell(vitals_col_width, self.line_height, hr)
+        self.cell(vitals_col_width, self.line_height, temp, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        # Row 2
+        self.cell(vitals_col_width, self.line_height, spo2)
+        self.cell(vitals_col_width, self.line_height, weight)
+        self.cell(vitals_col_width, self.line_height, height, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+        self.ln(self.gap_between_sections)
+
+    def wrap_text(self, width, text):
+        """Wraps text to width in the current font once; returns the lines (cached per consultation)."""
+        key = (self.font_family, self.font_style, self.font_size_pt, width, text)
+        lines = self._wrap_cache.get(key)
+        if lines is None:
+            lines = self.multi_cell(width, self.line_height, text, border=0, align="L", dry_run=True, output=MethodReturnValue.LINES)
+            self._wrap_cache[key] = lines
+        return lines
+
+    def add_section_in_column(self, title, content, width):
+        start_x = self.get_x() # Remember column starting X
+        y_start = self.get_y()
+        
+        # --- Draw Title --- 
+        self.set_font("helvetica", "B", 10)
+        self.cell(width, self.section_title_height, title, border="B", align="L")
+        # Y position after title and gap
+        y_after_title = y_start + self.section_title_height + self.gap_after_section_title
+        self.set_xy(start_x, y_after_title)
+            
+        # --- Draw Content --- 
+        if content:
+            self.set_font("helvetica", "", 9)
+            # Wrap once, then draw the wrapped lines; the height follows from the line count
+            lines = self.wrap_text(width, str(content))
+            content_height = len(lines) * self.line_height
+            for line in lines:
+                self.cell(width, self.line_height, line, border=0, align="L", new_x=XPos.LEFT, new_y=YPos.NEXT)
+            # Calculate Y position after drawing the content
+            y_after_content = y_after_title + content_height
+            self.set_y(y_after_content)
+        else: # No content, Y position is just after title gap
+            self.set_y(y_after_title)
+            
+        self.set_x(start_x) # Reset X to column start
+        return self.get_y() # Return final Y position after drawing this section
+
+    def add_full_width_section(self, title, content):
+         if content:
+            self.set_font("helvetica", "B", 10)
+            self.cell(0, self.section_title_height, title, border="B", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.ln(self.gap_after_section_title)
+            self.set_font("helvetica", "", 9)
+            self.multi_cell(0, self.line_height, str(content))
+            self.ln(self.gap_between_sections)
+            self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+            self.ln(2)
+
+    def add_two_column_sections(self, left_sections, right_sections):
+        y_start_columns = self.get_y()
+        y_left_ends = []
+        y_right_ends = []
+        left_items = list(left_sections.items())
+        right_items = list(right_sections.items())
+        
+        # Draw Left Column Sections
+        current_x_left = self.l_margin
+        self.set_xy(current_x_left, y_start_columns)
+        current_y_left = y_start_columns
+        for i, (title, content) in enumerate(left_items):
+            self.set_xy(current_x_left, current_y_left) # Set position for this section
+            current_y_left = self.add_section_in_column(title, content, self.col_width)
+            y_left_ends.append(current_y_left) # Store end Y for each section
+            # Add gap between sections in the same column
+            if i < len(left_items) - 1:
+                 current_y_left += self.gap_between_sections
+            
+        # Set position for Right Column Sections
+        current_x_right = self.l_margin + self.col_width + self.col_gap
+        self.set_xy(current_x_right, y_start_columns) # Start right col at same Y
+        current_y_right = y_start_columns
+        for i, (title, content) in enumerate(right_items):
+            self.set_xy(current_x_right, current_y_right) # Set position for this section
+            current_y_right = self.add_section_in_column(title, content, self.col_width)
+            y_right_ends.append(current_y_right)
+             # Add gap between sections in the same column
+            if i < len(right_items) - 1:
+                 current_y_right += self.gap_between_sections
+            
+        # Determine the overall final Y position based on the tallest column's last section end
+        final_y = max(y_left_ends[-1] if y_left_ends else y_start_columns, 
+                      y_right_ends[-1] if y_right_ends else y_start_columns)
+        self.set_y(final_y)
+        self.ln(self.gap_after_final_section) # Use final gap after the whole block
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(2)
+
+    def add_prescription_table(self, prescriptions):
+        self.set_font("helvetica", "B", 10)
+        self.cell(0, self.section_title_height, "Prescription (Rx)", border="B", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(self.gap_after_section_title)
+        if not prescriptions: 
+            self.set_font("helvetica", "I", 9)
+            self.cell(0, self.line_height, "(No prescription details recorded)")
+            self.ln(self.line_height + self.gap_between_sections)
+            self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+            self.ln(2)
+            return
+
+        self.set_font("helvetica", "B", 9)
+        total_width = self.page_content_width
+        sno_width = 8
+        med_width = total_width * 0.35 
+        dos_width = total_width * 0.15
+        instr_width = total_width - sno_width - med_width - dos_width # Remaining width
+        col_widths = (sno_width, med_width, dos_width, instr_width)
+        headers = ("S.No.", "Medicine", "Dosage", "Instructions")
+        
+        # Draw Table Header
+        for i, header in enumerate(headers):
+            self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
+        self.ln()
+
+        self.set_font("helvetica", "", 9)
+        for idx, med in enumerate(prescriptions):
+            y_before = self.get_y()
+            x_before = self.get_x()
+            cell_padding = 1.2 
+            
+            sno = str(idx + 1) + "."
+            # Use correct keys from JSON
+            text_medicine = str(med.get('medicine_name', ''))
+            text_dosage = str(med.get('dosage', ''))
+            # Combine frequency, duration, instructions
+            freq = med.get('frequency', '')
+            dur = med.get('duration', '')
+            instr = med.get('instructions', '')
+            text_instructions = f"{freq}{' for ' + dur if dur else ''}{('. ' + instr) if instr else ''}".strip()
+            if not text_instructions: # Handle empty case
+                 text_instructions = dur # Fallback to just duration if freq/instr are empty
+            
+            # Wrap each cell once; the row height comes from the longest cell
+            cells = [
+                ([sno], col_widths[0], 'C'),
+                (self.wrap_text(col_widths[1], text_medicine), col_widths[1], 'L'),
+                (self.wrap_text(col_widths[2], text_dosage), col_widths[2], 'L'),
+                (self.wrap_text(col_widths[3], text_instructions), col_widths[3], 'L'),
+            ]
+            max_lines = max(len(lines) for lines, _, _ in cells)
+            
+            row_height = max_lines * self.line_height * cell_padding
+            row_height = max(row_height, self.line_height * 1.4) # Min height
+
+            # Page break check
+            if self.get_y() + row_height > self.page_break_trigger:
+                 self.add_page()
+                 self.set_font("helvetica", "B", 9)
+                 for i, header in enumerate(headers):
+                     self.cell(col_widths[i], self.line_height * 1.3, header, border=1, align="C")
+                 self.ln()
+                 self.set_font("helvetica", "", 9)
+                 y_before = self.get_y()
+                 x_before = self.get_x()
+
+            # Draw cells from the wrapped lines: a single line is centred in the row,
+            # several lines stack from the top (as multi_cell with max_line_height did)
+            current_x = x_before
+            for lines, width, align in cells:
+                self.line(current_x, y_before, current_x, y_before + row_height)
+                if len(lines) == 1:
+                    self.set_xy(current_x, y_before)
+                    self.cell(width, row_height, lines[0], border=0, align=align)
+                else:
+                    for line_index, line in enumerate(lines):
+                        self.set_xy(current_x, y_before + line_index * self.line_height)
+                        self.cell(width, self.line_height, line, border=0, align=align)
+                current_x += width
+            self.line(current_x, y_before, current_x, y_before + row_height) # Right edge
+            
+            self.line(x_before, y_before + row_height, x_before + sum(col_widths), y_before + row_height)
+            self.set_y(y_before + row_height)
+        
+        self.ln(self.gap_between_sections)
+        self.line(self.l_margin, self.get_y(), self.w - self.r_margin, self.get_y())
+        self.ln(2)
+
+    def add_follow_up(self, date):
+        if not date: return
+        self.set_font("helvetica", "B", 9)
+        date_str = date.strftime('%d-%b-%Y') if isinstance(date, datetime.date) else str(date)
+        self.cell(0, self.line_height, f"Follow-up advised on: {date_str}", align="L", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(self.gap_after_final_section)
+        # No line needed if this is the last item before footer
+
+    def add_consultation(self, consultation_data, vitals):
+        """Lays out one consultation starting on a new page."""
+        # Wraps are only reused within a consultation; history PDFs hold hundreds of them
+        self._wrap_cache.clear()
+        self.add_page()
+        self.set_auto_page_break(auto=True, margin=15)
+
+        # Add Patient Details & Date (using updated methods)
+        self.add_patient_details(consultation_data['patient_name'], consultation_data['patient_id'], consultation_data['patient_dob'], consultation_data['patient_gender'],
+                                 consultation_data['consultation_date'])
+        self.add_consultation_date(consultation_data['consultation_date'])
+        if consultation_data.get('consulting_doctor'): # History documents span doctors
+            self.add_consulting_doctor(consultation_data['consulting_doctor'])
+
+        # Add Vitals Section (using updated method)
+        self.add_vitals(vitals)
+
+        # --- Add Consultation Sections in Two Columns --- 
+        left_column_data = {
+            "Chief Complaints": consultation_data.get('chief_complaints', ''),
+            "Clinical Findings": consultation_data.get('clinical_findings', ''),
+            "Procedures Conducted": consultation_data.get('procedures_conducted', '')
+        }
+        right_column_data = {
+            "Diagnosis": consultation_data.get('diagnosis', ''),
+            "Investigations": consultation_data.get('investigations', ''),
+            "Advice Given": consultation_data.get('advice_given', '')
+        }
+        self.add_two_column_sections(left_column_data, right_column_data)
+        # --- End Two Column Section --- 
+
+        # Add Prescription Table (Full Width)
+        prescription_details = consultation_data.get('prescription_details')
+        if isinstance(prescription_details, str): # Handle JSON string from DB
+            try: prescription_details = json.loads(prescription_details)
+            except json.JSONDecodeError: prescription_details = None
+
+        if prescription_details and isinstance(prescription_details, list) and len(prescription_details) > 0:
+             self.add_prescription_table(prescription_details)
+        else:
+             # Add note if no prescription (using full_width_section for consistency)
+             self.add_full_width_section("Prescription", "(No prescription details recorded)")
+
+        # Add Follow-up Date (Full Width)
+        if consultation_data.get('follow_up_date'):
+            self.add_follow_up(consultation_data['follow_up_date'])
+
+
+def render_consultation_pdf(consultation_data, doctor_data, latest_vitals):
+    """Lays out one consultation PDF and returns its bytes."""
+    pdf = ConsultationPDF(doctor_data)
+    pdf.add_consultation(consultation_data, latest_vitals)
+    return bytes(pdf.output())
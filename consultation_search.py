@@ -0,0 +1,93 @@
+"""Full-text search over past consultations.
+
+Backed by the InnoDB FULLTEXT index ft_consultation_search on chief
+complaints, diagnosis, prescribed drug names and advice
+(migrations/003_consultation_fulltext.sql). Prescriptions are stored as JSON,
+so save_consultation also writes the drug names alone to
+Consultation.prescription_drug_names; indexing the JSON would match its keys
+("medicine_name", "dosage") in every row.
+
+Queries run in boolean mode: every word is required and matches as a prefix
+("metfor" finds metformin), and hits are ordered by relevance. Archived
+consultations (ConsultationArchive, see archive.py) are searched too. Pages are
+fetched with one extra row to tell whether another page exists, which avoids a
+second COUNT(*) over the whole match set.
+"""
+import re
+
+SEARCH_COLUMNS = "c.chief_complaints, c.diagnosis, c.prescription_drug_names, c.advice_given"
+MIN_TERM_LENGTH = 3 # innodb_ft_min_token_size; shorter words are not in the index
+MAX_TERMS = 8
+_TERM_RE = re.compile(r"[^\W_]+(?:[-'][^\W_]+)*", re.UNICODE)
+
+
+def drug_names(prescriptions):
+    """Space-separated medicine names from a prescription_details list, for the FULLTEXT index."""
+    names = []
+    for med in prescriptions or []:
+        if isinstance(med, dict):
+            name = str(med.get("medicine_name") or "").strip()
+            if name:
+                names.append(name)
+    return " ".join(names)
+
+
+def boolean_query(text):
+    """Turns free text into a boolean-mode expression, or '' if no word is long enough.
+
+    User input never reaches the parser as operators: only word characters are kept.
+    """
+    terms = []
+    for match in _TERM_RE.finditer(text or ""):
+        # Hyphens and apostrophes split tokens in the index; require each part
+        for part in re.split(r"[-']", match.group(0).lower()):
+            if len(part) >= MIN_TERM_LENGTH and f"+{part}*" not in terms:
+                terms.append(f"+{part}*")
+    return " ".join(terms[:MAX_TERMS])
+
+
+def build_search_query(text, limit, offset, patient_id=None, tables=("Consultation",)):
+    """Returns (sql, params) for one page of ranked hits, or None when text has no searchable word.
+
+    tables: the consultation tables to search, e.g. Consultation and
+    ConsultationArchive (both carry ft_consultation_search). Each table's best
+    offset + limit hits are merged by score. Relevance is weighted by each
+    index's own word statistics, so scores from the two tables are close to,
+    not exactly, what one index over all rows would give.
+    """
+    expression = boolean_query(text)
+    if not expression:
+        return None
+    patient_filter = "AND c.patient_id = %s" if patient_id is not None else ""
+    selects, params = [], []
+    for table in tables:
+        selects.append(f"""
+            (SELECT c.id, c.patient_id, p.name AS patient_name, c.consultation_date,
+                    c.chief_complaints, c.diagnosis, c.prescription_drug_names, c.advice_given,
+                    MATCH({SEARCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE) AS score
+             FROM {table} c
+             JOIN Patient p ON c.patient_id = p.id
+             WHERE MATCH({SEARCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE) {patient_filter}
+             ORDER BY score DESC, c.consultation_date DESC, c.id DESC
+             LIMIT %s)""")
+        params.extend((expression, expression))
+        if patient_id is not None:
+            params.append(patient_id)
+        params.append(offset + limit) # The page may come entirely from this table
+    sql = "\n            UNION ALL".join(selects) + """
+        ORDER BY score DESC, consultation_date DESC, id DESC
+        LIMIT %s OFFSET %s
+    """
+    params.extend((limit, offset))
+    return sql, tuple(params)
+
+
+def snippet(text, terms, width=160):
+    """A window of text around the first matching term, for result listings."""
+    if not text:
+        return ""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if term in lowered]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    fragment = text[start:start + width].strip()
+    return ("..." if start else "") + fragment + ("..." if start + width < len(text) else "")
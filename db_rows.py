@@ -0,0 +1,42 @@
+"""Compact row objects for fetch_iter.
+
+A dict per row costs a hash table per row; a class with __slots__ stores just
+the values, at roughly a third of the memory for typical rows. Rows still read
+like the dicts they replace: templates use row.name, Python code may use
+row['name'], and as_dict() gives a dict for jsonify.
+"""
+import functools
+import keyword
+
+
+class Row:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+@functools.lru_cache(maxsize=128)
+def row_class(columns):
+    """Returns a Row subclass with one slot per column name (a tuple), cached per column list."""
+    for name in columns:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError(f"Column '{name}' is not a valid attribute name; alias it in the query")
+
+    def __init__(self, *values):
+        for name, value in zip(columns, values):
+            setattr(self, name, value)
+
+    return type("Row", (Row,), {"__slots__": columns, "__init__": __init__})
@@ -0,0 +1,173 @@
+"""Offline drug-name detection for live ADR checks.
+
+A DrugMatcher compiles the drug dictionary (brand names, generic names and
+active moieties from OpenFDA labels; see build_drug_dictionary.py) into an
+Aho-Corasick automaton and scans a transcript in one linear pass, so most
+drug names are found in microseconds without a Gemini call. Only sentences
+with no dictionary hit that still look like they mention a medicine
+(prescription cues, drug-like suffixes) are sent to Gemini as a fallback.
+"""
+import re
+import json
+import logging
+from collections import deque
+
+# Salt / formulation words stripped from generic names to get the active moiety
+SALT_WORDS = frozenset("""
+    hydrochloride hcl sodium potassium calcium magnesium besylate tartrate succinate sulfate bisulfate
+    hyclate maleate mesylate fumarate citrate acetate phosphate bromide chloride monohydrate dihydrate
+    trihydrate anhydrous hydrobromide dipropionate propionate valerate disodium er xr sr cr extended release
+""".split())
+
+# Words too common in speech to trust as drug names on their own
+STOP_TERMS = frozenset("""
+    all day care one plus relief daily good health nature natural cold flu pain night time
+    allergy sleep and for with the of oral tablets capsules
+""".split())
+
+MIN_TERM_LENGTH = 4
+
+PRESCRIPTION_CUES = re.compile(
+    r"\b(?:\d+\s*(?:mg|mcg|ml|units?|iu|g)\b|tablets?|tabs?|capsules?|caps?|syrup|injection|inhaler|drops|ointment|cream"
+    r"|prescrib\w*|start(?:ed|ing)?\s+(?:on|him|her|them)|tak(?:e|es|ing)|dose|dosage|twice|thrice|daily"
+    r"|once\s+a\s+day|at\s+night|before\s+food|after\s+food|od|bd|bid|tds|tid|qid|sos|prn)\b",
+    re.IGNORECASE
+)
+DRUG_SUFFIXES = re.compile(
+    r"\b\w{2,}(?:pril|sartan|olol|alol|statin|cillin|mycin|micin|floxacin|azole|prazole|tidine|dipine|formin|gliptin"
+    r"|glitazone|gliflozin|parin|xaban|gatran|triptan|oxetine|setron|tadine|zepam|zolam|cycline|vir|vudine|mab|nib"
+    r"|profen|fenac|coxib|olone|asone|thiazide|semide|terol|tropium|lukast|dronate)\b",
+    re.IGNORECASE
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def normalize_term(text):
+    """Lower-cases and collapses anything that is not a letter or digit to single spaces."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).split())
+
+
+def active_moiety(generic_name):
+    """'METFORMIN HYDROCHLORIDE' -> 'metformin'; leaves combination names alone."""
+    words = normalize_term(generic_name).split()
+    if " and " in f" {' '.join(words)} ":
+        return None
+    while words and words[-1] in SALT_WORDS:
+        words.pop()
+    return " ".join(words) or None
+
+
+class DrugMatch:
+    __slots__ = ("term", "generic", "start", "end", "text")
+
+    def __init__(self, term, generic, start, end, text):
+        self.term = term # Normalized dictionary term
+        self.generic = generic # Generic name the term belongs to
+        self.start = start # Offsets into the original transcript
+        self.end = end
+        self.text = text # Surface form as spoken
+
+    def __repr__(self):
+        return f"DrugMatch({self.text!r} -> {self.generic!r} @ {self.start})"
+
+
+class DrugMatcher:
+    """Aho-Corasick automaton over normalized dictionary terms, matching on word boundaries."""
+
+    def __init__(self, terms):
+        """terms: dict of normalized term -> generic name."""
+        self.terms = dict(terms)
+        self._goto = [{}] # state -> {char: state}
+        self._fail = [0]
+        self._output = [()] # state -> tuple of term lengths ending here
+        for term in self.terms:
+            self._add(term)
+        self._build_failure_links()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            dictionary = json.load(f)
+        matcher = cls(dictionary["terms"])
+        logging.info(f"Loaded drug dictionary with {len(matcher.terms)} terms from {path}")
+        return matcher
+
+    def _add(self, term):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + (len(term),)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """Returns non-overlapping matches, preferring the longest leftmost term."""
+        # Normalize to lowercase alphanumerics + single spaces, remembering original offsets
+        chars, offsets = [" "], [0] # Leading space acts as a word boundary
+        for i, char in enumerate(text.lower()):
+            if char.isalnum():
+                chars.append(char)
+                offsets.append(i)
+            elif chars[-1] != " ":
+                chars.append(" ")
+                offsets.append(i)
+        chars.append(" ")
+        offsets.append(len(text))
+        normalized = "".join(chars)
+
+        candidates = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in output[state]:
+                start = i - length + 1
+                # Whole words only: bounded by spaces in the normalized text
+                if normalized[start - 1] == " " and normalized[i + 1] == " ":
+                    candidates.append((start, -length))
+
+        matches = []
+        last_end = 0
+        for start, neg_length in sorted(candidates):
+            end = start - neg_length
+            if start < last_end:
+                continue
+            term = normalized[start:end]
+            original_start, original_end = offsets[start], offsets[end - 1] + 1
+            matches.append(DrugMatch(term, self.terms[term], original_start, original_end, text[original_start:original_end]))
+            last_end = end
+        return matches
+
+
+def fallback_sentences(text, matches):
+    """Returns the sentences with no dictionary hit that still look like they mention a medicine."""
+    sentences = []
+    position = 0
+    for sentence in SENTENCE_SPLIT.split(text):
+        start = text.find(sentence, position)
+        end = start + len(sentence)
+        position = end
+        if not sentence.strip() or any(start <= match.start < end for match in matches):
+            continue
+        if PRESCRIPTION_CUES.search(sentence) or DRUG_SUFFIXES.search(sentence):
+            sentences.append(sentence.strip())
+    return sentences
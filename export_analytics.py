@@ -0,0 +1,239 @@
+"""Exports consultations, prescriptions, vitals and symptom logs for analysis.
+
+Each table is read through an unbuffered cursor, --chunk-size rows at a time, and
+every chunk is written out before the next is fetched. Memory therefore stays
+bounded by the chunk size however large the tables are (app.fetch_all, by
+contrast, loads a whole result set into a list of dicts). Output is Parquet,
+one row group per chunk, when pyarrow is installed, and gzip-compressed NDJSON
+otherwise or with --format ndjson. Prescriptions are flattened from the
+consultation JSON into their own file, one row per medicine. Archived rows
+(archive.py) are included.
+
+Raw transcripts and internal notes are not exported.
+
+Usage:
+    python export_analytics.py [-o exports/] [--since 2024-01-01] [--until 2025-01-01]
+                               [--datasets consultations vitals symptoms] [--format parquet|ndjson] [--chunk-size 5000]
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import decimal
+import datetime
+import argparse
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from archive import ARCHIVED_TABLES, read_watermarks, tables_for
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # Optional; NDJSON needs only the standard library
+    pyarrow = None
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# dataset: (source table, columns as (name, type))
+DATASETS = {
+    "consultations": ("Consultation", (
+        ("id", "int"), ("consultation_date", "datetime"), ("patient_id", "int"), ("doctor_id", "int"),
+        ("chief_complaints", "str"), ("clinical_findings", "str"), ("procedures_conducted", "str"),
+        ("diagnosis", "str"), ("investigations", "str"), ("advice_given", "str"), ("follow_up_date", "date"),
+        ("prescription_details", "json"),
+    )),
+    "vitals": ("Vitals", (
+        ("id", "int"), ("checkin_time", "datetime"), ("patient_id", "int"), ("operator_id", "int"),
+        ("bp_systolic", "int"), ("bp_diastolic", "int"), ("heart_rate", "int"), ("temperature", "float"),
+        ("spo2", "float"), ("weight_kg", "float"), ("height_cm", "float"), ("notes", "str"),
+    )),
+    "symptoms": ("SymptomLog", (
+        ("id", "int"), ("log_timestamp", "datetime"), ("patient_id", "int"), ("user_id", "int"),
+        ("symptom_description", "str"), ("severity", "int"),
+    )),
+}
+# Written alongside consultations; prescription_details is replaced by these in the output
+CONSULTATION_COLUMNS = tuple(c for c in DATASETS["consultations"][1] if c[1] != "json") + (
+    ("prescription_count", "int"), ("prescription_drug_names", "str"))
+PRESCRIPTION_COLUMNS = (
+    ("consultation_id", "int"), ("consultation_date", "datetime"), ("patient_id", "int"), ("line_no", "int"),
+    ("medicine_name", "str"), ("dosage", "str"), ("frequency", "str"), ("duration", "str"), ("instructions", "str"),
+)
+
+
+def _coerce(value, kind):
+    if value is None:
+        return None
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    if kind == "str":
+        return value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
+    if kind == "date" and isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def flatten_consultation(row):
+    """Returns (consultation record, prescription records) for one consultation row dict."""
+    try:
+        prescriptions = json.loads(row.pop("prescription_details") or "[]")
+    except (TypeError, ValueError):
+        prescriptions = []
+    if not isinstance(prescriptions, list):
+        prescriptions = []
+    lines = []
+    for line_no, med in enumerate((m for m in prescriptions if isinstance(m, dict)), start=1):
+        lines.append({
+            "consultation_id": row["id"], "consultation_date": row["consultation_date"], "patient_id": row["patient_id"],
+            "line_no": line_no, **{key: _coerce(med.get(key), "str") for key in
+                                   ("medicine_name", "dosage", "frequency", "duration", "instructions")},
+        })
+    row["prescription_count"] = len(lines)
+    row["prescription_drug_names"] = "; ".join(line["medicine_name"] for line in lines if line["medicine_name"])
+    return row, lines
+
+
+class NdjsonSink:
+    """Gzip-compressed newline-delimited JSON; dates as ISO strings."""
+    extension = ".ndjson.gz"
+
+    def __init__(self, path, columns):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, default=_json_default, ensure_ascii=False))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class ParquetSink:
+    """Parquet file with a fixed schema; each write() becomes one row group."""
+    extension = ".parquet"
+
+    def __init__(self, path, columns):
+        types = {"int": pyarrow.int64(), "float": pyarrow.float64(), "str": pyarrow.string(),
+                 "datetime": pyarrow.timestamp("s"), "date": pyarrow.date32()}
+        self._schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, records):
+        if records:
+            self._writer.write_table(pyarrow.Table.from_pylist(records, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def iter_chunks(conn, table, columns, date_column, since, until, chunk_size):
+    """Yields lists of row dicts, chunk_size at a time, from an unbuffered cursor."""
+    conditions, params = [], []
+    if since:
+        conditions.append(f"{date_column} >= %s")
+        params.append(since)
+    if until:
+        conditions.append(f"{date_column} < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    names = [name for name, _ in columns]
+    kinds = [kind for _, kind in columns]
+    # Rows are sent as they are fetched, not all at once
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT {', '.join(names)} FROM {table} {where} ORDER BY id", tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [{name: _coerce(value, kind) for name, kind, value in zip(names, kinds, row)} for row in rows]
+    finally:
+        cursor.close()
+
+
+def export_dataset(conn, dataset, out_dir, stamp, sink_class, since, until, chunk_size, watermarks):
+    table, columns = DATASETS[dataset]
+    outputs = {dataset: CONSULTATION_COLUMNS if dataset == "consultations" else columns}
+    if dataset == "consultations":
+        outputs["prescriptions"] = PRESCRIPTION_COLUMNS
+    sinks = {name: sink_class(os.path.join(out_dir, f"{name}-{stamp}{sink_class.extension}"), cols)
+             for name, cols in outputs.items()}
+    counts = dict.fromkeys(sinks, 0)
+    start = time.perf_counter()
+    try:
+        for source in tables_for(watermarks, table, since, oldest_first=True):
+            for chunk in iter_chunks(conn, source, columns, ARCHIVED_TABLES[table][1], since, until, chunk_size):
+                if dataset == "consultations":
+                    prescriptions = []
+                    for row in chunk:
+                        prescriptions.extend(flatten_consultation(row)[1])
+                    sinks["prescriptions"].write(prescriptions)
+                    counts["prescriptions"] += len(prescriptions)
+                sinks[dataset].write(chunk)
+                counts[dataset] += len(chunk)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    elapsed = time.perf_counter() - start
+    for name, count in counts.items():
+        print(f"{name}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not YYYY-MM-DD")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output-dir", default="exports")
+    parser.add_argument("--since", type=parse_date, help="Rows dated on or after this day")
+    parser.add_argument("--until", type=parse_date, help="Rows dated before this day")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--format", choices=["parquet", "ndjson"], default="parquet" if pyarrow else "ndjson")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.format == "parquet" and pyarrow is None:
+        parser.error("Parquet output needs pyarrow (pip install pyarrow); use --format ndjson")
+
+    load_dotenv()
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    sink_class = ParquetSink if args.format == "parquet" else NdjsonSink
+    conn = mysql.connector.connect(host=os.getenv("DB_HOST"), user=os.getenv("DB_USER"),
+                                   password=os.getenv("DB_PASSWORD"), database=os.getenv("DB_NAME"))
+    try:
+        # The server waits on us while a chunk is written; don't let it drop the stream
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION net_write_timeout = 600")
+        cursor.close()
+        watermarks = read_watermarks(conn)
+        for dataset in args.datasets:
+            export_dataset(conn, dataset, args.output_dir, stamp, sink_class, args.since, args.until,
+                           args.chunk_size, watermarks)
+    except mysql.connector.Error as err:
+        print(f"Export stopped: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
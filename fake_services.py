@@ -0,0 +1,329 @@
+"""Local stand-in servers for the Gemini API and OpenFDA, for offline load testing.
+
+Starts two HTTP servers:
+  * a fake Gemini REST backend (generateContent, streamGenerateContent, models.get)
+  * a fake OpenFDA drug label endpoint (/drug/label.json) serving a seeded dataset
+
+Point the app at them with:
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8091
+    OPENFDA_BASE_URL=http://127.0.0.1:8092
+
+Latency, error and rate-limit behaviour is configurable per service and driven
+by a seeded RNG, so runs are repeatable. Latency specs:
+    fixed:0.4          always 0.4 s
+    uniform:0.2,1.5    uniform between 0.2 and 1.5 s
+    normal:0.8,0.2     normal(mean, sd), clipped at 0
+    lognormal:-0.5,0.6 lognormal(mu, sigma) of seconds
+
+Usage: python fake_services.py --gemini-latency lognormal:0,0.5 --gemini-429-rate 0.05 --seed 7
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_LABELS_PATH = "fake_data/openfda_labels.json"
+
+
+def parse_latency(spec):
+    """Parses a latency spec into a function rng -> seconds."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise argparse.ArgumentTypeError(f"Unknown latency spec '{spec}'")
+
+
+class FaultProfile:
+    """Latency, random failures and an optional QPS limit for one fake service."""
+
+    def __init__(self, latency, error_rate=0.0, rate_limit_rate=0.0, max_qps=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_qps = max_qps
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_count = 0
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def draw(self):
+        """Returns (delay_seconds, outcome) where outcome is 'ok', 'error' or 'rate_limited'."""
+        with self._lock:
+            self.counts["requests"] += 1
+            delay = self.latency(self._rng)
+            roll = self._rng.random()
+            now = time.time()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            if (self.max_qps and self._window_count > self.max_qps) or roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return delay, "rate_limited"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return delay, "error"
+            return delay, "ok"
+
+
+def load_labels(path):
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)["results"]
+    names = set()
+    for label in results:
+        openfda = label.get("openfda", {})
+        for name in openfda.get("brand_name", []) + openfda.get("generic_name", []):
+            names.add(name.lower())
+        for name in openfda.get("generic_name", []):
+            names.add(name.split()[0].lower()) # Active moiety without the salt, e.g. "metformin"
+    return results, sorted(names, key=len, reverse=True)
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    profile = None
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            sys.stderr.write(f"[{self.server.label}] {fmt % args}\n")
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def apply_faults(self, error_payload, rate_limit_payload):
+        """Sleeps for the drawn latency; returns True if a fault response was sent."""
+        delay, outcome = self.profile.draw()
+        time.sleep(delay)
+        if outcome == "rate_limited":
+            self.send_json(429, rate_limit_payload)
+            return True
+        if outcome == "error":
+            self.send_json(500, error_payload)
+            return True
+        return False
+
+
+# --- Fake Gemini ---
+
+class FakeGeminiHandler(JsonHandler):
+    drug_names = []
+    stream_chunks = 6
+    stream_chunk_delay = 0.05
+
+    def do_GET(self):
+        match = re.match(r"^/v1(?:beta)?/models/([^/?:]+)", self.path)
+        if not match:
+            return self.send_json(404, gemini_error(404, "NOT_FOUND", "Not found"))
+        model = match.group(1)
+        self.send_json(200, {"name": f"models/{model}", "displayName": f"Fake {model}",
+                             "inputTokenLimit": 1048576, "outputTokenLimit": 8192,
+                             "supportedGenerationMethods": ["generateContent", "countTokens"]})
+
+    def do_POST(self):
+        path = urlparse(self.path)
+        match = re.match(r"^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$", path.path)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not match:
+            return self.send_json(404, gemini_error(404, "NOT_FOUND", "Not found"))
+        if self.apply_faults(gemini_error(500, "INTERNAL", "An internal error has occurred."),
+                             gemini_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")):
+            return
+
+        prompt = "".join(part.get("text", "") for content in request.get("contents", [])
+                         for part in content.get("parts", []))
+        json_mode = request.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        text = self.fake_completion(prompt, json_mode)
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(prompt) + len(text)) // 4}
+
+        if match.group(2) == "generateContent":
+            return self.send_json(200, gemini_response(text, usage))
+        self.stream_response(text, usage, sse=parse_qs(path.query).get("alt") == ["sse"])
+
+    def stream_response(self, text, usage, sse):
+        """Sends the completion in chunks, as a JSON array (REST default) or SSE."""
+        size = max(1, -(-len(text) // self.stream_chunks))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        if not sse:
+            write_chunk(b"[")
+        for i, piece in enumerate(pieces):
+            payload = json.dumps(gemini_response(piece, usage if i == len(pieces) - 1 else None))
+            if sse:
+                write_chunk(f"data: {payload}\r\n\r\n".encode())
+            else:
+                write_chunk(((",\r\n" if i else "") + payload).encode())
+            time.sleep(self.stream_chunk_delay)
+        if not sse:
+            write_chunk(b"]")
+        write_chunk(b"")
+
+    def fake_completion(self, prompt, json_mode):
+        """Builds a deterministic answer from the drug names found in the prompt."""
+        transcript = prompt.rsplit("```", 2)[-2] if prompt.count("```") >= 2 else prompt
+        drugs = [name for name in self.drug_names if re.search(rf"\b{re.escape(name)}\b", transcript, re.IGNORECASE)]
+        if "Potential Drug Names" in prompt:
+            return json.dumps([name.title() for name in drugs])
+        if "Merge them into a single consultation record" in prompt:
+            parts = re.findall(r"^Part \d+: (\{.*\})$", prompt, re.MULTILINE)
+            return parts[-1] if parts else "{}"
+
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", transcript.strip()) if s.strip()]
+        draft = {
+            "chief_complaints": sentences[0] if sentences else "",
+            "clinical_findings": sentences[1] if len(sentences) > 1 else "",
+            "internal_notes": "",
+            "diagnosis": "Fake diagnosis for load testing",
+            "procedures_conducted": "",
+            "prescription_details": [{"medicine_name": name.title(), "dosage": "1 tab", "frequency": "twice daily",
+                                      "duration": "5 days", "instructions": ""} for name in drugs[:5]],
+            "investigations": "CBC",
+            "advice_given": "Rest and fluids",
+            "follow_up_date": "",
+        }
+        if json_mode:
+            return json.dumps(draft, indent=1)
+        rx = "\n".join(f"{p['medicine_name']} | {p['dosage']} | {p['frequency']} for {p['duration']}"
+                       for p in draft["prescription_details"]) or "None mentioned"
+        return (f"Chief Complaints:\n{draft['chief_complaints']}\n\nClinical Findings:\n{draft['clinical_findings'] or 'None mentioned'}\n\n"
+                f"Internal Notes:\nNone mentioned\n\nDiagnosis:\n{draft['diagnosis']}\n\nProcedures Conducted:\nNone mentioned\n\n"
+                f"Prescription:\n{rx}\n\nInvestigations:\n{draft['investigations']}\n\nAdvice Given:\n{draft['advice_given']}\n\n"
+                f"Follow-Up Date:\nNone mentioned\n")
+
+
+def gemini_response(text, usage=None):
+    response = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                "finishReason": "STOP", "index": 0}]}
+    if usage:
+        response["usageMetadata"] = usage
+    return response
+
+
+def gemini_error(code, status, message):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+
+# --- Fake OpenFDA ---
+
+OPENFDA_TERM_PATTERN = re.compile(r'openfda\.(brand_name|generic_name):"([^"]+)"', re.IGNORECASE)
+
+
+class FakeOpenFDAHandler(JsonHandler):
+    labels = []
+
+    def do_GET(self):
+        path = urlparse(self.path)
+        if path.path != "/drug/label.json":
+            return self.send_json(404, openfda_error("NOT_FOUND", "Not found"))
+        if self.apply_faults(openfda_error("SERVER_ERROR", "Check your request and try again"),
+                             openfda_error("OVER_RATE_LIMIT", "API rate limit exceeded")):
+            return
+
+        query = parse_qs(path.query)
+        search = query.get("search", [""])[0]
+        limit = int(query.get("limit", ["1"])[0])
+        terms = [(field.lower(), " ".join(term.replace("+", " ").lower().split()))
+                 for field, term in OPENFDA_TERM_PATTERN.findall(search)]
+        matches = [label for label in self.labels if label_matches(label, terms)]
+        if not matches:
+            return self.send_json(404, openfda_error("NOT_FOUND", "No matches found!"))
+        self.send_json(200, {
+            "meta": {"results": {"skip": 0, "limit": limit, "total": len(matches)}},
+            "results": matches[:limit],
+        })
+
+
+def label_matches(label, terms):
+    """True if any searched brand/generic term appears as a phrase in the label's names."""
+    openfda = label.get("openfda", {})
+    for field, term in terms:
+        for name in openfda.get(field, []):
+            if re.search(rf"\b{re.escape(term)}\b", name.lower()):
+                return True
+    return False
+
+
+def openfda_error(code, message):
+    return {"error": {"code": code, "message": message}}
+
+
+def serve(handler_class, port, label, verbose):
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+    server.label = label
+    server.verbose = verbose
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name=label, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--labels", default=DEFAULT_LABELS_PATH, help="OpenFDA label dump used as the seeded dataset")
+    parser.add_argument("--verbose", action="store_true")
+    for name, port, latency in (("gemini", 8091, "lognormal:-0.3,0.4"), ("openfda", 8092, "uniform:0.05,0.3")):
+        parser.add_argument(f"--{name}-port", type=int, default=port)
+        parser.add_argument(f"--{name}-latency", type=parse_latency, default=parse_latency(latency),
+                            help=f"latency spec (default {latency})")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help="fraction of 500 responses")
+        parser.add_argument(f"--{name}-429-rate", type=float, default=0.0, help="fraction of 429 responses")
+        parser.add_argument(f"--{name}-max-qps", type=int, default=None, help="return 429 above this many requests/s")
+    parser.add_argument("--stream-chunks", type=int, default=6, help="chunks per streamed Gemini response")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    labels, drug_names = load_labels(args.labels)
+    FakeOpenFDAHandler.labels = labels
+    FakeGeminiHandler.drug_names = drug_names
+    FakeGeminiHandler.stream_chunks = args.stream_chunks
+    FakeGeminiHandler.stream_chunk_delay = args.stream_chunk_delay
+
+    profiles = {}
+    for name, handler in (("gemini", FakeGeminiHandler), ("openfda", FakeOpenFDAHandler)):
+        profiles[name] = FaultProfile(
+            getattr(args, f"{name}_latency"), getattr(args, f"{name}_error_rate"),
+            getattr(args, f"{name}_429_rate"), getattr(args, f"{name}_max_qps"),
+            seed=args.seed + (0 if name == "gemini" else 1)
+        )
+        handler_class = type(f"{handler.__name__}Bound", (handler,), {"profile": profiles[name]})
+        serve(handler_class, getattr(args, f"{name}_port"), name, args.verbose)
+
+    print(f"Fake Gemini:  GEMINI_API_ENDPOINT=http://127.0.0.1:{args.gemini_port}")
+    print(f"Fake OpenFDA: OPENFDA_BASE_URL=http://127.0.0.1:{args.openfda_port} ({len(labels)} labels)")
+    try:
+        while True:
+            time.sleep(30)
+            print(" | ".join(f"{name}: {profile.counts}" for name, profile in profiles.items()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Fuzzy lookup of misrecognized drug names.
+
+Speech-to-text often garbles drug names ("met forming", "lipator"). A
+FuzzyDrugIndex maps a heard token to ranked dictionary candidates using two
+cheap candidate sources:
+  * a phonetic key (consonant skeleton with common sound-alike folds), so
+    spellings that sound the same collide in one dict lookup
+  * a trigram index: a term within k edits of the word must share all but
+    3k of its trigrams, so only terms passing that count (and a length
+    filter) are verified with a bounded Levenshtein distance that scales
+    with word length
+Built from the same dictionary as drug_matcher.DrugMatcher. A BK-tree was
+tried first, but in pure Python it computes a full distance at every visited
+node, which is several times slower than trigram counting.
+"""
+import re
+
+from drug_matcher import normalize_term
+
+_WORD = re.compile(r"[A-Za-z]+")
+MIN_FUZZY_WORD_LENGTH = 5 # Shorter words collide with too many ordinary words
+DOSAGE_FORM_PREFIXES = frozenset("tab tabs tablet cap caps capsule syp syrup inj injection oint ointment".split())
+
+# Sound-alike folds applied in order before dropping vowels
+_PHONETIC_FOLDS = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"ck|q"), "k"),
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"c"), "k"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"(?<=[^aeiou])h"), ""),
+    (re.compile(r"y"), "i"),
+    (re.compile(r"dg"), "j"),
+    (re.compile(r"gh"), "g"),
+    (re.compile(r"th"), "t"),
+]
+_VOWELS_AFTER_FIRST = re.compile(r"(?<=.)[aeiou]")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+def phonetic_key(word):
+    """'Lipitor' -> 'lptr', 'lipator' -> 'lptr'; spaces are ignored ('met formin' == 'metformin')."""
+    key = re.sub(r"[^a-z]", "", word.lower())
+    for pattern, replacement in _PHONETIC_FOLDS:
+        key = pattern.sub(replacement, key)
+    key = _REPEATS.sub(r"\1", key)
+    return _VOWELS_AFTER_FIRST.sub("", key)
+
+
+def bounded_levenshtein(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(a) + 1))
+    for j, char_b in enumerate(b, 1):
+        current = [j]
+        row_min = j
+        for i, char_a in enumerate(a, 1):
+            cost = min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (char_a != char_b))
+            current.append(cost)
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_distance_for(word):
+    """Edit budget: 1 for short words, 2 up to 10 letters, 3 beyond."""
+    length = len(word.replace(" ", ""))
+    if length <= 5:
+        return 1
+    return 2 if length <= 10 else 3
+
+
+def trigrams(word):
+    padded = f"##{word}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DrugCandidate:
+    __slots__ = ("term", "generic", "distance", "phonetic", "score")
+
+    def __init__(self, term, generic, distance, phonetic, score):
+        self.term = term
+        self.generic = generic
+        self.distance = distance
+        self.phonetic = phonetic # True if the phonetic keys are equal
+        self.score = score # 0..1, higher is better
+
+    def to_dict(self):
+        return {"name": self.term.title(), "generic": self.generic, "distance": self.distance,
+                "phonetic": self.phonetic, "score": self.score}
+
+    def __repr__(self):
+        return f"DrugCandidate({self.term!r}, d={self.distance}, phonetic={self.phonetic}, score={self.score})"
+
+
+class FuzzyDrugIndex:
+    """Maps a possibly misheard word (or two) to ranked candidate drug terms."""
+
+    def __init__(self, terms, min_length=4, max_verify=40):
+        """terms: dict of normalized term -> generic name (the drug dictionary)."""
+        self.terms = dict(terms)
+        self.max_verify = max_verify # Edit distances computed per lookup, at most
+        self._by_key = {} # phonetic key -> [term]
+        self._by_gram = {} # trigram -> [term]
+        self._gram_counts = {} # term -> number of distinct trigrams
+        for term in self.terms:
+            if len(term) < min_length:
+                continue
+            self._by_key.setdefault(phonetic_key(term), []).append(term)
+            grams = trigrams(term)
+            self._gram_counts[term] = len(grams)
+            for gram in grams:
+                self._by_gram.setdefault(gram, []).append(term)
+
+    def lookup(self, text, limit=3):
+        """Returns up to limit DrugCandidates for text, best first ([] if nothing is close)."""
+        word = normalize_term(text)
+        if not word:
+            return []
+        if word in self.terms:
+            return [DrugCandidate(word, self.terms[word], 0, True, 1.0)]
+        max_distance = max_distance_for(word)
+        key = phonetic_key(word)
+        found = {}
+        for term in self._by_key.get(key, ()):
+            # Sound-alikes may need more edits than the budget; allow one extra
+            distance = bounded_levenshtein(word, term, max_distance + 1)
+            if distance <= max_distance + 1:
+                found[term] = distance
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for term in self._by_gram.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        # Each edit changes at most 3 trigrams (q-gram lemma); verify only the best-sharing few
+        length = len(word)
+        passing = [(count, term) for term, count in shared.items()
+                   if abs(len(term) - length) <= max_distance
+                   and count >= max(len(grams), self._gram_counts[term]) - 3 * max_distance]
+        passing.sort(reverse=True)
+        for _, term in passing[:self.max_verify]:
+            if term in found:
+                continue
+            distance = bounded_levenshtein(word, term, max_distance)
+            if distance <= max_distance:
+                found[term] = distance
+
+        candidates = []
+        for term, distance in found.items():
+            phonetic = phonetic_key(term) == key
+            score = 1.0 - distance / max(len(word), len(term))
+            if phonetic:
+                score = min(0.99, score + 0.1) # 1.0 is reserved for exact matches
+            candidates.append(DrugCandidate(term, self.terms[term], distance, phonetic, round(score, 3)))
+        candidates.sort(key=lambda c: (-c.score, c.distance, c.term))
+        return candidates[:limit]
+
+    def best_match(self, text, min_score=0.75):
+        """Returns the top candidate if it is confident enough to act on, else None."""
+        candidates = self.lookup(text, limit=2)
+        if not candidates or candidates[0].score < min_score:
+            return None
+        # Ambiguous: two different drugs equally close
+        if len(candidates) > 1 and candidates[1].score == candidates[0].score and candidates[1].generic != candidates[0].generic:
+            return None
+        return candidates[0]
+
+    def find_in_text(self, text, min_score=0.8):
+        """Returns (heard text, DrugCandidate) for confident matches of words or word pairs in text.
+
+        Word pairs catch names split by STT ("met forming"); a pair is only
+        tried when neither word matched on its own.
+        """
+        words = _WORD.findall(text)
+        results = []
+        matched = set()
+        for i, word in enumerate(words):
+            if len(word) >= MIN_FUZZY_WORD_LENGTH:
+                candidate = self.best_match(word, min_score)
+                if candidate:
+                    results.append((word, candidate))
+                    matched.add(i)
+        for i in range(len(words) - 1):
+            if i in matched or i + 1 in matched or len(words[i]) + len(words[i + 1]) < 7:
+                continue
+            pair = f"{words[i]} {words[i + 1]}"
+            candidate = self.best_match(pair, min_score) or self.best_match(pair.replace(" ", ""), min_score)
+            if candidate:
+                results.append((pair, candidate))
+                matched.update((i, i + 1))
+        return results
+
+    def suggest(self, medicine_name, min_score=0.8):
+        """Returns a DrugCandidate to suggest for a prescription name, or None if it is already known."""
+        words = normalize_term(medicine_name).split()
+        while words and words[0] in DOSAGE_FORM_PREFIXES: # "Tab. Zertec" -> "zertec"
+            words.pop(0)
+        # Known name, possibly followed by strength or form ("metformin 500 mg tablet")
+        if not words or any(" ".join(words[:n]) in self.terms for n in (1, 2, 3, 4)):
+            return None
+        for n in (2, 1):
+            if len(words) >= n:
+                candidate = self.best_match(" ".join(words[:n]), min_score) or \
+                    (n == 2 and self.best_match("".join(words[:2]), min_score))
+                if candidate:
+                    return candidate
+        return None
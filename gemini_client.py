@@ -0,0 +1,308 @@
+"""Shared Gemini client: priority-aware concurrency limit, single-flight and retries.
+
+All Gemini calls go through one GeminiClient so that end-of-consultation
+summaries are served before background ADR polls, identical prompts that are
+already in flight share one API call, and rate-limit (429) / transient errors
+are retried with jittered exponential backoff.
+"""
+import time
+import heapq
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import google.api_core.exceptions
+
+# Lower value = served first
+PRIORITY_SUMMARY = 0
+PRIORITY_ADR = 10
+PRIORITY_NAMES = {PRIORITY_SUMMARY: "summary", PRIORITY_ADR: "adr"}
+
+RATE_LIMIT_ERRORS = (
+    google.api_core.exceptions.ResourceExhausted, # 429 from the gRPC transport
+    google.api_core.exceptions.TooManyRequests, # 429 from the REST transport
+)
+TRANSIENT_ERRORS = RATE_LIMIT_ERRORS + (
+    google.api_core.exceptions.ServiceUnavailable,
+    google.api_core.exceptions.InternalServerError,
+    google.api_core.exceptions.DeadlineExceeded,
+)
+
+
+class GeminiBusyError(RuntimeError):
+    """Raised when a call could not get a Gemini slot within its queue timeout."""
+
+
+class GeminiUnavailableError(RuntimeError):
+    """Raised without calling the API while the Gemini circuit breaker is open."""
+
+
+class PrioritySemaphore:
+    """Counting semaphore that hands free slots to the lowest priority value first."""
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._in_use = 0
+        self._waiters = [] # Heap of [priority, seq, event, cancelled]
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, priority, timeout=None):
+        with self._lock:
+            if self._in_use < self._limit and not self._waiters:
+                self._in_use += 1
+                return True
+            self._seq += 1
+            waiter = [priority, self._seq, threading.Event(), False]
+            heapq.heappush(self._waiters, waiter)
+        if waiter[2].wait(timeout):
+            return True
+        with self._lock:
+            if waiter[2].is_set(): # Granted between the timeout and taking the lock
+                return True
+            waiter[3] = True # Cancelled; skipped when the heap is popped
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if not waiter[3]:
+                    waiter[2].set() # Hand the slot straight to the waiter
+                    return
+            self._in_use -= 1
+
+    def queue_depth(self):
+        """Returns the number of waiting callers per priority."""
+        with self._lock:
+            depth = {}
+            for priority, _, _, cancelled in self._waiters:
+                if not cancelled:
+                    depth[priority] = depth.get(priority, 0) + 1
+            return depth
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+
+class GeminiClient:
+    """Wraps a genai.GenerativeModel with limits, de-duplication and retries."""
+
+    def __init__(self, model, max_concurrency=4, max_retries=4, base_delay=1.0, max_delay=20.0,
+                 queue_timeouts=None, latency_window=200, breaker=None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeouts = queue_timeouts or {} # priority -> seconds (None waits forever)
+        self.breaker = breaker # Optional health_monitor.CircuitBreaker fed with call outcomes
+        self._semaphore = PrioritySemaphore(max_concurrency)
+        self._inflight = {} # single-flight key -> Future
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counters = {"calls": 0, "deduplicated": 0, "retries": 0, "rate_limited": 0,
+                          "failures": 0, "queue_timeouts": 0, "breaker_rejections": 0}
+        self._latencies = {} # priority -> deque of (queue_wait, call_latency)
+        self._latency_window = latency_window
+
+    # --- Public API ---
+
+    def generate(self, prompt, priority=PRIORITY_SUMMARY, generation_config=None, dedupe=True):
+        """Calls generate_content, sharing the result with identical in-flight calls."""
+        if not dedupe:
+            return self._call_with_retries(prompt, priority, generation_config)
+
+        key = self._flight_key(prompt, generation_config)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self._count("deduplicated")
+            return future.result()
+
+        try:
+            response = self._call_with_retries(prompt, priority, generation_config)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def generate_stream(self, prompt, priority=PRIORITY_SUMMARY, generation_config=None):
+        """Streams generate_content chunks, holding a slot until the stream is consumed.
+
+        Errors raised before the first chunk arrives are retried; once content
+        has been yielded a failure is passed through to the caller.
+        """
+        trial = self._check_breaker()
+        held = settled = False
+        start_time = time.time()
+        try:
+            queue_wait = self._acquire(priority)
+            held = True
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._count("calls")
+                    iterator = iter(self.model.generate_content(prompt, generation_config=generation_config, stream=True))
+                    first_chunk = next(iterator)
+                    break
+                except StopIteration:
+                    settled = self._breaker_outcome(True)
+                    return
+                except TRANSIENT_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        self._count("failures")
+                        settled = self._breaker_outcome(False)
+                        raise
+                    self._semaphore.release()
+                    held = False
+                    self._backoff(e, attempt, priority)
+                    queue_wait += self._acquire(priority)
+                    held = True
+                except Exception:
+                    self._count("failures")
+                    raise
+            settled = self._breaker_outcome(True)
+            yield first_chunk
+            yield from iterator
+            self._record_latency(priority, queue_wait, time.time() - start_time)
+        finally:
+            if held:
+                self._semaphore.release()
+            if not settled:
+                self._release_breaker_trial(trial)
+
+    def stats(self):
+        """Returns counters, queue depth and latency percentiles for monitoring."""
+        depth = self._semaphore.queue_depth()
+        with self._stats_lock:
+            latency = {}
+            for priority, samples in self._latencies.items():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                waits = sorted(s[0] for s in samples)
+                calls = sorted(s[1] for s in samples)
+                latency[name] = {
+                    "samples": len(samples),
+                    "queue_wait_p50": _percentile(waits, 0.5),
+                    "queue_wait_p95": _percentile(waits, 0.95),
+                    "latency_p50": _percentile(calls, 0.5),
+                    "latency_p95": _percentile(calls, 0.95),
+                }
+            counters = dict(self._counters)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "breaker": self.breaker.state if self.breaker is not None else None,
+            "in_flight": self._semaphore.in_use,
+            "queue_depth": {PRIORITY_NAMES.get(p, str(p)): n for p, n in depth.items()},
+            "single_flight_keys": len(self._inflight),
+            "counters": counters,
+            "latency_seconds": latency,
+        }
+
+    # --- Internals ---
+
+    def _flight_key(self, prompt, generation_config):
+        return hashlib.sha256(f"{prompt}\x00{generation_config!r}".encode("utf-8")).hexdigest()
+
+    def _acquire(self, priority):
+        """Waits for a slot; returns the time spent queued."""
+        start = time.time()
+        if not self._semaphore.acquire(priority, timeout=self.queue_timeouts.get(priority)):
+            self._count("queue_timeouts")
+            raise GeminiBusyError(f"No Gemini slot available for {PRIORITY_NAMES.get(priority, priority)} call")
+        return time.time() - start
+
+    def _call_with_retries(self, prompt, priority, generation_config):
+        trial = self._check_breaker()
+        settled = False # Every exit must end a half-open trial, or the breaker rejects all calls
+        queue_wait = 0.0
+        start_time = time.time()
+        try:
+            for attempt in range(self.max_retries + 1):
+                queue_wait += self._acquire(priority)
+                try:
+                    self._count("calls")
+                    response = self.model.generate_content(prompt, generation_config=generation_config)
+                except TRANSIENT_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        self._count("failures")
+                        settled = self._breaker_outcome(False)
+                        raise
+                    error = e
+                except Exception:
+                    self._count("failures")
+                    raise
+                else:
+                    settled = self._breaker_outcome(True)
+                    self._record_latency(priority, queue_wait, time.time() - start_time - queue_wait)
+                    return response
+                finally:
+                    self._semaphore.release()
+                # Back off without holding a slot so other callers can proceed
+                self._backoff(error, attempt, priority)
+        finally:
+            if not settled:
+                self._release_breaker_trial(trial)
+
+    def _check_breaker(self):
+        """Returns the breaker's token for this call (None without a breaker)."""
+        if self.breaker is None:
+            return None
+        trial = self.breaker.allow_request()
+        if not trial:
+            self._count("breaker_rejections")
+            raise GeminiUnavailableError("Gemini is unavailable (circuit breaker open)")
+        return trial
+
+    def _breaker_outcome(self, ok):
+        """Feeds a call outcome to the breaker; returns True (the call's trial, if any, is settled)."""
+        if self.breaker is not None:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return True
+
+    def _release_breaker_trial(self, trial):
+        # Busy (no slot) and non-transient errors say nothing about Gemini's health
+        if self.breaker is not None:
+            self.breaker.release_trial(trial)
+
+    def _backoff(self, error, attempt, priority):
+        rate_limited = isinstance(error, RATE_LIMIT_ERRORS)
+        if rate_limited:
+            self._count("rate_limited")
+        self._count("retries")
+        # Full jitter; rate limits start from a longer base delay
+        base = self.base_delay * (2 if rate_limited else 1)
+        delay = random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+        logging.warning(f"Gemini {PRIORITY_NAMES.get(priority, priority)} call failed "
+                        f"({type(error).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        time.sleep(delay)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _record_latency(self, priority, queue_wait, call_latency):
+        with self._stats_lock:
+            samples = self._latencies.setdefault(priority, deque(maxlen=self._latency_window))
+            samples.append((queue_wait, call_latency))
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
@@ -0,0 +1,192 @@
+"""Background dependency health checks and circuit breakers.
+
+A HealthMonitor thread probes each registered dependency (OpenFDA, Gemini,
+STT, MySQL) on its own interval and caches the result, so request handlers
+never block on a probe. Each dependency has a CircuitBreaker that is fed by
+both the probes and the outcomes of real calls: after enough consecutive
+failures the breaker opens and callers fail fast until a cool-down passes
+and a trial call (or the next successful probe) closes it again.
+"""
+import time
+import logging
+import threading
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+STATUS_UNKNOWN = "unknown"
+STATUS_UP = "up"
+STATUS_DOWN = "down"
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; allows one trial call after reset_timeout."""
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = BREAKER_CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None # Token of the half-open trial call in flight
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Returns a truthy token if a call may go ahead; None means fail fast.
+
+        The token is True while closed, and a fresh object for a half-open
+        trial call. A call that ends without recording a success or failure
+        passes its token to release_trial().
+        """
+        with self._lock:
+            if self._state == BREAKER_CLOSED:
+                return True
+            if self._state == BREAKER_OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state = BREAKER_HALF_OPEN
+                self._trial = None
+            if self._state == BREAKER_HALF_OPEN and self._trial is None:
+                self._trial = object() # Let exactly one trial call through
+                return self._trial
+            return None
+
+    def record_success(self):
+        with self._lock:
+            if self._state != BREAKER_CLOSED:
+                logging.info(f"Circuit breaker '{self.name}' closed")
+            self._state = BREAKER_CLOSED
+            self._failures = 0
+            self._trial = None
+
+    def release_trial(self, token):
+        """Ends a half-open trial call that finished without a success or failure to record.
+
+        Only the call holding the trial's token releases it; calls let through
+        while the breaker was closed pass True, which releases nothing.
+        """
+        with self._lock:
+            if token is not None and token is self._trial:
+                self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = None
+            if self._state == BREAKER_HALF_OPEN or (self._state == BREAKER_CLOSED and self._failures >= self.failure_threshold):
+                if self._state == BREAKER_CLOSED:
+                    logging.warning(f"Circuit breaker '{self.name}' opened after {self._failures} consecutive failures")
+                self._state = BREAKER_OPEN
+                self._opened_at = time.time()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == BREAKER_OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                return BREAKER_HALF_OPEN
+            return self._state
+
+
+class _Check:
+    def __init__(self, name, probe, interval, critical):
+        self.name = name
+        self.probe = probe
+        self.interval = interval
+        self.critical = critical
+        self.status = STATUS_UNKNOWN
+        self.last_checked = None
+        self.latency = None
+        self.error = None
+        self.next_run = 0.0
+
+
+class HealthMonitor:
+    """Runs dependency probes on a daemon thread and keeps their latest status."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._checks = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register(self, name, probe, interval=30, critical=True):
+        """Adds a probe: a callable that raises (or returns False) when the dependency is unhealthy."""
+        with self._lock:
+            self._checks[name] = _Check(name, probe, interval, critical)
+
+    def breaker(self, name):
+        """Returns the dependency's breaker, creating it so clients can be wired up before probes."""
+        with self._lock:
+            return self._breakers.setdefault(name, CircuitBreaker(name, self.failure_threshold, self.reset_timeout))
+
+    def is_open(self, name):
+        """True while the dependency's breaker rejects calls (does not use up a half-open trial)."""
+        return self.breaker(name).state == BREAKER_OPEN
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_check(self, name):
+        """Runs one probe now and updates its status and breaker."""
+        check = self._checks[name]
+        start = time.time()
+        try:
+            healthy = check.probe() is not False
+            error = None if healthy else "probe reported unhealthy"
+        except Exception as e:
+            healthy = False
+            error = type(e).__name__ # Exposed on /health, so keep details (URLs, keys) in the log only
+            logging.debug(f"Health probe '{name}' failed: {e}")
+        with self._lock:
+            was = check.status
+            check.status = STATUS_UP if healthy else STATUS_DOWN
+            check.last_checked = time.time()
+            check.latency = round(check.last_checked - start, 3)
+            check.error = error
+        if healthy:
+            self.breaker(name).record_success()
+        else:
+            self.breaker(name).record_failure()
+        if was != check.status:
+            log = logging.info if healthy else logging.warning
+            log(f"Dependency '{name}' is {check.status}" + (f" ({error})" if error else ""))
+
+    def status(self):
+        """Returns (overall_ok, per-dependency details) from cached probe results."""
+        with self._lock:
+            checks = list(self._checks.values())
+        dependencies = {}
+        overall_ok = True
+        for check in checks:
+            breaker = self.breaker(check.name)
+            dependencies[check.name] = {
+                "status": check.status,
+                "critical": check.critical,
+                "last_checked": check.last_checked,
+                "latency_seconds": check.latency,
+                "error": check.error,
+                "breaker": breaker.state,
+            }
+            if check.critical and (check.status == STATUS_DOWN or breaker.state == BREAKER_OPEN):
+                overall_ok = False
+        return overall_ok, dependencies
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            with self._lock:
+                due = [check for check in self._checks.values() if check.next_run <= now]
+            for check in due:
+                check.next_run = time.time() + check.interval
+                self.run_check(check.name)
+            with self._lock:
+                next_run = min((check.next_run for check in self._checks.values()), default=now + 5)
+            self._stop.wait(max(0.5, next_run - time.time()))
@@ -0,0 +1,73 @@
+"""Patient history PDF: every consultation of one patient in a single document.
+
+Runs in the PDF render pool (see pdf_render_pool.py), so it opens its own
+database connections. Consultations are read through an unbuffered cursor,
+which fetches rows from the server as the loop advances, and each one is laid
+out on new pages of one ConsultationPDF. Rows are taken HISTORY_BATCH_SIZE at
+a time so their vitals come from one query per batch; only the current batch
+is held in memory, not the whole result set. Consultations moved to
+ConsultationArchive are streamed first; they are all older than the hot rows
+(see archive.py).
+
+Caveat: fpdf2 keeps every finished page in memory until output(). Memory
+therefore still grows with page count, at a few kilobytes per page of
+content, rather than with the size of the consultation rows (transcripts,
+summaries). That keeps even a few hundred visits to a few megabytes.
+"""
+import mysql.connector
+
+from consultation_pdf import ConsultationPDF
+from vitals_as_of import vitals_as_of, VITALS_MAX_AGE
+from archive import tables_for
+
+HISTORY_QUERY = """
+    SELECT c.id, c.patient_id, c.doctor_id, c.consultation_date, c.chief_complaints, c.clinical_findings,
+           c.procedures_conducted, c.diagnosis, c.investigations, c.advice_given, c.prescription_details,
+           c.follow_up_date, p.name as patient_name, p.dob as patient_dob, p.gender as patient_gender,
+           u.name as consulting_doctor
+    FROM {table} c
+    JOIN Patient p ON c.patient_id = p.id
+    LEFT JOIN User u ON c.doctor_id = u.id
+    WHERE c.patient_id = %s
+    ORDER BY c.consultation_date, c.id
+"""
+HISTORY_BATCH_SIZE = 50 # Rows taken from the stream per vitals lookup
+
+
+def render_patient_history_pdf(db_config, patient_id, doctor_data, vitals_max_age=VITALS_MAX_AGE, watermarks=None):
+    """Returns (pdf bytes, number of consultations) for all of a patient's consultations, oldest first.
+
+    watermarks: archive cut-offs from ArchiveWatermarks.snapshot(); None reads the hot tables only.
+    """
+    conn = mysql.connector.connect(**db_config)
+    # An unbuffered cursor keeps its connection busy until exhausted, so vitals need a second one
+    vitals_conn = mysql.connector.connect(**db_config)
+    try:
+        rows = conn.cursor(dictionary=True, buffered=False)
+        vitals_cursor = vitals_conn.cursor(dictionary=True, buffered=True)
+
+        def run_vitals_query(sql, params):
+            vitals_cursor.execute(sql, params)
+            return vitals_cursor.fetchall()
+
+        watermarks = watermarks or {}
+        pdf = ConsultationPDF(doctor_data)
+        count = 0
+        for table in tables_for(watermarks, "Consultation", oldest_first=True):
+            rows.execute(HISTORY_QUERY.format(table=table), (patient_id,))
+            while True:
+                batch = rows.fetchmany(HISTORY_BATCH_SIZE)
+                if not batch:
+                    break
+                # One vitals query per batch of streamed consultations (per table, near the archive cut-off)
+                pairs = [(c['patient_id'], c['consultation_date']) for c in batch]
+                vitals_tables = tables_for(watermarks, "Vitals", batch[0]['consultation_date'] - vitals_max_age)
+                for consultation, vitals in zip(batch, vitals_as_of(run_vitals_query, pairs, max_age=vitals_max_age, tables=vitals_tables)):
+                    pdf.add_consultation(consultation, vitals)
+                count += len(batch)
+        rows.close()
+        vitals_cursor.close()
+        return (bytes(pdf.output()) if count else b""), count
+    finally:
+        conn.close()
+        vitals_conn.close()
@@ -0,0 +1,258 @@
+"""Background job queue shared through MySQL, with per-job event logs.
+
+Used for consultation summarization: a request inserts a job row and returns
+its id straight away, a worker thread claims the job and runs it, and clients
+poll the job for its status and the events published since their last poll
+(or subscribe to them as Server-Sent Events, replayable by sequence number).
+
+Jobs and their events live in the SummaryJob and SummaryJobEvent tables
+(migrations/006_summary_jobs.sql), so any web process can accept a job or
+answer a poll for it, and any process can run workers: the web processes
+themselves (SUMMARY_WORKERS) or dedicated ones (summary_worker.py). Workers
+claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, so each job runs
+once however many workers poll. A job whose worker died mid-run is failed
+after stale_after seconds rather than left running forever.
+"""
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+
+import mysql.connector
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+TERMINAL_STATES = (JOB_DONE, JOB_FAILED)
+
+PENDING_QUERY = "SELECT COUNT(*) FROM SummaryJob WHERE status = 'queued'"
+INSERT_QUERY = """
+    INSERT INTO SummaryJob (id, owner_id, status, payload, created_at)
+    VALUES (%s, %s, 'queued', %s, NOW(3))
+"""
+CLAIM_QUERY = """
+    SELECT id, payload FROM SummaryJob WHERE status = 'queued'
+    ORDER BY created_at LIMIT 1 FOR UPDATE SKIP LOCKED
+"""
+START_QUERY = "UPDATE SummaryJob SET status = 'running', worker = %s, started_at = NOW(3) WHERE id = %s"
+FINISH_QUERY = "UPDATE SummaryJob SET status = %s, result = %s, error = %s, finished_at = NOW(3) WHERE id = %s"
+JOB_QUERY = """
+    SELECT id, owner_id, status, result, error,
+           TIMESTAMPDIFF(MICROSECOND, created_at, COALESCE(started_at, NOW(3))) / 1000000 AS queued_seconds,
+           TIMESTAMPDIFF(MICROSECOND, started_at, COALESCE(finished_at, NOW(3))) / 1000000 AS run_seconds
+    FROM SummaryJob WHERE id = %s
+"""
+EVENT_INSERT_QUERY = "INSERT INTO SummaryJobEvent (job_id, seq, event, payload) VALUES (%s, %s, %s, %s)"
+EVENTS_QUERY = "SELECT seq, event, payload FROM SummaryJobEvent WHERE job_id = %s AND seq > %s ORDER BY seq"
+STATS_QUERY = "SELECT status, COUNT(*) FROM SummaryJob GROUP BY status"
+STALE_QUERY = """
+    UPDATE SummaryJob SET status = 'failed', error = 'Worker stopped before the job finished', finished_at = NOW(3)
+    WHERE status = 'running' AND started_at < NOW(3) - INTERVAL %s SECOND
+"""
+EXPIRED_EVENTS_QUERY = """
+    DELETE e FROM SummaryJobEvent e JOIN SummaryJob j ON j.id = e.job_id
+    WHERE j.finished_at < NOW(3) - INTERVAL %s SECOND
+"""
+EXPIRED_JOBS_QUERY = "DELETE FROM SummaryJob WHERE finished_at < NOW(3) - INTERVAL %s SECOND"
+PRUNE_INTERVAL_SECONDS = 60
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+class JobQueueUnavailable(RuntimeError):
+    """Raised when the job tables cannot be reached."""
+
+
+class Job:
+    """A claimed job, handed to the handler: publish() appends to its event log."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self._seq = 0
+
+    def publish(self, event, data):
+        self._seq += 1 # Only the worker that claimed the job publishes to it
+        self.queue._execute(EVENT_INSERT_QUERY, (self.id, self._seq, event, json.dumps(data)))
+
+
+class JobQueue:
+    """Queues jobs in MySQL and runs them on worker threads in any process.
+
+    connect returns a database connection (or None when the database is
+    unreachable); handler(job, payload) runs one job and its return value,
+    JSON-serializable, becomes the job result.
+    """
+
+    def __init__(self, connect, handler, max_pending=50, result_ttl=900, stale_after=600,
+                 poll_interval=1.0, name="jobs"):
+        self.connect = connect
+        self.handler = handler
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.name = name
+        self.workers = 0
+        self._threads = []
+        self._stopping = threading.Event()
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def submit(self, owner_id, payload):
+        """Enqueues a job with a JSON-serializable payload; returns its id."""
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(PENDING_QUERY)
+            (pending,) = cursor.fetchone()
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} {self.name} already waiting")
+            job_id = uuid.uuid4().hex
+            cursor.execute(INSERT_QUERY, (job_id, owner_id, json.dumps(payload)))
+            return job_id
+        except mysql.connector.Error as err:
+            raise JobQueueUnavailable(str(err)) from err
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get(self, job_id, owner_id=None):
+        """Returns the job's status dict, or None if unknown, expired or owned by someone else."""
+        conn = self._connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(JOB_QUERY, (job_id,))
+            row = cursor.fetchone()
+        except mysql.connector.Error as err:
+            raise JobQueueUnavailable(str(err)) from err
+        finally:
+            cursor.close()
+            conn.close()
+        if row is None or (owner_id is not None and row["owner_id"] != owner_id):
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "queued_seconds": round(float(row["queued_seconds"]), 3),
+            "run_seconds": round(float(row["run_seconds"]), 3) if row["run_seconds"] is not None else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        }
+
+    def events(self, job_id, after_seq=0):
+        """Returns the job's events with seq > after_seq as (seq, event, data)."""
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(EVENTS_QUERY, (job_id, after_seq))
+            return [(seq, event, json.loads(payload)) for seq, event, payload in cursor.fetchall()]
+        except mysql.connector.Error as err:
+            raise JobQueueUnavailable(str(err)) from err
+        finally:
+            cursor.close()
+            conn.close()
+
+    def stats(self):
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(STATS_QUERY)
+            counts = dict(cursor.fetchall())
+        except mysql.connector.Error as err:
+            raise JobQueueUnavailable(str(err)) from err
+        finally:
+            cursor.close()
+            conn.close()
+        return {"workers": self.workers, "max_pending": self.max_pending, "jobs": counts}
+
+    def start_workers(self, count):
+        """Starts count daemon threads that claim and run queued jobs until stop()."""
+        for _ in range(count):
+            index = len(self._threads) + 1
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.workers = len(self._threads)
+
+    def stop(self, timeout=None):
+        """Stops the workers after their current jobs and waits for them."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _connection(self):
+        conn = self.connect()
+        if conn is None:
+            raise JobQueueUnavailable("database unavailable")
+        return conn
+
+    def _execute(self, query, params):
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _claim(self, worker):
+        """Marks the oldest queued job as running for this worker; returns (id, payload) or None."""
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            conn.start_transaction()
+            cursor.execute(CLAIM_QUERY)
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.execute(START_QUERY, (worker, row[0]))
+            conn.commit()
+            return row
+        except mysql.connector.Error:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _work(self):
+        worker = f"{socket.gethostname()}:{threading.current_thread().name}"
+        while not self._stopping.is_set():
+            try:
+                self._prune()
+                claimed = self._claim(worker)
+            except (JobQueueUnavailable, mysql.connector.Error) as e:
+                logging.warning(f"{self.name} worker cannot reach the job tables: {e}")
+                claimed = None
+            if claimed is None:
+                self._stopping.wait(self.poll_interval)
+                continue
+            self._run(*claimed)
+
+    def _run(self, job_id, payload):
+        job = Job(self, job_id)
+        try:
+            result = self.handler(job, json.loads(payload))
+            status, result, error = JOB_DONE, json.dumps(result), None
+        except Exception as e:
+            logging.error(f"{self.name} job {job_id} failed: {type(e).__name__}: {e}", exc_info=True)
+            status, result, error = JOB_FAILED, None, str(e) or type(e).__name__
+        try:
+            self._execute(FINISH_QUERY, (status, result, error, job_id))
+        except (JobQueueUnavailable, mysql.connector.Error) as e: # Failed as stale once stale_after passes
+            logging.error(f"{self.name} job {job_id} finished but could not be recorded: {e}")
+
+    def _prune(self):
+        """Fails jobs whose worker stopped and deletes expired ones, at most once per PRUNE_INTERVAL_SECONDS."""
+        with self._prune_lock:
+            if time.monotonic() - self._last_prune < PRUNE_INTERVAL_SECONDS:
+                return
+            self._last_prune = time.monotonic()
+        self._execute(STALE_QUERY, (self.stale_after,))
+        self._execute(EXPIRED_EVENTS_QUERY, (self.result_ttl,))
+        self._execute(EXPIRED_JOBS_QUERY, (self.result_ttl,))
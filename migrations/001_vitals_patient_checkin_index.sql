@@ -0,0 +1,4 @@
+-- Vitals "as of" a consultation (vitals_as_of.py) joins Vitals on patient_id and a
+-- checkin_time range; this index turns each lookup into a short index range scan.
+-- Apply once: mysql -u <user> -p <database> < migrations/001_vitals_patient_checkin_index.sql
+CREATE INDEX idx_vitals_patient_checkin ON Vitals (patient_id, checkin_time);
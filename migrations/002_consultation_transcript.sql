@@ -0,0 +1,15 @@
+-- Raw transcripts and original Gemini output move out of Consultation into a
+-- compressed side table (transcript_store.py), loaded only on demand.
+-- Apply once: mysql -u <user> -p <database> < migrations/002_consultation_transcript.sql
+-- then move existing transcripts: python backfill_transcripts.py
+--
+-- No foreign key to Consultation: rows are looked up by consultation_id only,
+-- and a cascading delete would drop transcripts when consultations are moved.
+CREATE TABLE IF NOT EXISTS ConsultationTranscript (
+    consultation_id INT NOT NULL PRIMARY KEY,
+    codec VARCHAR(8) NOT NULL,
+    raw_transcript LONGBLOB NULL,
+    original_gemini_text LONGBLOB NULL,
+    raw_transcript_chars INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
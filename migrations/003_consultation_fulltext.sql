@@ -0,0 +1,16 @@
+-- Full-text search over consultations (consultation_search.py).
+-- Apply once: mysql -u <user> -p <database> < migrations/003_consultation_fulltext.sql
+-- Needs MySQL 8.0.4+ (JSON_TABLE). Building the index reads the whole table once.
+
+-- Drug names alone; indexing prescription_details JSON would match its keys in every row
+ALTER TABLE Consultation ADD COLUMN prescription_drug_names TEXT NULL;
+
+UPDATE Consultation c
+SET c.prescription_drug_names = (
+    SELECT GROUP_CONCAT(jt.medicine_name SEPARATOR ' ')
+    FROM JSON_TABLE(c.prescription_details, '$[*]' COLUMNS (medicine_name VARCHAR(255) PATH '$.medicine_name')) jt
+)
+WHERE JSON_VALID(c.prescription_details);
+
+CREATE FULLTEXT INDEX ft_consultation_search
+    ON Consultation (chief_complaints, diagnosis, prescription_drug_names, advice_given);
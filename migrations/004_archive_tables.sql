@@ -0,0 +1,16 @@
+-- Archive tables for rows older than the archival horizon (archive.py, archive_data.py).
+-- Apply once, after 003: mysql -u <user> -p <database> < migrations/004_archive_tables.sql
+--
+-- LIKE copies columns and indexes (including the FULLTEXT index) but not foreign keys.
+-- Any later ALTER of a hot table must be applied to its archive too, because
+-- archive_data.py copies rows with INSERT ... SELECT *.
+CREATE TABLE IF NOT EXISTS ConsultationArchive LIKE Consultation;
+CREATE TABLE IF NOT EXISTS VitalsArchive LIKE Vitals;
+CREATE TABLE IF NOT EXISTS SymptomLogArchive LIKE SymptomLog;
+
+-- Rows of table_name dated before archived_before may be in its archive table
+CREATE TABLE IF NOT EXISTS ArchiveWatermark (
+    table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    archived_before DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
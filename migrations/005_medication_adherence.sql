@@ -0,0 +1,24 @@
+-- Medication adherence (adherence.py, record_adherence.py).
+-- Apply once, after 004: mysql -u <user> -p <database> < migrations/005_medication_adherence.sql
+--
+-- log_medication now records when each dose was taken. Rows logged before this
+-- migration have no reliable time and keep taken_at NULL, so adherence ignores
+-- them. If your MedicationLog already has a timestamp column, copy it over:
+--   UPDATE MedicationLog SET taken_at = <timestamp column> WHERE taken_at IS NULL;
+ALTER TABLE MedicationLog ADD COLUMN taken_at DATETIME NULL;
+CREATE INDEX idx_medicationlog_patient_taken ON MedicationLog (patient_id, taken_at);
+
+-- Nightly snapshot per patient and medicine; the window is the window_days days before computed_for
+CREATE TABLE IF NOT EXISTS MedicationAdherence (
+    computed_for DATE NOT NULL,
+    patient_id INT NOT NULL,
+    medicine_name VARCHAR(255) NOT NULL,
+    window_days SMALLINT NOT NULL,
+    doses_expected INT NOT NULL,
+    doses_on_schedule INT NOT NULL,
+    doses_taken INT NOT NULL,
+    missed_days SMALLINT NOT NULL,
+    adherence_pct DECIMAL(4,1) NULL, -- NULL for medicines taken as needed
+    PRIMARY KEY (computed_for, patient_id, medicine_name),
+    KEY idx_adherence_patient (patient_id, computed_for)
+);
@@ -0,0 +1,28 @@
+-- Shared summary job queue (job_queue.py, summary_worker.py).
+-- Apply once, after 005: mysql -u <user> -p <database> < migrations/006_summary_jobs.sql
+--
+-- Any web process can enqueue a job or answer a poll for it, and any worker
+-- thread, in a web process or in summary_worker.py, can run it. Workers claim
+-- queued jobs with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0+).
+CREATE TABLE IF NOT EXISTS SummaryJob (
+    id CHAR(32) NOT NULL PRIMARY KEY,
+    owner_id INT NOT NULL,
+    status VARCHAR(16) NOT NULL, -- queued, running, done or failed
+    payload MEDIUMTEXT NOT NULL, -- JSON arguments for the job
+    result MEDIUMTEXT NULL, -- JSON
+    error TEXT NULL,
+    worker VARCHAR(128) NULL,
+    created_at DATETIME(3) NOT NULL,
+    started_at DATETIME(3) NULL,
+    finished_at DATETIME(3) NULL,
+    KEY idx_summaryjob_status (status, created_at)
+);
+
+-- Events published by a running job, replayed to pollers and event streams by seq
+CREATE TABLE IF NOT EXISTS SummaryJobEvent (
+    job_id CHAR(32) NOT NULL,
+    seq INT NOT NULL,
+    event VARCHAR(32) NOT NULL,
+    payload MEDIUMTEXT NOT NULL, -- JSON
+    PRIMARY KEY (job_id, seq)
+);
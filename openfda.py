@@ -0,0 +1,268 @@
+"""OpenFDA drug-label lookups with a shared, disk-persisted TTL cache.
+
+Whether a label exists for "Metformin" does not change during the day, so
+check_adr caches each normalized drug name's result: positive results for a
+long time, negative (404) results for a shorter time in case of a transient
+bad answer. Request errors are never cached. The cache is saved to a JSON file
+(written atomically) so it survives restarts.
+
+Cache misses are looked up concurrently on a bounded thread pool under an
+overall deadline (lookup_many). Names are not combined into one OR query:
+with a result limit, a multi-name search cannot prove which names are absent.
+"""
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import Future, wait
+
+import requests
+
+LABEL_FOUND = True
+LABEL_NOT_FOUND = False
+
+_NON_NAME_CHARS = re.compile(r"[^a-z0-9]+")
+_thread_local = threading.local()
+
+
+class OpenFDAUnavailableError(RuntimeError):
+    """Raised for a cache miss while the OpenFDA circuit breaker is open."""
+
+
+def normalize_drug_name(name):
+    """Lower-cases and collapses punctuation/whitespace: ' Metformin-HCl ' -> 'metformin hcl'."""
+    return " ".join(_NON_NAME_CHARS.sub(" ", (name or "").lower()).split())
+
+
+def label_search_url(label_url, api_key, drug_name):
+    """Builds the label.json URL matching a brand or generic name, as check_adr always has."""
+    drug_term = drug_name.replace(' ', '+').strip()
+    label_query = f'(openfda.brand_name:"{drug_term}"+OR+openfda.generic_name:"{drug_term}")'
+    return f"{label_url}?api_key={api_key}&search={label_query}&limit=1"
+
+
+def query_drug_label(http, label_url, api_key, drug_name, timeout=10):
+    """Asks OpenFDA whether a label exists for drug_name.
+
+    Returns LABEL_FOUND or LABEL_NOT_FOUND. Raises requests.RequestException
+    (or ValueError for a malformed body) when the answer is unknown.
+    """
+    url = label_search_url(label_url, api_key, drug_name)
+    logging.debug(f"Querying OpenFDA Drug Label: {url}")
+    response = http.get(url, timeout=timeout)
+    if response.status_code == 404: # Drug not in label DB
+        return LABEL_NOT_FOUND
+    response.raise_for_status()
+    total_found = response.json().get("meta", {}).get("results", {}).get("total", 0)
+    return LABEL_FOUND if total_found > 0 else LABEL_NOT_FOUND
+
+
+def _thread_session():
+    """One requests.Session per worker thread (sessions are not safe to share)."""
+    http = getattr(_thread_local, "session", None)
+    if http is None:
+        http = _thread_local.session = requests.Session()
+    return http
+
+
+class LabelLookupResult:
+    """Outcome of lookup_many: found/not-found names plus those left undecided."""
+
+    def __init__(self):
+        self.found = [] # Names with a label, in request order
+        self.not_found = []
+        self.pending = [] # Still querying when the deadline passed (results will be cached)
+        self.failed = [] # Request errors or breaker open
+
+    @property
+    def partial(self):
+        return bool(self.pending or self.failed)
+
+
+class DrugLabelCache:
+    """Thread-safe normalized-name -> label-exists cache with separate positive/negative TTLs."""
+
+    def __init__(self, path=None, positive_ttl=86400, negative_ttl=3600, save_interval=30, max_entries=50000):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.save_interval = save_interval
+        self.max_entries = max_entries
+        self._entries = {} # normalized name -> (found, expires_at)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._counters = {"hits_positive": 0, "hits_negative": 0, "misses": 0, "expired": 0, "stores": 0,
+                          "deduplicated": 0}
+        self._inflight = {} # normalized name -> Future, shared by concurrent polls
+        if path:
+            self.load()
+
+    def get(self, drug_name):
+        """Returns LABEL_FOUND / LABEL_NOT_FOUND, or None on a miss."""
+        key = normalize_drug_name(drug_name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits_positive" if entry[0] else "hits_negative"] += 1
+            return entry[0]
+
+    def put(self, drug_name, found):
+        key = normalize_drug_name(drug_name)
+        if not key:
+            return
+        ttl = self.positive_ttl if found else self.negative_ttl
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._evict_expired(time.time())
+                if len(self._entries) >= self.max_entries: # Still full: drop the soonest to expire
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][1])]
+            self._entries[key] = (bool(found), time.time() + ttl)
+            self._counters["stores"] += 1
+            self._dirty = True
+        self.maybe_save()
+
+    def lookup_many(self, executor, drug_names, label_url, api_key, deadline, request_timeout=10, breaker=None):
+        """Validates several names at once: cache hits immediately, misses concurrently on executor.
+
+        Waits until the absolute time.time() deadline at most. Lookups still
+        running then are reported as pending but keep going in the background
+        and fill the cache, so the next poll gets their answer. A name already
+        being queried by another request shares that query.
+        """
+        result = LabelLookupResult()
+        futures = {} # name -> Future
+        seen = set()
+        for name in drug_names:
+            key = normalize_drug_name(name)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            found = self.get(name)
+            if found is not None:
+                (result.found if found else result.not_found).append(name)
+                continue
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    leader = True
+                else:
+                    self._counters["deduplicated"] += 1
+                    leader = False
+            if leader:
+                executor.submit(self._lookup_into, future, key, name, label_url, api_key, request_timeout, breaker)
+            futures[name] = future
+
+        if futures:
+            wait(futures.values(), timeout=max(0.0, deadline - time.time()))
+        for name, future in futures.items():
+            if not future.done():
+                result.pending.append(name)
+            elif future.exception() is not None:
+                error = future.exception()
+                if not isinstance(error, OpenFDAUnavailableError):
+                    logging.error(f"OpenFDA API request failed for drug label '{name}': {type(error).__name__}: {error}")
+                result.failed.append(name)
+            else:
+                (result.found if future.result() else result.not_found).append(name)
+        return result
+
+    def _lookup_into(self, future, key, name, label_url, api_key, timeout, breaker):
+        try:
+            future.set_result(self._query(name, label_url, api_key, timeout, breaker))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _query(self, drug_name, label_url, api_key, timeout, breaker):
+        if breaker is not None and not breaker.allow_request():
+            raise OpenFDAUnavailableError("OpenFDA is unavailable (circuit breaker open)")
+        try:
+            found = query_drug_label(_thread_session(), label_url, api_key, drug_name, timeout=timeout)
+        except Exception:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        self.put(drug_name, found)
+        return found
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+            inflight = len(self._inflight)
+        hits = counters["hits_positive"] + counters["hits_negative"]
+        lookups = hits + counters["misses"]
+        return {
+            "entries": size,
+            "in_flight": inflight,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "positive_ttl": self.positive_ttl,
+            "negative_ttl": self.negative_ttl,
+            "counters": counters,
+        }
+
+    # --- Persistence ---
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable OpenFDA cache file {self.path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, (found, expires_at) in stored.get("entries", {}).items():
+                if expires_at > now:
+                    self._entries[key] = (bool(found), expires_at)
+        logging.info(f"Loaded {len(self._entries)} OpenFDA label cache entries from {self.path}")
+
+    def maybe_save(self):
+        """Saves if there are changes and the last save is older than save_interval."""
+        if self.path and self._dirty and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Writes the live entries to disk via a temp file and atomic rename."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                self._evict_expired(time.time())
+                snapshot = {key: list(entry) for key, entry in self._entries.items()}
+                self._dirty = False
+                self._last_save = time.time()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix=".openfda-cache-", dir=directory)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": 1, "entries": snapshot}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.error(f"Failed to save OpenFDA cache to {self.path}: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _evict_expired(self, now):
+        for key in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
@@ -0,0 +1,87 @@
+"""Render-once disk cache for consultation PDFs.
+
+A saved consultation rarely changes, but download_pdf used to rebuild the PDF
+(fonts, layout, every table) on each download. Rendered PDFs are stored as
+
+    <root>/<doctor_id>/<consultation_id>-<version>.pdf
+
+where version is a hash of everything drawn on the page: the consultation and
+patient row, the doctor/clinic profile, the vitals shown and the layout
+version. Any change to those inputs yields a new version, so a stale PDF is
+never served; the version doubles as the HTTP ETag. Older versions of a
+consultation are deleted when a new one is stored, and update_settings drops a
+doctor's whole directory since every one of their PDFs shows the clinic details.
+"""
+import os
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+
+def pdf_version(layout_version, *parts):
+    """Returns a short content hash of the layout version and the data rows drawn in the PDF."""
+    payload = json.dumps([layout_version, *parts], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class PdfCache:
+    def __init__(self, root):
+        # Absolute, so paths handed to Flask's send_file (which resolves relative
+        # paths against app.root_path, not the working directory) match the files written here
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "store_errors": 0, "invalidations": 0}
+
+    def _doctor_dir(self, doctor_id):
+        return os.path.join(self.root, str(int(doctor_id)))
+
+    def path(self, doctor_id, consultation_id, version):
+        return os.path.join(self._doctor_dir(doctor_id), f"{int(consultation_id)}-{version}.pdf")
+
+    def get(self, doctor_id, consultation_id, version):
+        """Returns the cached file path, or None if this version has not been rendered."""
+        path = self.path(doctor_id, consultation_id, version)
+        found = os.path.exists(path)
+        self._count("hits" if found else "misses")
+        return path if found else None
+
+    def put(self, doctor_id, consultation_id, version, data):
+        """Stores rendered bytes and removes older versions; returns the path, or None on error."""
+        directory = self._doctor_dir(doctor_id)
+        path = self.path(doctor_id, consultation_id, version)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Temp file + rename so a concurrent download never reads a half-written PDF
+            fd, tmp_path = tempfile.mkstemp(prefix=".pdf-", dir=directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not cache PDF for consultation {consultation_id}: {e}")
+            self._count("store_errors")
+            return None
+        for old_path in glob.glob(os.path.join(directory, f"{int(consultation_id)}-*.pdf")):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass # Already removed by a concurrent store
+        self._count("stores")
+        return path
+
+    def invalidate_doctor(self, doctor_id):
+        """Deletes every cached PDF of a doctor (after their clinic details change)."""
+        shutil.rmtree(self._doctor_dir(doctor_id), ignore_errors=True)
+        self._count("invalidations")
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
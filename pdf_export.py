@@ -0,0 +1,89 @@
+"""Bulk consultation PDF export as a streamed ZIP.
+
+Renders run in the shared PDF render pool (pdf_render_pool.py) with a sliding
+window of at most `window` renders in flight. Each finished PDF is appended to the archive and handed to the
+response right away, so memory stays bounded by the window, not by the number
+of consultations exported.
+
+zipfile writes to ZipChunkWriter, which is unseekable: zipfile then emits a
+data descriptor after each member instead of seeking back to patch the local
+header, which is what lets the archive be streamed.
+"""
+import time
+import zipfile
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class ZipChunkWriter:
+    """Write-only file object collecting zipfile output until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(members):
+    """Yields ZIP bytes for an iterable of (arcname, date_time tuple, data) as members arrive.
+
+    PDFs are already deflate-compressed internally, so members are stored.
+    """
+    writer = ZipChunkWriter()
+    with zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, date_time, data in members:
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            archive.writestr(info, data)
+            yield writer.drain()
+    yield writer.drain() # Central directory, written on close
+
+
+def map_as_completed(submit, fn, jobs, window, timeout=None):
+    """Runs submit(fn, *args) for each (key, args) in jobs, keeping at most window in flight.
+
+    Yields (key, future) in completion order. jobs is consumed lazily, so
+    rows can be fetched from the database as the window advances. A future
+    still running timeout seconds after it was submitted is cancelled if it
+    has not started and yielded unfinished, so its result() raises TimeoutError
+    and a hung render cannot stall the rest of the export.
+    """
+    jobs = iter(jobs)
+    in_flight = {} # future -> (key, deadline)
+
+    def fill():
+        while len(in_flight) < window:
+            job = next(jobs, None)
+            if job is None:
+                return
+            key, args = job
+            future = submit(fn, *args)
+            in_flight[future] = (key, time.monotonic() + timeout if timeout else None)
+
+    try:
+        fill()
+        while in_flight:
+            deadlines = [deadline for _, deadline in in_flight.values() if deadline is not None]
+            wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(in_flight, timeout=wait_for, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            expired = [future for future, (_, deadline) in in_flight.items()
+                       if future not in done and deadline is not None and deadline <= now]
+            for future in [*done, *expired]:
+                if future in expired:
+                    future.cancel()
+                yield in_flight.pop(future)[0], future
+            fill()
+    finally:
+        # Client went away mid-download: drop renders that have not started
+        for future in in_flight:
+            future.cancel()
@@ -0,0 +1,166 @@
+"""Shared process pool for CPU-bound PDF rendering.
+
+fpdf2 layout is pure Python and holds the GIL, so rendering on a web thread
+stalls every other request in that worker, including live transcription
+WebSockets. Single downloads and bulk exports submit renders here instead;
+the web thread only waits on a future.
+
+Admission is bounded: at most workers + max_pending renders may be
+outstanding. Callers that cannot wait get PdfRenderPoolFull (shown as 503),
+and a render that takes longer than its timeout raises PdfRenderTimeout
+(shown as 504). A timed-out render still runs to completion in its worker and
+keeps its slot until then, so the bound stays honest.
+"""
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PdfRenderPoolFull(RuntimeError):
+    """Raised when too many renders are already queued or running."""
+
+
+class PdfRenderTimeout(RuntimeError):
+    """Raised when a render does not finish within the timeout."""
+
+
+def _timed_call(fn, args):
+    """Runs in the worker process; returns (result, start wall time, render seconds)."""
+    started_at = time.time()
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, started_at, time.perf_counter() - start
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 4)
+
+
+class PdfRenderPool:
+    def __init__(self, workers=2, max_pending=16, timeout=30, latency_window=200):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._outstanding = 0
+        self._executor = None # Created on first submit
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0, "pool_restarts": 0}
+        self._samples = deque(maxlen=latency_window) # (queue_wait, render_seconds)
+
+    def submit(self, fn, *args, wait=0):
+        """Schedules fn(*args) (picklable, module-level) and returns a Future of its result.
+
+        wait: seconds to wait for a free slot before raising PdfRenderPoolFull.
+        """
+        acquired = self._slots.acquire(timeout=wait) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise PdfRenderPoolFull(f"{self.workers + self.max_pending} PDF renders already outstanding")
+        submitted_at = time.time()
+        try:
+            inner = self._submit_to_executor(_timed_call, fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._outstanding += 1
+
+        # The caller's future resolves to the bare result; timing is recorded on the side
+        outer = _RenderFuture(inner)
+        inner.add_done_callback(lambda future: self._on_done(future, outer, submitted_at))
+        return outer
+
+    def render(self, fn, *args, timeout=None):
+        """Renders without waiting for a slot; raises PdfRenderPoolFull or PdfRenderTimeout."""
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel() # Only succeeds if it has not started yet
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise PdfRenderTimeout(f"PDF render did not finish within {timeout or self.timeout}s")
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(s[0] for s in self._samples)
+            renders = sorted(s[1] for s in self._samples)
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "outstanding": self._outstanding,
+                "counters": dict(self._counters),
+                "latency_seconds": {
+                    "samples": len(self._samples),
+                    "queue_wait_p50": _percentile(waits, 0.5),
+                    "queue_wait_p95": _percentile(waits, 0.95),
+                    "render_p50": _percentile(renders, 0.5),
+                    "render_p95": _percentile(renders, 0.95),
+                    "render_max": _percentile(renders, 1.0),
+                },
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_to_executor(self, *call):
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: a fork would inherit the web process's gRPC
+                # channels and background threads in an undefined state
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            executor = self._executor
+        try:
+            return executor.submit(*call)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool once
+            logging.error("PDF render pool is broken; starting a new one")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                    self._counters["pool_restarts"] += 1
+                executor = self._executor
+            return executor.submit(*call)
+
+    def _on_done(self, inner, outer, submitted_at):
+        self._slots.release()
+        with self._lock:
+            self._outstanding -= 1
+        if inner.cancelled():
+            Future.cancel(outer)
+            return
+        error = inner.exception()
+        if error is not None:
+            with self._lock:
+                self._counters["failed"] += 1
+            outer.set_exception(error)
+            return
+        result, started_at, render_seconds = inner.result()
+        with self._lock:
+            self._counters["completed"] += 1
+            self._samples.append((max(0.0, started_at - submitted_at), render_seconds))
+        outer.set_result(result)
+
+
+class _RenderFuture(Future):
+    """Future handed to callers: resolves to the bare render result; cancel() reaches the queued task."""
+
+    def __init__(self, inner):
+        super().__init__()
+        self._inner = inner
+
+    def cancel(self):
+        return self._inner.cancel() and super().cancel()
@@ -0,0 +1,67 @@
+"""Server-side prepared statements for registered hot queries.
+
+Login, the patient dashboard and symptom logging run the same few statements
+over and over. Sent as plain text, each one is parsed and planned by MySQL
+on every call. A registered query is instead prepared once per pooled
+connection, and the prepared cursor is kept with that connection. Later calls
+send only the statement id and the parameters, in the binary protocol.
+
+mysql-connector only reuses a prepared statement when the same string object
+is executed again, so callers execute the canonical object returned by
+canonical(), not their own copy of the text. The pool must be created with
+pool_reset_session=False, because a session reset deallocates every prepared
+statement. When a connection is reopened its server connection id changes,
+and its cached cursors are dropped.
+"""
+import weakref
+import threading
+
+
+class PreparedStatements:
+    def __init__(self):
+        self._registered = {} # sql text -> the one string object executed for it
+        self._by_connection = weakref.WeakKeyDictionary() # raw connection -> (server connection id, {key: cursor})
+        self._lock = threading.Lock()
+        self._counters = {"prepared": 0, "reused": 0, "invalidated": 0}
+
+    def register(self, sql):
+        """Marks sql as a hot query; returns the canonical string (use it as the query constant)."""
+        with self._lock:
+            return self._registered.setdefault(sql, sql)
+
+    def canonical(self, sql):
+        """The registered string equal to sql, or None if sql is not a hot query."""
+        return self._registered.get(sql)
+
+    def cursor(self, conn, sql, dictionary=True):
+        """Returns the prepared cursor for canonical sql on conn, creating it on first use.
+
+        The cursor belongs to the cache: read all of its rows and never close it.
+        """
+        raw = getattr(conn, "_cnx", conn) # PooledMySQLConnection wraps the connection that owns the statements
+        key = (sql, dictionary)
+        with self._lock:
+            connection_id, cursors = self._by_connection.get(raw, (None, None))
+            if cursors is None or connection_id != raw.connection_id:
+                if cursors is not None:
+                    self._counters["invalidated"] += 1
+                cursors = {}
+                self._by_connection[raw] = (raw.connection_id, cursors)
+            cursor = cursors.get(key)
+            if cursor is None:
+                cursor = cursors[key] = raw.cursor(prepared=True, dictionary=dictionary)
+                self._counters["prepared"] += 1
+            else:
+                self._counters["reused"] += 1
+        return cursor
+
+    def forget(self, conn):
+        """Drops conn's cached statements, e.g. after an error left one in an unknown state."""
+        raw = getattr(conn, "_cnx", conn)
+        with self._lock:
+            if self._by_connection.pop(raw, None) is not None:
+                self._counters["invalidated"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"registered": len(self._registered), "connections": len(self._by_connection), **self._counters}
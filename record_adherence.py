@@ -0,0 +1,124 @@
+"""Records every patient's medication adherence for the past window in MedicationAdherence.
+
+Run nightly (e.g. from cron) after applying migrations/005_medication_adherence.sql.
+Patients with a prescription in the lookback period or a dose logged in the
+window are processed --batch-size at a time. For each batch, prescriptions
+(including archived consultations when the lookback reaches them) and the
+window's MedicationLog rows are read in two queries. adherence.py then
+computes the whole batch in one pass, and the batch's rows for the night are
+replaced in one transaction, so re-running the same night is safe.
+
+Usage:
+    python record_adherence.py [--days 30] [--batch-size 2000] [--dry-run]
+"""
+import os
+import sys
+import time
+import datetime
+import argparse
+from collections import defaultdict
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from adherence import ADHERENCE_WINDOW_DAYS, compute_adherence, lookback_start, prescription_courses
+from archive import read_watermarks, tables_for
+
+PATIENTS_QUERY = """
+    SELECT patient_id FROM Consultation
+    WHERE consultation_date >= %s AND prescription_details IS NOT NULL AND prescription_details != '[]'
+    UNION
+    SELECT patient_id FROM MedicationLog WHERE taken_at >= %s AND taken_at < %s
+    ORDER BY patient_id
+"""
+PRESCRIPTIONS_QUERY = """
+    SELECT patient_id, consultation_date, prescription_details FROM {table}
+    WHERE patient_id IN ({placeholders}) AND consultation_date >= %s
+      AND prescription_details IS NOT NULL AND prescription_details != '[]'
+"""
+LOGS_QUERY = """
+    SELECT patient_id, medication_name, taken_at FROM MedicationLog
+    WHERE patient_id IN ({placeholders}) AND taken_at >= %s AND taken_at < %s
+"""
+DELETE_QUERY = "DELETE FROM MedicationAdherence WHERE computed_for = %s AND patient_id IN ({placeholders})"
+INSERT_QUERY = """
+    INSERT INTO MedicationAdherence (computed_for, patient_id, medicine_name, window_days, doses_expected,
+                                     doses_on_schedule, doses_taken, missed_days, adherence_pct)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def record_batch(conn, patient_ids, today, days, watermarks, dry_run=False):
+    """Computes and stores adherence for patient_ids; returns (patients with results, rows written)."""
+    placeholders = ", ".join(["%s"] * len(patient_ids))
+    since = lookback_start(today, days)
+    window = (datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time()),
+              datetime.datetime.combine(today, datetime.time())) # Tonight's snapshot covers full days only
+    cursor = conn.cursor(dictionary=True)
+    consultations = defaultdict(list)
+    for table in tables_for(watermarks, "Consultation", since):
+        cursor.execute(PRESCRIPTIONS_QUERY.format(table=table, placeholders=placeholders), (*patient_ids, since))
+        for row in cursor.fetchall():
+            consultations[row["patient_id"]].append(row)
+    cursor.execute(LOGS_QUERY.format(placeholders=placeholders), (*patient_ids, *window))
+    logs = [(row["patient_id"], row["medication_name"], row["taken_at"]) for row in cursor.fetchall()]
+    cursor.close()
+
+    courses = {patient_id: prescription_courses(rows) for patient_id, rows in consultations.items()}
+    results = compute_adherence(courses, logs, today, days)
+    rows = [(today, patient_id, med["name"][:255], days, med["expected"], med["on_schedule"], med["taken"],
+             med["missed_days"], med["adherence_pct"])
+            for patient_id, summary in results.items() for med in summary["medicines"]
+            if med["expected"] or med["taken"]] # Courses starting today have nothing to record yet
+    if dry_run:
+        return len(results), len(rows)
+    cursor = conn.cursor()
+    cursor.execute(DELETE_QUERY.format(placeholders=placeholders), (today, *patient_ids))
+    if rows:
+        cursor.executemany(INSERT_QUERY, rows)
+    conn.commit()
+    cursor.close()
+    return len(results), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=int(os.getenv("ADHERENCE_WINDOW_DAYS", str(ADHERENCE_WINDOW_DAYS))))
+    parser.add_argument("--batch-size", type=int, default=2000, help="Patients per batch")
+    parser.add_argument("--dry-run", action="store_true", help="Compute without writing MedicationAdherence")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+
+    load_dotenv()
+    today = datetime.date.today()
+    conn = mysql.connector.connect(host=os.getenv("DB_HOST"), user=os.getenv("DB_USER"),
+                                   password=os.getenv("DB_PASSWORD"), database=os.getenv("DB_NAME"))
+    start = time.perf_counter()
+    patients = rows = 0
+    try:
+        watermarks = read_watermarks(conn)
+        cursor = conn.cursor()
+        cursor.execute(PATIENTS_QUERY, (lookback_start(today, args.days), today - datetime.timedelta(days=args.days), today))
+        patient_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        for offset in range(0, len(patient_ids), args.batch_size):
+            batch = patient_ids[offset:offset + args.batch_size]
+            done, written = record_batch(conn, batch, today, args.days, watermarks, args.dry_run)
+            patients += done
+            rows += written
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Adherence run stopped: {err}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    verb = "would write" if args.dry_run else "wrote"
+    print(f"{patients} patients, {verb} {rows} rows for {today:%Y-%m-%d} in {elapsed:.1f}s "
+          f"({patients / elapsed if elapsed else 0:,.0f} patients/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Runs summary job workers outside the web processes.
+
+Apply migrations/006_summary_jobs.sql first. Jobs are queued in MySQL by any
+web process (POST /summary_jobs); this script claims and runs them with
+--workers threads until interrupted. Run as many copies, on as many hosts, as
+the summarization load needs, and set SUMMARY_WORKERS=0 for the web processes
+so their threads only serve requests. A job left running by a stopped worker
+is failed after SUMMARY_JOB_STALE_SECONDS.
+
+Usage:
+    python summary_worker.py [--workers 2]
+"""
+import os
+import sys
+import time
+import argparse
+
+# Importing app starts SUMMARY_WORKERS threads of its own; this script starts its own count instead
+os.environ["SUMMARY_WORKERS"] = "0"
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="Jobs run at the same time by this process")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    app.summary_jobs.start_workers(args.workers)
+    print(f"Running {args.workers} summary workers; Ctrl+C stops after the current jobs")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping summary workers...")
+        app.summary_jobs.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
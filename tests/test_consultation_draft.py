@@ -0,0 +1,18 @@
+"""The draft response schema must pass the google-generativeai SDK's own conversion."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+from google.generativeai.types import generation_types
+
+from consultation_draft import DRAFT_RESPONSE_SCHEMA
+
+
+def test_draft_generation_config_builds_through_sdk():
+    # Same construction as app.DRAFT_GENERATION_CONFIG; the SDK validates the schema on conversion
+    config = genai.GenerationConfig(response_mime_type="application/json", response_schema=DRAFT_RESPONSE_SCHEMA)
+    converted = generation_types.to_generation_config_dict(config)
+    assert converted["response_mime_type"] == "application/json"
+    assert set(converted["response_schema"].properties) == set(DRAFT_RESPONSE_SCHEMA["properties"])
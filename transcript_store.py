@@ -0,0 +1,79 @@
+"""Raw consultation transcripts and the original Gemini output, kept out of the hot Consultation row.
+
+Transcripts run to many kilobytes and are only read when a doctor asks for
+them, yet every Consultation scan used to carry them. They now live in the
+ConsultationTranscript side table (migrations/002_consultation_transcript.sql),
+compressed with zstd when the optional `zstandard` package is installed and
+zlib otherwise. The codec is stored per row, so both kinds can be read back
+side by side.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError: # Optional; zlib is always available
+    zstandard = None
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10 # Written once, read rarely: favour ratio over speed
+
+INSERT_TRANSCRIPT_QUERY = """
+    INSERT INTO ConsultationTranscript (consultation_id, codec, raw_transcript, original_gemini_text, raw_transcript_chars)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE codec = VALUES(codec), raw_transcript = VALUES(raw_transcript),
+                            original_gemini_text = VALUES(original_gemini_text),
+                            raw_transcript_chars = VALUES(raw_transcript_chars)
+"""
+TRANSCRIPT_QUERY = """
+    SELECT consultation_id, codec, raw_transcript, original_gemini_text, raw_transcript_chars, created_at
+    FROM ConsultationTranscript
+    WHERE consultation_id = %s
+"""
+
+
+def compress_text(text, codec=DEFAULT_CODEC):
+    """Returns text compressed with codec, or None for empty text."""
+    if not text:
+        return None
+    data = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd transcripts need the zstandard package")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f"Unknown transcript codec '{codec}'")
+
+
+def decompress_text(data, codec):
+    """Inverse of compress_text; None or empty data gives ''."""
+    if not data:
+        return ""
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This transcript is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(bytes(data)).decode("utf-8")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(bytes(data)).decode("utf-8")
+    raise ValueError(f"Unknown transcript codec '{codec}'")
+
+
+def transcript_params(consultation_id, raw_transcript, original_gemini_text="", codec=DEFAULT_CODEC):
+    """Parameters for INSERT_TRANSCRIPT_QUERY."""
+    return (consultation_id, codec, compress_text(raw_transcript, codec),
+            compress_text(original_gemini_text, codec), len(raw_transcript or ""))
+
+
+def decode_transcript_row(row):
+    """Turns a TRANSCRIPT_QUERY row into plain text fields."""
+    return {
+        "consultation_id": row["consultation_id"],
+        "raw_transcript": decompress_text(row["raw_transcript"], row["codec"]),
+        "original_gemini_text": decompress_text(row["original_gemini_text"], row["codec"]),
+        "raw_transcript_chars": row["raw_transcript_chars"],
+        "codec": row["codec"],
+        "created_at": row["created_at"],
+    }
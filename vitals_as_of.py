@@ -0,0 +1,61 @@
+"""Vitals recorded for a visit, resolved for many consultations in one query.
+
+A consultation's vitals are the patient's latest check-in at or before the
+consultation time, and no older than max_age (older readings belong to an
+earlier visit). Given (patient_id, as_of) pairs, the lookup builds a derived
+table of the pairs (UNION ALL of literal rows), joins Vitals on the
+(patient_id, checkin_time) index and keeps the newest match per pair with
+ROW_NUMBER(). That is one query per batch of pairs instead of one per
+consultation (requires MySQL 8.0+ for window functions; see
+migrations/001_vitals_patient_checkin_index.sql for the index).
+"""
+import datetime
+
+VITALS_MAX_AGE = datetime.timedelta(hours=24)
+VITALS_BATCH_SIZE = 500 # Pairs per query; keeps the statement and its parameter list bounded
+
+
+def build_vitals_as_of_query(pairs, max_age=VITALS_MAX_AGE, table="Vitals"):
+    """Returns (sql, params) selecting one row of table per (patient_id, as_of) pair, tagged with request_index."""
+    selects = []
+    params = []
+    for index, (patient_id, as_of) in enumerate(pairs):
+        if index == 0: # Column names come from the first row of a UNION
+            selects.append("SELECT %s AS request_index, %s AS patient_id, CAST(%s AS DATETIME) AS as_of")
+        else:
+            selects.append("SELECT %s, %s, CAST(%s AS DATETIME)")
+        params.extend((index, patient_id, as_of))
+    sql = f"""
+        SELECT ranked.* FROM (
+            SELECT r.request_index, v.*,
+                   ROW_NUMBER() OVER (PARTITION BY r.request_index ORDER BY v.checkin_time DESC, v.id DESC) AS vitals_rank
+            FROM ({" UNION ALL ".join(selects)}) r
+            JOIN {table} v ON v.patient_id = r.patient_id
+                         AND v.checkin_time <= r.as_of
+                         AND v.checkin_time > r.as_of - INTERVAL %s SECOND
+        ) ranked
+        WHERE ranked.vitals_rank = 1
+    """
+    params.append(int(max_age.total_seconds()))
+    return sql, tuple(params)
+
+
+def vitals_as_of(run_query, pairs, max_age=VITALS_MAX_AGE, batch_size=VITALS_BATCH_SIZE, tables=("Vitals",)):
+    """Returns a list parallel to pairs holding each visit's Vitals row, or {} if none was recorded.
+
+    run_query(sql, params) must return a list of dict rows (e.g. app.fetch_all).
+    tables: Vitals and, for visits near the archive watermark, VitalsArchive
+    (archive.tables_for); the newest match across them wins.
+    """
+    pairs = list(pairs)
+    results = [{} for _ in pairs]
+    for table in tables:
+        for start in range(0, len(pairs), batch_size):
+            sql, params = build_vitals_as_of_query(pairs[start:start + batch_size], max_age, table)
+            for row in run_query(sql, params):
+                index = start + int(row.pop('request_index'))
+                row.pop('vitals_rank', None)
+                current = results[index]
+                if not current or (row['checkin_time'], row['id']) > (current['checkin_time'], current['id']):
+                    results[index] = row
+    return results